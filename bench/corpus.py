@@ -0,0 +1,206 @@
+# Synthetic claim and policy corpora seeded from the sample documents in the repo root
+
+import glob
+import html
+import io
+import os
+import random
+import re
+import zipfile
+from datetime import date, timedelta
+
+from src.config import PROJECT_ROOT
+
+FIRST_NAMES = ["Jane", "Robert", "Maria", "James", "Aisha", "Wei", "Olga", "Carlos", "Priya", "Samuel",
+               "Fatima", "Liam", "Noah", "Emma", "Hiroshi", "Ngozi", "Lucas", "Sofia", "Mateo", "Chloe"]
+LAST_NAMES = ["Smith", "Lee", "Gonzalez", "Nguyen", "Okafor", "Kowalski", "Haddad", "Tanaka", "Patel",
+              "Johnson", "Schmidt", "Rossi", "Silva", "Kim", "Dubois", "Novak", "Cohen", "Moreau"]
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+_POLICY_ID = re.compile(r"\b([A-Z]{2})-(\d{3})\b")
+
+
+def load_samples(root: str = PROJECT_ROOT):
+    """
+    Return (claims, policies): lists of (file name, text) for the sample files.
+    """
+    def read(pattern):
+        documents = []
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            with open(path, encoding="utf-8") as f:
+                documents.append((os.path.basename(path), f.read()))
+        return documents
+
+    return read("claim_*.txt"), read("policy_*.txt")
+
+
+def _description(text: str) -> str:
+    return text.split("Incident Description:", 1)[-1].strip()
+
+
+def _policy_kind(name: str) -> str:
+    # policy_WD-100_water_damage.txt -> water_damage
+    return name[:-4].split("_", 2)[-1]
+
+
+def generate_policies(count: int, seed: int = 0, samples=None) -> list:
+    """
+    Generate count (key name, text) policies. Each one re-labels a sample policy
+    with a fresh ID and mixes in sentences from the other samples so the
+    vocabulary (and the retrieval work) grows with the corpus.
+    """
+    rng = random.Random(seed)
+    policies = samples if samples is not None else load_samples()[1]
+    sentences = [s for _, text in policies for s in _SENTENCE_SPLIT.split(text) if s and ":" not in s[:20]]
+
+    generated = []
+    for i in range(count):
+        name, text = policies[i % len(policies)]
+        match = _POLICY_ID.search(text)
+        prefix = match.group(1) if match else "GP"
+        policy_id = f"{prefix}-{100 + i}"
+        body = _POLICY_ID.sub(policy_id, text, count=1)
+        extra = " ".join(rng.sample(sentences, k=min(2, len(sentences))))
+        body = f"{body}\n\nAdditional terms: {extra}"
+        generated.append((f"policy_{policy_id}_{_policy_kind(name)}.txt", body))
+    return generated
+
+
+def generate_claims(count: int, policy_ids=None, seed: int = 0, samples=None, model_rate: float = 0.0) -> list:
+    """
+    Generate count (key name, text) claims in the sample intake layout, with
+    randomised claimant, policy number, date, amount and a shuffled description.
+    A model_rate share get an ambiguous US-style date (e.g. 03/04/2025), which
+    the fast path hands to the extraction model.
+    """
+    rng = random.Random(seed)
+    claims = samples if samples is not None else load_samples()[0]
+    descriptions = [_description(text) for _, text in claims]
+    if not policy_ids:
+        policy_ids = [m.group(0) for _, text in claims for m in [_POLICY_ID.search(text)] if m]
+
+    generated = []
+    for i in range(count):
+        incident = date(2025, 1, 1) + timedelta(days=rng.randrange(365))
+        amount = rng.randrange(25000, 2500000) / 100
+        description_sentences = _SENTENCE_SPLIT.split(descriptions[i % len(descriptions)])
+        rng.shuffle(description_sentences)
+        incident_text = incident.isoformat()
+        if model_rate and rng.random() < model_rate:
+            month = rng.randrange(1, 13)
+            day = rng.choice([d for d in range(1, 13) if d != month])
+            incident = date(2025, month, day)
+            incident_text = incident.strftime("%m/%d/%Y")
+        text = (
+            f"Claimant: {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}\n"
+            f"Policy Number: {rng.choice(policy_ids)}\n"
+            f"Incident Date: {incident_text}\n"
+            f"Claim Amount: ${amount:,.2f}\n"
+            f"\n"
+            f"Incident Description:\n"
+            f"{' '.join(description_sentences)}"
+        )
+        generated.append((f"claim_synthetic_{incident.isoformat()}_{i:06d}.txt", text))
+    return generated
+
+
+def render_html(text: str) -> bytes:
+    """
+    The claim as an HTML page, one <p> per line and <br> for blank lines.
+    """
+    paragraphs = "".join(f"<p>{html.escape(line)}</p>\n" if line.strip() else "<br>\n" for line in text.split("\n"))
+    return (f"<!DOCTYPE html>\n<html><head><title>Claim</title><style>p {{ margin: 0 }}</style></head>\n"
+            f"<body>\n{paragraphs}</body></html>\n").encode("utf-8")
+
+
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+
+
+def render_docx(text: str) -> bytes:
+    """
+    The claim as a minimal DOCX file, one paragraph per line.
+    """
+    paragraphs = "".join(
+        f'<w:p><w:r><w:t xml:space="preserve">{html.escape(line, quote=False)}</w:t></w:r></w:p>'
+        for line in text.split("\n")
+    )
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f'<w:body>{paragraphs}</w:body></w:document>')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _DOCX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _DOCX_RELS)
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+# Claim file formats for populate_bucket: extension -> (render, Content-Type)
+CLAIM_FORMATS = {
+    "txt": (lambda text: text.encode("utf-8"), "text/plain"),
+    "html": (render_html, "text/html"),
+    "docx": (render_docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+}
+
+
+def populate_bucket(fake_s3, bucket: str, claims_prefix: str, policies_prefix: str,
+                    n_claims: int, n_policies: int, seed: int = 0, model_rate: float = 0.0,
+                    formats=("txt",)) -> list:
+    """
+    Fill a FakeS3 bucket with synthetic policies and claims; return the claim
+    keys. Claims cycle through formats (see CLAIM_FORMATS).
+    """
+    policies = generate_policies(n_policies, seed=seed)
+    for name, text in policies:
+        fake_s3.put(bucket, f"{policies_prefix}{name}", text.encode("utf-8"), "text/plain")
+
+    policy_ids = [name.split("_")[1] for name, _ in policies]
+    keys = []
+    claims = generate_claims(n_claims, policy_ids=policy_ids, seed=seed, model_rate=model_rate)
+    for i, (name, text) in enumerate(claims):
+        extension = formats[i % len(formats)]
+        render, content_type = CLAIM_FORMATS[extension]
+        key = f"{claims_prefix}{name[:-len('.txt')]}.{extension}"
+        fake_s3.put(bucket, key, render(text), content_type)
+        keys.append(key)
+    return keys
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write a synthetic claim/policy corpus to a directory.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--claims", type=int, default=1000)
+    parser.add_argument("--policies", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    policies = generate_policies(args.policies, seed=args.seed)
+    claims = generate_claims(args.claims, policy_ids=[name.split("_")[1] for name, _ in policies], seed=args.seed)
+    for sub, documents in (("policies", policies), ("claims", claims)):
+        directory = os.path.join(args.out_dir, sub)
+        os.makedirs(directory, exist_ok=True)
+        for name, text in documents:
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                f.write(text)
+    print(f"Wrote {len(claims)} claims and {len(policies)} policies to {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
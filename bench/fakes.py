@@ -0,0 +1,421 @@
+# In-memory stand-ins for S3 and the Bedrock runtime, for offline benchmarks
+
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+
+def _client_error(code: str, message: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+class FakeS3:
+    """
+    Thread-safe in-memory bucket store implementing the subset of the S3
+    client API the pipeline and the web app use.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}  # (bucket, key) -> (body, etag, last_modified, content_type)
+        self.content_encodings = {}  # (bucket, key) -> ContentEncoding, for objects stored with one
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation: str) -> None:
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def put(self, bucket: str, key: str, body: bytes, content_type: str = "binary/octet-stream") -> str:
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        with self._lock:
+            self.objects[(bucket, key)] = (body, etag, datetime.now(timezone.utc), content_type)
+        return etag
+
+    def _get(self, bucket: str, key: str, operation: str):
+        with self._lock:
+            entry = self.objects.get((bucket, key))
+        if entry is None:
+            raise _client_error("NoSuchKey", "The specified key does not exist.", operation)
+        return entry
+
+    # --- client API -------------------------------------------------------
+
+    def put_object(self, Bucket, Key, Body=b"", ContentType="binary/octet-stream", ContentEncoding=None, **kwargs):
+        self._call("PutObject")
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        etag = self.put(Bucket, Key, Body, ContentType)
+        with self._lock:
+            if ContentEncoding:
+                self.content_encodings[(Bucket, Key)] = ContentEncoding
+            else:
+                self.content_encodings.pop((Bucket, Key), None)
+        return {"ETag": etag}
+
+    def _encoding(self, bucket: str, key: str) -> dict:
+        with self._lock:
+            encoding = self.content_encodings.get((bucket, key))
+        return {"ContentEncoding": encoding} if encoding else {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call("GetObject")
+        body, etag, last_modified, content_type = self._get(Bucket, Key, "GetObject")
+        return {
+            "Body": io.BytesIO(body),
+            "ETag": etag,
+            "ContentLength": len(body),
+            "ContentType": content_type,
+            "LastModified": last_modified,
+            **self._encoding(Bucket, Key),
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call("HeadObject")
+        body, etag, last_modified, content_type = self._get(Bucket, Key, "HeadObject")
+        return {"ETag": etag, "ContentLength": len(body), "ContentType": content_type, "LastModified": last_modified,
+                **self._encoding(Bucket, Key)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._call("DeleteObject")
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+            self.content_encodings.pop((Bucket, Key), None)
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, **kwargs):
+        with open(Filename, "rb") as f:
+            self.upload_fileobj(f, Bucket, Key, ExtraArgs=ExtraArgs)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        content_type = (ExtraArgs or {}).get("ContentType", "binary/octet-stream")
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read(), ContentType=content_type)
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = Params or {}
+        return f"https://{params.get('Bucket')}.s3.local/{params.get('Key')}?expires={ExpiresIn}"
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600, **kwargs):
+        fields = dict(Fields or {}, key=Key, policy="local", signature="local")
+        return {"url": f"https://{Bucket}.s3.local/", "fields": fields}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, StartAfter=None, **kwargs):
+        self._call("ListObjectsV2")
+        with self._lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+            start_after = ContinuationToken or StartAfter
+            if start_after:
+                keys = [key for key in keys if key > start_after]
+            page = keys[:MaxKeys]
+            contents = []
+            for key in page:
+                body, etag, last_modified, content_type = self.objects[(Bucket, key)]
+                contents.append({"Key": key, "Size": len(body), "ETag": etag, "LastModified": last_modified})
+        response = {"KeyCount": len(page), "IsTruncated": len(keys) > MaxKeys, "MaxKeys": MaxKeys}
+        if contents:
+            response["Contents"] = contents
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_objects_v2":
+            raise NotImplementedError(operation_name)
+        client = self
+
+        class _Paginator:
+            def paginate(self, **kwargs):
+                token = None
+                while True:
+                    params = dict(kwargs)
+                    if token:
+                        params["ContinuationToken"] = token
+                    page = client.list_objects_v2(**params)
+                    yield page
+                    token = page.get("NextContinuationToken")
+                    if not token:
+                        return
+
+        return _Paginator()
+
+
+_FIELD_PATTERNS = {
+    "claimant_name": re.compile(r"^Claimant:\s*(.+)$", re.MULTILINE),
+    "policy_number": re.compile(r"^Policy Number:\s*(.+)$", re.MULTILINE),
+    "incident_date": re.compile(r"^Incident Date:\s*(.+)$", re.MULTILINE),
+    "claim_amount": re.compile(r"^Claim Amount:\s*(.+)$", re.MULTILINE),
+}
+_DESCRIPTION_PATTERN = re.compile(r"Incident Description:\s*(.+?)(?:\n\s*\n|$)", re.DOTALL)
+
+
+def _prompt_text(request: dict) -> str:
+    if "messages" in request:
+        parts = []
+        if isinstance(request.get("system"), str):
+            parts.append(request["system"])
+        elif isinstance(request.get("system"), list):
+            parts.extend(block.get("text", "") for block in request["system"])
+        for message in request["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                parts.append(content)
+            else:
+                parts.extend(block.get("text", "") for block in content if block.get("type") == "text")
+        return "\n".join(parts)
+    return request.get("prompt") or request.get("inputText") or ""
+
+
+class FakeBedrockRuntime:
+    """
+    Stand-in for the bedrock-runtime client.
+
+    Latency is base_latency + output_tokens / tokens_per_second. Throttling is
+    simulated both randomly (throttle_rate) and when more than max_concurrency
+    calls are in flight. Extraction prompts are answered by parsing the claim
+    headers out of the prompt; anything else gets a summary of summary_tokens words.
+
+    Models listed in weak_models garble claim_amount in a weak_error_rate
+    share of extraction answers (chosen by prompt hash, so the same prompt
+    always gets the same answer) and run at weak_speedup times the token rate.
+
+    Prompt caching follows Bedrock's rules: each cache_control checkpoint of
+    at least cache_min_tokens caches the prefix up to it (tools, system,
+    earlier blocks) for cache_ttl seconds, refreshed on every hit. The
+    longest live prefix is reported as cache_read_input_tokens, the rest up
+    to the last checkpoint as cache_creation_input_tokens, and input_tokens
+    is what remains. With input_tokens_per_second set, input adds prefill
+    latency, with cached tokens read cache_read_speedup times faster.
+    """
+
+    def __init__(self, base_latency: float = 0.05, tokens_per_second: float = 200.0,
+                 throttle_rate: float = 0.0, max_concurrency: int = None,
+                 summary_tokens: int = 120, seed: int = 0,
+                 weak_models=(), weak_error_rate: float = 0.0, weak_speedup: float = 1.0,
+                 input_tokens_per_second: float = None, cache_min_tokens: int = 1024, cache_ttl: float = 300.0,
+                 cache_read_speedup: float = 10.0):
+        self.base_latency = base_latency
+        self.tokens_per_second = tokens_per_second
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.summary_tokens = summary_tokens
+        self.weak_models = set(weak_models)
+        self.weak_error_rate = weak_error_rate
+        self.weak_speedup = weak_speedup
+        self.input_tokens_per_second = input_tokens_per_second
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_ttl = cache_ttl
+        self.cache_read_speedup = cache_read_speedup
+        self.calls_by_model = {}
+        self.calls = 0
+        self.throttled = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cache_write_input_tokens = 0
+        self._prompt_cache = {}  # prefix hash -> expiry (monotonic)
+        self._in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        # Roughly four characters per token, like the Claude tokenizer on English prose
+        return max(1, len(text) // 4)
+
+    def _admit(self, operation: str, model_id: str = None) -> None:
+        with self._lock:
+            self.calls += 1
+            self.calls_by_model[model_id] = self.calls_by_model.get(model_id, 0) + 1
+            throttled = self._random.random() < self.throttle_rate
+            if self.max_concurrency is not None and self._in_flight >= self.max_concurrency:
+                throttled = True
+            if throttled:
+                self.throttled += 1
+                raise _client_error("ThrottlingException", "Too many requests, please wait before trying again.",
+                                    operation)
+            self._in_flight += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _weak_miss(self, prompt: str, model_id: str) -> bool:
+        if model_id not in self.weak_models or not self.weak_error_rate:
+            return False
+        bucket = int(hashlib.sha256(f"{model_id}\n{prompt}".encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return bucket < self.weak_error_rate
+
+    def _answer(self, prompt: str, model_id: str = None) -> str:
+        if "Extract the following information" in prompt:
+            record = {}
+            for field, pattern in _FIELD_PATTERNS.items():
+                match = pattern.search(prompt)
+                record[field] = match.group(1).strip() if match else None
+            match = _DESCRIPTION_PATTERN.search(prompt)
+            record["incident_description"] = " ".join(match.group(1).split()) if match else None
+            if self._weak_miss(prompt, model_id):
+                record["claim_amount"] = "about what the invoice says"
+            return json.dumps(record, indent=2)
+        words = ("The claim appears to fall within the cited coverage subject to the deductible "
+                 "and emergency repair limits; request invoices and photos before approval.").split()
+        return " ".join(words[i % len(words)] for i in range(self.summary_tokens))
+
+    def _checkpoints(self, request: dict, model_id: str) -> list:
+        """
+        (prefix hash, prefix tokens) for each cache_control checkpoint, in order.
+        """
+        if "messages" not in request:
+            return []
+        blocks = list(request.get("system") or []) if isinstance(request.get("system"), list) else []
+        for message in request["messages"]:
+            content = message["content"]
+            blocks.extend(content if isinstance(content, list) else [{"type": "text", "text": content}])
+        prefix = hashlib.sha256(json.dumps([model_id, request.get("tools")], sort_keys=True).encode("utf-8"))
+        texts = []
+        checkpoints = []
+        for block in blocks:
+            prefix.update(json.dumps({k: v for k, v in block.items() if k != "cache_control"},
+                                     sort_keys=True).encode("utf-8"))
+            if block.get("type") == "text":
+                texts.append(block.get("text", ""))
+            if block.get("cache_control"):
+                checkpoints.append((prefix.copy().hexdigest(), self.count_tokens("\n".join(texts))))
+        return checkpoints
+
+    def _cache_usage(self, request: dict, model_id: str) -> tuple:
+        # (read, write) tokens; caller holds the lock
+        checkpoints = [(key, tokens) for key, tokens in self._checkpoints(request, model_id)
+                       if tokens >= self.cache_min_tokens]
+        if not checkpoints:
+            return 0, 0
+        now = time.monotonic()
+        read = 0
+        for key, tokens in reversed(checkpoints):
+            if self._prompt_cache.get(key, 0) > now:
+                read = tokens
+                break
+        for key, _ in checkpoints:
+            self._prompt_cache[key] = now + self.cache_ttl
+        return read, checkpoints[-1][1] - read
+
+    def _respond(self, request: dict, model_id: str = None):
+        prompt = _prompt_text(request)
+        text = self._answer(prompt, model_id)
+        total_input = self.count_tokens(prompt)
+        output_tokens = self.count_tokens(text)
+        with self._lock:
+            cache_read, cache_write = self._cache_usage(request, model_id)
+            input_tokens = total_input - cache_read - cache_write
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cache_read_input_tokens += cache_read
+            self.cache_write_input_tokens += cache_write
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        if self._checkpoints(request, model_id):
+            usage.update(cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_write)
+        return text, usage
+
+    def _prefill_seconds(self, usage: dict) -> float:
+        if not self.input_tokens_per_second:
+            return 0.0
+        uncached = usage["input_tokens"] + usage.get("cache_creation_input_tokens", 0)
+        cached = usage.get("cache_read_input_tokens", 0)
+        return (uncached + cached / self.cache_read_speedup) / self.input_tokens_per_second
+
+    def _format(self, request: dict, text: str, usage: dict) -> dict:
+        input_tokens = usage["input_tokens"]
+        output_tokens = usage["output_tokens"]
+        if "messages" in request and request.get("tools"):
+            # Forced tool call (structured-output mode): the record comes back as the tool input
+            return {
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "tool_use", "id": "toolu_local", "name": request["tools"][0]["name"],
+                             "input": json.loads(text)}],
+                "stop_reason": "tool_use",
+                "usage": usage,
+            }
+        if "messages" in request:
+            return {
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "usage": usage,
+            }
+        if "prompt" in request:
+            return {"completion": text, "stop_reason": "stop_sequence"}
+        return {"inputTextTokenCount": input_tokens,
+                "results": [{"outputText": text, "tokenCount": output_tokens}]}
+
+    def _headers(self, usage: dict) -> dict:
+        headers = {
+            "x-amzn-bedrock-input-token-count": str(usage["input_tokens"]),
+            "x-amzn-bedrock-output-token-count": str(usage["output_tokens"]),
+        }
+        if "cache_read_input_tokens" in usage:
+            headers["x-amzn-bedrock-cache-read-input-token-count"] = str(usage["cache_read_input_tokens"])
+            headers["x-amzn-bedrock-cache-write-input-token-count"] = str(usage["cache_creation_input_tokens"])
+        return {"ResponseMetadata": {"HTTPHeaders": headers}}
+
+    def _tokens_per_second(self, model_id: str) -> float:
+        return self.tokens_per_second * (self.weak_speedup if model_id in self.weak_models else 1.0)
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self._admit("InvokeModel", modelId)
+        try:
+            request = json.loads(body)
+            text, usage = self._respond(request, modelId)
+            time.sleep(self.base_latency + self._prefill_seconds(usage)
+                       + usage["output_tokens"] / self._tokens_per_second(modelId))
+            response = self._headers(usage)
+            response["body"] = io.BytesIO(json.dumps(self._format(request, text, usage)).encode())
+            return response
+        finally:
+            self._release()
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        self._admit("InvokeModelWithResponseStream", modelId)
+        request = json.loads(body)
+        text, usage = self._respond(request, modelId)
+        return {"body": self._stream(request, text, usage, self._tokens_per_second(modelId))}
+
+    def _stream(self, request, text, usage, tokens_per_second):
+        def chunk(payload):
+            return {"chunk": {"bytes": json.dumps(payload).encode()}}
+
+        try:
+            time.sleep(self.base_latency + self._prefill_seconds(usage))
+            words = text.split(" ")
+            delay = usage["output_tokens"] / tokens_per_second / max(1, len(words))
+            if "messages" in request:
+                start_usage = {k: v for k, v in usage.items() if k != "output_tokens"}
+                yield chunk({"type": "message_start", "message": {"usage": start_usage}})
+            for i, word in enumerate(words):
+                time.sleep(delay)
+                piece = word if i == 0 else " " + word
+                if "messages" in request:
+                    yield chunk({"type": "content_block_delta", "index": 0,
+                                 "delta": {"type": "text_delta", "text": piece}})
+                elif "prompt" in request:
+                    yield chunk({"completion": piece})
+                else:
+                    yield chunk({"outputText": piece})
+            invocation_metrics = {"inputTokenCount": usage["input_tokens"], "outputTokenCount": usage["output_tokens"]}
+            if "cache_read_input_tokens" in usage:
+                invocation_metrics["cacheReadInputTokenCount"] = usage["cache_read_input_tokens"]
+                invocation_metrics["cacheWriteInputTokenCount"] = usage["cache_creation_input_tokens"]
+            yield chunk({"type": "message_stop", "amazon-bedrock-invocationMetrics": invocation_metrics})
+        finally:
+            self._release()
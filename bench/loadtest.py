@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the web endpoints under the production server.
+
+Starts web/serve.py's pre-forked server against the in-memory S3 and
+Bedrock stand-ins (or targets --url), drives /upload, /process and
+/outputs at a fixed request rate each, and reports latency percentiles,
+status codes and error rates per endpoint, then the graceful shutdown time.
+
+    python -m bench.loadtest --rps 50 --duration 20 --workers 4 --threads 8
+    python -m bench.loadtest --endpoints outputs --rps 200
+    python -m bench.loadtest --url http://staging:8000   # /process needs the generated claims in its bucket
+
+Requests are sent open-loop on a fixed schedule and latency is measured from
+each request's scheduled send time, so a server that falls behind shows up as
+rising latency rather than a quietly lower request rate. Every worker process
+holds its own copy of the stand-ins: /process jobs run against the claims the
+bucket was populated with before the fork, not against files /upload added.
+"""
+
+import argparse
+import contextlib
+import http.client
+import itertools
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from src.config import CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX, SERVE_THREADS
+from src.jobs import JobWorkerPool, SQLiteJobQueue
+from src.metrics import metrics
+
+from .corpus import generate_claims, populate_bucket
+from .fakes import FakeBedrockRuntime, FakeS3
+from .run import WEB_DIR, install_fakes, load_web_app, summarize
+
+ENDPOINTS = ("upload", "process", "outputs")
+
+
+def multipart_body(filename: str, data: bytes, content_type: str = "text/plain") -> tuple:
+    """
+    (body, Content-Type header) for a single-file multipart/form-data upload.
+    """
+    boundary = uuid.uuid4().hex
+    head = (f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n").encode()
+    return head + data + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+class Target:
+    """
+    Builds one request per call for each endpoint, cycling through the claims.
+    """
+
+    def __init__(self, claims: list, claim_names: list):
+        self._uploads = itertools.cycle(claims)
+        self._process = itertools.cycle(claim_names)
+        self._lock = threading.Lock()
+
+    def request(self, endpoint: str) -> tuple:
+        """(method, path, body, headers, expected statuses)"""
+        with self._lock:
+            if endpoint == "upload":
+                name, text = next(self._uploads)
+            elif endpoint == "process":
+                name = next(self._process)
+        if endpoint == "upload":
+            body, content_type = multipart_body(f"load_{uuid.uuid4().hex[:8]}_{name}", text.encode("utf-8"))
+            return "POST", "/upload", body, {"Content-Type": content_type}, (200,)
+        if endpoint == "process":
+            body = json.dumps({"filename": name}).encode()
+            return "POST", "/process", body, {"Content-Type": "application/json"}, (202,)
+        if endpoint == "outputs":
+            return "GET", "/outputs?page_size=50", None, {}, (200,)
+        raise ValueError(f"unknown endpoint: {endpoint}")
+
+
+def send(host: str, port: int, method: str, path: str, body=None, headers=None, timeout: float = 30.0) -> int:
+    """
+    One request on a fresh connection; returns the status code.
+    """
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def drive(host: str, port: int, target: Target, endpoints: list, rps: float, duration: float,
+          concurrency: int, timeout: float) -> dict:
+    """
+    Send rps requests per second to each endpoint for duration seconds.
+    """
+    samples = {endpoint: [] for endpoint in endpoints}  # (latency, status or None)
+    lock = threading.Lock()
+
+    def one(endpoint, scheduled):
+        method, path, body, headers, expected = target.request(endpoint)
+        try:
+            status = send(host, port, method, path, body, headers, timeout)
+        except OSError:
+            status = None
+        latency = time.perf_counter() - scheduled
+        with lock:
+            samples[endpoint].append((latency, status, status in expected))
+
+    # Interleave the endpoints' schedules into a single timeline
+    interval = 1.0 / rps
+    schedule = sorted(
+        (i * interval + offset * interval / len(endpoints), endpoint)
+        for offset, endpoint in enumerate(endpoints)
+        for i in range(int(rps * duration))
+    )
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for at, endpoint in schedule:
+            delay = started + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, endpoint, started + at)
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for endpoint, results in samples.items():
+        errors = sum(1 for _, _, ok in results if not ok)
+        stats = summarize([latency for latency, _, _ in results], elapsed, errors)
+        statuses = {}
+        for _, status, _ in results:
+            label = str(status) if status is not None else "connection_error"
+            statuses[label] = statuses.get(label, 0) + 1
+        stats["target_rps"] = rps
+        stats["error_rate"] = round(errors / len(results), 4) if results else None
+        stats["status_codes"] = dict(sorted(statuses.items()))
+        report[endpoint] = stats
+    return report
+
+
+def wait_until_ready(host: str, port: int, timeout: float = 30.0) -> float:
+    started = time.perf_counter()
+    while True:
+        try:
+            if send(host, port, "GET", "/jobs", timeout=2.0) == 200:
+                return time.perf_counter() - started
+        except OSError:
+            pass
+        if time.perf_counter() - started > timeout:
+            raise RuntimeError(f"server on port {port} not ready after {timeout}s")
+        time.sleep(0.05)
+
+
+def start_local_server(args, log) -> tuple:
+    """
+    Fork a PreforkServer for the web app on the stand-ins; returns (pid, port, claim names).
+    """
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed)
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX, args.claims, args.policies,
+                           seed=args.seed)
+    for key in keys:
+        name = key[len(CLAIMS_PREFIX):].rsplit(".", 1)[0]
+        fake_s3.put(CLAIM_BUCKET, f"outputs/{name}_result.json", json.dumps({"summary": name}).encode())
+    install_fakes(fake_s3, fake_bedrock)
+
+    sys.path.insert(0, WEB_DIR)
+    from serve import build_server
+    from src.serving import listen, preload_shared_state
+
+    os.chdir(WEB_DIR)
+    with contextlib.redirect_stdout(log):
+        web = load_web_app()
+        if args.workers > 1:
+            # Jobs queued by one worker are run and reported by any of them
+            web.job_queue = SQLiteJobQueue(db_path=os.path.join(args.tmp_dir, "jobs.sqlite3"))
+            web.job_workers = JobWorkerPool(web.job_queue, web.job_workers.process)
+            metrics.register_gauge("job_queue_depth", web.job_queue.depth)
+        sock = listen("127.0.0.1", 0)
+        preload_shared_state()
+    server = build_server(web, sock=sock, workers=args.workers, threads=args.threads,
+                          graceful_timeout=args.graceful_timeout)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            with contextlib.redirect_stdout(log):
+                code = server.serve()
+        finally:
+            os._exit(code)
+    port = sock.getsockname()[1]
+    sock.close()
+    return pid, port, [key[len(CLAIMS_PREFIX):] for key in keys]
+
+
+def stop_local_server(pid: int) -> dict:
+    started = time.perf_counter()
+    os.kill(pid, signal.SIGTERM)
+    _, status = os.waitpid(pid, 0)
+    return {"shutdown_seconds": round(time.perf_counter() - started, 3),
+            "exit_code": os.waitstatus_to_exitcode(status)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="HTTP load test for the web endpoints.")
+    parser.add_argument("--url", help="Target an already running server instead of starting one")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated subset of endpoints")
+    parser.add_argument("--rps", type=float, default=20.0, help="Requests per second, per endpoint")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load")
+    parser.add_argument("--concurrency", type=int, default=64, help="Most requests in flight at once")
+    parser.add_argument("--request-timeout", type=float, default=30.0, help="Client timeout per request (s)")
+    parser.add_argument("--workers", type=int, default=2, help="Server worker processes (local server)")
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS, help="Request threads per worker")
+    parser.add_argument("--graceful-timeout", type=float, default=10.0, help="Server shutdown grace period (s)")
+    parser.add_argument("--claims", type=int, default=50, help="Claims in the stand-in bucket")
+    parser.add_argument("--policies", type=int, default=100, help="Policies in the stand-in bucket")
+    parser.add_argument("--model-latency", type=float, default=0.02, help="Fake Bedrock base latency (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="Fake Bedrock output rate")
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="Fake S3 per-call latency (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show server log lines on stderr")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    for endpoint in endpoints:
+        if endpoint not in ENDPOINTS:
+            parser.error(f"unknown endpoint: {endpoint}")
+
+    claims = generate_claims(args.claims, seed=args.seed)
+    log = sys.stderr if args.verbose else open(os.devnull, "w")
+    cwd = os.getcwd()
+    pid = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        args.tmp_dir = tmp_dir
+        try:
+            if args.url:
+                parts = urlsplit(args.url)
+                host, port = parts.hostname, parts.port or 80
+                claim_names = [name for name, _ in claims]
+            else:
+                print(f"[LOAD] Starting {args.workers} workers x {args.threads} threads on the stand-ins",
+                      file=sys.stderr)
+                pid, port, claim_names = start_local_server(args, log)
+                host = "127.0.0.1"
+            ready_seconds = wait_until_ready(host, port)
+            print(f"[LOAD] {args.rps:g} rps x {len(endpoints)} endpoints for {args.duration:g}s", file=sys.stderr)
+            results = drive(host, port, Target(claims, claim_names), endpoints, args.rps, args.duration,
+                            args.concurrency, args.request_timeout)
+        finally:
+            shutdown = stop_local_server(pid) if pid is not None else None
+            os.chdir(cwd)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "tmp_dir")},
+        "ready_seconds": round(ready_seconds, 3),
+        "endpoints": results,
+    }
+    if shutdown is not None:
+        report["shutdown"] = shutdown
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,781 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark harness for the claims pipeline.
+
+Runs a cold-start probe, the retriever, the validator, process_claim_document (through the batch
+runner) and the Flask endpoints against in-memory S3 and Bedrock stand-ins,
+and reports throughput, latency percentiles and peak memory per scenario.
+
+    python -m bench.run --claims 200 --policies 100
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json   # exit 1 on regression
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from src import app as pipeline
+from src import batch, batch_inference, documents, outputs, rag, result_files
+from src.cache import ResponseCache
+from src.clients import clients
+from src.metrics import metrics
+from src.results_index import ResultsIndex, backfill, results_index
+from src.routing import route_stats
+from src.config import (CLAIM_BUCKET, CLAIMS_PREFIX, DOC_EXTRACT_MODEL_ID, OUTPUTS_PREFIX, POLICIES_PREFIX, PROJECT_ROOT,
+                        PROMPT_CACHE_ENABLED, PROMPT_CACHE_MODEL_PATTERNS, RESULTS_INDEX_MAX_LIMIT)
+from src.retriever import BM25Index
+from src.validator import validate_extracted_info
+
+from .corpus import CLAIM_FORMATS, generate_claims, generate_policies, populate_bucket
+from .fakes import FakeBedrockRuntime, FakeS3
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def install_fakes(fake_s3, fake_bedrock, response_cache: bool = False) -> None:
+    """
+    Inject the stand-ins into the shared client factory and start from a cold policy cache.
+    """
+    clients.set("s3", fake_s3)
+    clients.set("bedrock-runtime", fake_bedrock)
+    for invoker in (pipeline.extract_invoker, pipeline.summary_invoker):
+        invoker.cache = ResponseCache(db_path=None) if response_cache else None
+    rag.policy_corpus = rag.PolicyCorpusCache()
+    outputs.output_listing_cache.invalidate()
+    documents.text_cache = ResponseCache(db_path=None)
+    # Results written during the run are indexed in memory, never into the real index file
+    results_index.close()
+    results_index.db_path = ":memory:"
+
+
+WEB_DIR = os.path.join(PROJECT_ROOT, "web")
+
+
+def load_web_app():
+    """
+    Import web/app.py the way `python app.py` would. The caller must already
+    be in the web directory, since the app resolves its paths relative to it.
+    """
+    spec = importlib.util.spec_from_file_location("bench_web_app", os.path.join(WEB_DIR, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def summarize(latencies: list, elapsed: float, errors: int = 0) -> dict:
+    ordered = sorted(latencies)
+
+    def pct(fraction):
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] * 1000, 3)
+
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def timed_loop(fn, items) -> dict:
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        try:
+            fn(item)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def bench_retriever(args) -> dict:
+    policies = [text for _, text in generate_policies(args.policies, seed=args.seed)]
+    claims = generate_claims(args.queries, seed=args.seed)
+    queries = [text.split("Incident Description:", 1)[-1] for _, text in claims]
+
+    started = time.perf_counter()
+    index = BM25Index(policies)
+    build_seconds = time.perf_counter() - started
+
+    result = timed_loop(lambda q: index.search(q, top_k=3), queries)
+    result["index_build_seconds"] = round(build_seconds, 3)
+    result["documents"] = len(policies)
+    return result
+
+
+def bench_validator(args) -> dict:
+    fake = FakeBedrockRuntime()
+    outputs_ = [fake._answer("Extract the following information\n" + text)
+                for _, text in generate_claims(args.queries, seed=args.seed)]
+    clean = len(outputs_)
+    # Include the messy shapes models actually return
+    outputs_ += ["Here is the JSON:\n" + o + "\nLet me know if you need more." for o in outputs_[:clean // 4]]
+    outputs_ += ['For example {"claimant_name": "Jane Doe"}. The record:\n' + o for o in outputs_[:clean // 10]]
+    outputs_ += [o.replace('"\n}', '",\n}') for o in outputs_[:clean // 10]]        # trailing comma
+    outputs_ += [o[:len(o) * 3 // 4] for o in outputs_[:clean // 10]]               # cut off at max_tokens
+    messy = len(outputs_) - clean
+    outputs_ += ["not json at all"] * (len(outputs_) // 10)
+    result = timed_loop(validate_extracted_info, outputs_)
+    # Recoverable outputs that still came back without fields
+    result["unusable"] = sum(1 for o in outputs_[clean:clean + messy]
+                             if "raw_model_output" in validate_extracted_info(o))
+    return result
+
+
+def bench_pipeline(args) -> dict:
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(
+        base_latency=args.model_latency,
+        tokens_per_second=args.tokens_per_second,
+        throttle_rate=args.throttle_rate,
+        max_concurrency=args.max_model_concurrency,
+        seed=args.seed,
+    )
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX,
+                           args.claims, args.policies, seed=args.seed)
+    install_fakes(fake_s3, fake_bedrock, response_cache=args.response_cache)
+    metrics.reset()
+
+    report = batch.process_claims_batch(keys=keys, max_workers=args.workers)
+    result = summarize([c["elapsed_seconds"] for c in report["claims"]], report["elapsed_seconds"],
+                       errors=report["failed"] + report["throttled"])
+    result.update({
+        "workers": args.workers,
+        "model_calls": fake_bedrock.calls,
+        "model_throttled": fake_bedrock.throttled,
+        "input_tokens": fake_bedrock.input_tokens,
+        "output_tokens": fake_bedrock.output_tokens,
+        "s3_calls": dict(fake_s3.calls),
+        "stages": report["metrics"]["histograms"].get("claim_stage_seconds", {}),
+    })
+    return result
+
+
+def bench_incremental(args) -> dict:
+    """
+    Full run, then incremental reruns: with nothing changed, and after one
+    policy file is edited (only claims that drew on it should be redone).
+    """
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed)
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX,
+                           args.claims, args.policies, seed=args.seed)
+    install_fakes(fake_s3, fake_bedrock, response_cache=args.response_cache)
+
+    def run(label):
+        calls = fake_bedrock.calls
+        report = batch.process_claims_batch(max_workers=args.workers, incremental=label != "full")
+        return {
+            "elapsed_seconds": report["elapsed_seconds"],
+            "processed": report["succeeded"],
+            "skipped": report["skipped"],
+            "failed": report["failed"],
+            "model_calls": fake_bedrock.calls - calls,
+        }
+
+    results = {"claims": len(keys), "full": run("full"), "unchanged": run("unchanged")}
+
+    policy_key = sorted(key for bucket, key in fake_s3.objects if key.startswith(POLICIES_PREFIX))[0]
+    body = fake_s3.objects[(CLAIM_BUCKET, policy_key)][0]
+    fake_s3.put(CLAIM_BUCKET, policy_key, body + b"\nAmended: claims must include photos.", "text/plain")
+    rag.policy_corpus.invalidate()
+    results["policy_changed"] = run("policy_changed")
+    results["policy_changed"]["policy_key"] = policy_key
+    return results
+
+
+def bench_batch_inference(args) -> dict:
+    """
+    The same claims on demand and through the two batch-inference phases (with
+    the local JSONL runner standing in for Bedrock's batch jobs); every result
+    file must come out byte-identical.
+    """
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed)
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX,
+                           args.claims, args.policies, seed=args.seed)
+    install_fakes(fake_s3, fake_bedrock, response_cache=args.response_cache)
+
+    def results():
+        return {key: body for (bucket, key), (body, *_rest) in fake_s3.objects.items() if key.startswith(OUTPUTS_PREFIX)}
+
+    calls = fake_bedrock.calls
+    report = batch.process_claims_batch(keys=keys, max_workers=args.workers)
+    on_demand = results()
+    on_demand_calls = fake_bedrock.calls - calls
+    for key in on_demand:
+        fake_s3.delete_object(Bucket=CLAIM_BUCKET, Key=key)
+
+    calls = fake_bedrock.calls
+    with tempfile.TemporaryDirectory() as work_dir:
+        batch_report = batch_inference.run_batch_inference(keys=keys, runner=batch_inference.LocalBatchRunner(
+            workers=args.workers), work_dir=work_dir)
+    batched = results()
+    return {
+        "claims": len(keys),
+        "on_demand_seconds": report["elapsed_seconds"],
+        "on_demand_model_calls": on_demand_calls,
+        "batch_seconds": batch_report["elapsed_seconds"],
+        "batch_model_calls": fake_bedrock.calls - calls,
+        "batch_failed": len(batch_report["failed"]),
+        "results_identical": batched == on_demand,
+        "mismatched": sorted(key for key in on_demand if batched.get(key) != on_demand[key])[:10],
+    }
+
+
+def bench_routing(args) -> dict:
+    """
+    Claims that need the extraction model, a cheap first-tier model that
+    garbles a share of its answers, and the per-route report used to tune the
+    escalation thresholds.
+    """
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed, weak_models=[DOC_EXTRACT_MODEL_ID],
+                                      weak_error_rate=args.weak_error_rate, weak_speedup=3.0)
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX,
+                           args.claims, args.policies, seed=args.seed, model_rate=args.model_rate)
+    install_fakes(fake_s3, fake_bedrock, response_cache=args.response_cache)
+    metrics.reset()
+    route_stats.reset()
+
+    report = batch.process_claims_batch(keys=keys, max_workers=args.workers)
+    result = summarize([c["elapsed_seconds"] for c in report["claims"]], report["elapsed_seconds"],
+                       errors=report["failed"] + report["throttled"])
+    result.update({
+        "model_calls": dict(fake_bedrock.calls_by_model),
+        "routes": report["model_routes"],
+    })
+    return result
+
+
+def _prompt_cache_run(args, enabled: bool) -> dict:
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed, input_tokens_per_second=args.prefill_tokens_per_second,
+                                      cache_min_tokens=args.cache_min_tokens)
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX,
+                           args.claims, args.policies, seed=args.seed, model_rate=args.model_rate)
+    install_fakes(fake_s3, fake_bedrock, response_cache=False)
+    metrics.reset()
+    route_stats.reset()
+    for invoker in (pipeline.extract_invoker, pipeline.summary_invoker):
+        invoker.prompt_cache = enabled
+        invoker.prompt_cache_models = args.prompt_cache_models.split(",")
+
+    report = batch.process_claims_batch(keys=keys, max_workers=args.workers)
+    result = summarize([c["elapsed_seconds"] for c in report["claims"]], report["elapsed_seconds"],
+                       errors=report["failed"] + report["throttled"])
+    total_input = (fake_bedrock.input_tokens + fake_bedrock.cache_read_input_tokens
+                   + fake_bedrock.cache_write_input_tokens)
+    stages = report["metrics"]["histograms"].get("claim_stage_seconds", {})
+    result.update({
+        "model_calls": fake_bedrock.calls,
+        "input_tokens": fake_bedrock.input_tokens,
+        "cache_read_input_tokens": fake_bedrock.cache_read_input_tokens,
+        "cache_write_input_tokens": fake_bedrock.cache_write_input_tokens,
+        "cached_input_share": round(fake_bedrock.cache_read_input_tokens / total_input, 4) if total_input else None,
+        "cost_usd": round(sum(route["cost_usd"] for route in report["model_routes"].values()), 6),
+        "extract_invoke": stages.get('{stage="extract_invoke"}'),
+        "summary_invoke": stages.get('{stage="summary_invoke"}'),
+    })
+    outputs = {}
+    for (bucket, key), (body, *_) in fake_s3.objects.items():
+        if key.startswith(OUTPUTS_PREFIX):
+            output = result_files.decode_result(body, fake_s3.content_encodings.get((bucket, key)))
+            outputs[key] = (output["extracted_info"], output["summary"])
+    return result, outputs
+
+
+def bench_prompt_cache(args) -> dict:
+    """
+    The same claims with and without Bedrock prompt-cache checkpoints, on a
+    stand-in that bills cache reads and writes and reads cached input faster.
+    With the default models and the synthetic policies nothing is cached;
+    --prompt-cache-models claude with a lower --cache-min-tokens simulates a
+    supported model with longer policy context.
+    """
+    try:
+        off, off_outputs = _prompt_cache_run(args, enabled=False)
+        on, on_outputs = _prompt_cache_run(args, enabled=True)
+    finally:
+        for invoker in (pipeline.extract_invoker, pipeline.summary_invoker):
+            invoker.prompt_cache = PROMPT_CACHE_ENABLED
+            invoker.prompt_cache_models = PROMPT_CACHE_MODEL_PATTERNS
+    return {
+        "uncached": off,
+        "cached": on,
+        "cost_saving": round(1 - on["cost_usd"] / off["cost_usd"], 4) if off["cost_usd"] else None,
+        "results_identical": on_outputs == off_outputs,
+    }
+
+
+def bench_results_index(args) -> dict:
+    """
+    Field queries and full-text searches against the local results index,
+    next to the S3 scan (list and read every result file) they replace, plus
+    a full and an incremental backfill.
+    """
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed)
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX,
+                           args.claims, args.policies, seed=args.seed)
+    install_fakes(fake_s3, fake_bedrock, response_cache=args.response_cache)
+    batch.process_claims_batch(keys=keys, max_workers=args.workers)
+
+    index = ResultsIndex(db_path=":memory:")
+    full = backfill(index, full=True)
+    incremental = backfill(index)
+    rows = index.query(limit=RESULTS_INDEX_MAX_LIMIT)["results"]
+    policies = sorted({row["policy_number"] for row in rows if row["policy_number"]})
+    words = ["water", "damage", "collision", "theft", "fire", "storm", "injury", "window"]
+
+    def scan(i):
+        listed = s3_list_keys(fake_s3)
+        policy = policies[i % len(policies)]
+        return [key for key in listed
+                if json.loads(fake_s3.get_object(Bucket=CLAIM_BUCKET, Key=key)["Body"].read())
+                ["extracted_info"].get("policy_number") == policy]
+
+    queries = max(1, args.queries // 10)
+    return {
+        "results": index.count(),
+        "indexed_on_write": results_index.count(),
+        "backfill_full": full,
+        "backfill_incremental": incremental,
+        "query": timed_loop(lambda i: index.query(policy=policies[i % len(policies)], min_amount=1000), range(queries)),
+        "search": timed_loop(lambda i: index.search(words[i % len(words)]), range(queries)),
+        "s3_scan": timed_loop(scan, range(max(1, queries // 20))),
+    }
+
+
+def s3_list_keys(fake_s3) -> list:
+    keys = []
+    for page in fake_s3.get_paginator("list_objects_v2").paginate(Bucket=CLAIM_BUCKET, Prefix=OUTPUTS_PREFIX):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def bench_result_format(args) -> dict:
+    """
+    The same claims written as legacy pretty JSON and as compact files:
+    stored bytes, read+parse latency, and whether every compact result
+    resolves back to the pretty one (policy references to snippet text).
+    """
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed)
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX,
+                           args.claims, args.policies, seed=args.seed)
+    install_fakes(fake_s3, fake_bedrock, response_cache=True)
+
+    runs = {}
+    compact_setting = result_files.OUTPUTS_COMPACT
+    try:
+        for label, compact in (("pretty", False), ("compact", True)):
+            result_files.OUTPUTS_COMPACT = compact
+            batch.process_claims_batch(keys=keys, max_workers=args.workers)
+            out_keys = s3_list_keys(fake_s3)
+            runs[label] = {
+                "files": len(out_keys),
+                "bytes": sum(len(fake_s3.objects[(CLAIM_BUCKET, key)][0]) for key in out_keys),
+                "results": {key: result_files.read_result(fake_s3.get_object(Bucket=CLAIM_BUCKET, Key=key))
+                            for key in out_keys},
+                "read": timed_loop(lambda key: result_files.read_result(
+                    fake_s3.get_object(Bucket=CLAIM_BUCKET, Key=key)), out_keys),
+            }
+    finally:
+        result_files.OUTPUTS_COMPACT = compact_setting
+
+    def resolved(result):
+        result = dict(result)
+        result["policy_snippets"] = result_files.resolve_policy_snippets(result)
+        result.pop("policy_snippet_refs", None)
+        return result
+
+    pretty, compact = runs["pretty"], runs["compact"]
+    return {
+        "claims": len(keys),
+        "pretty_bytes": pretty["bytes"],
+        "compact_bytes": compact["bytes"],
+        "compression_ratio": round(pretty["bytes"] / compact["bytes"], 2) if compact["bytes"] else None,
+        "resolves_to_pretty": all(resolved(compact["results"][key]) == result
+                                  for key, result in pretty["results"].items()),
+        "pretty_read": pretty["read"],
+        "compact_read": compact["read"],
+    }
+
+
+def bench_documents(args) -> dict:
+    """
+    Claims as text, HTML and DOCX through the pipeline, then parsing alone:
+    large DOCX files parsed by concurrent threads in-thread vs in the process
+    pool, and a second pass served from the text cache. Every parsed claim
+    must come back as the text it was rendered from.
+    """
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed)
+    formats = [name.strip() for name in args.document_formats.split(",") if name.strip()]
+    keys = populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX,
+                           args.claims, args.policies, seed=args.seed, formats=formats)
+    install_fakes(fake_s3, fake_bedrock, response_cache=args.response_cache)
+    claims = generate_claims(args.claims, seed=args.seed,
+                             policy_ids=[name.split("_")[1] for name, _ in generate_policies(args.policies, seed=args.seed)])
+    originals = {os.path.splitext(name)[0]: text for name, text in claims}
+
+    def parse(key):
+        response = fake_s3.get_object(Bucket=CLAIM_BUCKET, Key=key)
+        return documents.read_document(key, response["Body"], response.get("ContentType"))
+
+    report = batch.process_claims_batch(keys=keys, max_workers=args.workers)
+    pipeline_run = summarize([c["elapsed_seconds"] for c in report["claims"]], report["elapsed_seconds"],
+                             errors=report["failed"] + report["throttled"])
+    parsed_keys = [key for key in keys if not key.endswith(".txt")]
+    misses = documents.text_cache.misses
+    cached = timed_loop(parse, parsed_keys)
+    cached_misses = documents.text_cache.misses - misses
+    mismatched = sorted(key for key in keys if parse(key).text.strip()
+                        != originals[os.path.splitext(os.path.basename(key))[0]].strip())
+
+    # Multi-megabyte DOCX files, parsed by the batch workers at once
+    large_keys = []
+    for i in range(max(args.workers, 8)):
+        text = "\n".join(claims[(i + j) % len(claims)][1] for j in range(2000))
+        key = f"large/claim_{i:03d}.docx"
+        fake_s3.put(CLAIM_BUCKET, key, CLAIM_FORMATS["docx"][0](text), CLAIM_FORMATS["docx"][1])
+        large_keys.append(key)
+
+    def parse_concurrently():
+        documents.text_cache = ResponseCache(memory_entries=0, db_path=None)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            latencies = list(pool.map(lambda key: _timed(parse, key), large_keys))
+        return summarize(latencies, time.perf_counter() - started)
+
+    workers = documents.DOCUMENT_PARSE_WORKERS
+    try:
+        documents.DOCUMENT_PARSE_WORKERS = 0
+        in_thread = parse_concurrently()
+        documents.DOCUMENT_PARSE_WORKERS = workers or 4
+        parse(large_keys[0])  # start the pool outside the measurement
+        in_pool = parse_concurrently()
+    finally:
+        documents.DOCUMENT_PARSE_WORKERS = workers
+        documents.shutdown_parse_pool()
+
+    return {
+        "claims": len(keys),
+        "formats": {name: sum(1 for key in keys if key.endswith("." + name)) for name in formats},
+        "pipeline": pipeline_run,
+        "cached_reparse": cached,
+        "cached_reparse_misses": cached_misses,
+        "text_mismatched": mismatched[:10],
+        "large_docx_bytes": len(fake_s3.objects[(CLAIM_BUCKET, large_keys[0])][0]),
+        "large_parse_in_thread": in_thread,
+        "large_parse_process_pool": in_pool,
+    }
+
+
+def _timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def bench_web(args) -> dict:
+    cwd = os.getcwd()
+    os.chdir(WEB_DIR)
+    try:
+        return _bench_web(args)
+    finally:
+        os.chdir(cwd)
+
+
+def _bench_web(args) -> dict:
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bedrock = FakeBedrockRuntime(base_latency=args.model_latency, tokens_per_second=args.tokens_per_second,
+                                      seed=args.seed)
+    populate_bucket(fake_s3, CLAIM_BUCKET, CLAIMS_PREFIX, POLICIES_PREFIX, 0, args.policies, seed=args.seed)
+    install_fakes(fake_s3, fake_bedrock, response_cache=args.response_cache)
+    web = load_web_app()
+    client = web.app.test_client()
+
+    claims = generate_claims(args.web_requests, seed=args.seed)
+    for name, text in claims:
+        fake_s3.put(CLAIM_BUCKET, f"outputs/{name[:-4]}_result.json", json.dumps({"summary": text}).encode())
+
+    def upload(item):
+        name, text = item
+        response = client.post("/upload", data={"file": (io.BytesIO(text.encode()), name)},
+                               content_type="multipart/form-data")
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+
+    job_ids = []
+
+    def enqueue(item):
+        response = client.post("/process", json={"filename": item[0]})
+        if response.status_code != 202:
+            raise RuntimeError(response.status_code)
+        job_ids.append(response.get_json()["job_id"])
+
+    def list_outputs(_):
+        response = client.get("/outputs?page_size=50")
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+
+    results = {
+        "upload": timed_loop(upload, claims),
+        "process_enqueue": timed_loop(enqueue, claims),
+        "outputs": timed_loop(list_outputs, range(len(claims))),
+    }
+
+    # One bulk archive holding every claim, fanned out to S3 by /upload/archive
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for name, text in claims:
+            bundle.writestr(f"bulk/{name}", text)
+    archive.seek(0)
+    started = time.perf_counter()
+    response = client.post("/upload/archive", data={"file": (archive, "claims.zip")},
+                           content_type="multipart/form-data")
+    results["archive_upload"] = {
+        "seconds": round(time.perf_counter() - started, 3),
+        "members": len(response.get_json().get("uploaded", [])),
+        "status": response.status_code,
+    }
+
+    # End-to-end: wait for the background workers to finish every queued job
+    started = time.perf_counter()
+    pending = set(job_ids)
+    deadline = started + args.job_timeout
+    while pending and time.perf_counter() < deadline:
+        for job_id in list(pending):
+            status = client.get(f"/jobs/{job_id}").get_json()["status"]
+            if status in ("succeeded", "failed"):
+                pending.discard(job_id)
+        time.sleep(0.01)
+    results["jobs_drain_seconds"] = round(time.perf_counter() - started, 3)
+    results["jobs_unfinished"] = len(pending)
+    web.job_workers.stop(timeout=5)
+    return results
+
+
+_STARTUP_PROBE = """
+import time
+started = time.perf_counter()
+import src.app
+imported = time.perf_counter()
+from src.clients import get_client
+get_client("s3")
+get_client("bedrock-runtime")
+print(imported - started, time.perf_counter() - imported)
+"""
+
+
+def bench_startup(args) -> dict:
+    """
+    Cold start in fresh interpreters: time to import the pipeline, then time to
+    build the S3 and Bedrock clients on first use. No AWS calls are made.
+    """
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    imports = []
+    first_clients = []
+    started = time.perf_counter()
+    for _ in range(args.startup_runs):
+        probe = subprocess.run([sys.executable, "-c", _STARTUP_PROBE], cwd=PROJECT_ROOT, env=env,
+                               capture_output=True, text=True, check=True)
+        import_seconds, client_seconds = map(float, probe.stdout.split()[-2:])
+        imports.append(import_seconds)
+        first_clients.append(client_seconds)
+    result = summarize(imports, time.perf_counter() - started)
+    result["first_clients_p50_ms"] = round(sorted(first_clients)[len(first_clients) // 2] * 1000, 3)
+    return result
+
+
+SCENARIOS = {
+    "startup": bench_startup,
+    "retriever": bench_retriever,
+    "validator": bench_validator,
+    "pipeline": bench_pipeline,
+    "incremental": bench_incremental,
+    "batch_inference": bench_batch_inference,
+    "routing": bench_routing,
+    "prompt_cache": bench_prompt_cache,
+    "results_index": bench_results_index,
+    "result_format": bench_result_format,
+    "documents": bench_documents,
+    "web": bench_web,
+}
+
+# Bump a scenario's version when its workload changes, so results are not
+# compared against a baseline that measured something else. Unlisted: 1.
+SCENARIO_VERSIONS = {
+    "prompt_cache": 2,  # Bedrock's real minimum cacheable prefix and the configured cache models
+    "validator": 2,     # Schema-enforced extraction inputs and the JSON fallback parser
+    "web": 2,           # Asynchronous /process jobs, paginated /outputs, results index and compact result files
+}
+
+
+def run_scenario(name, args) -> dict:
+    # Keep the pipeline's progress prints out of the JSON report on stdout
+    log = sys.stderr if args.verbose else open(os.devnull, "w")
+    if args.trace_memory:
+        tracemalloc.start()
+    with contextlib.redirect_stdout(log):
+        result = SCENARIOS[name](args)
+    if args.trace_memory:
+        result["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+        tracemalloc.stop()
+    return result
+
+
+def _throughputs(results: dict, path=()):
+    """
+    Yield (dotted name, throughput, p95) for every scenario-like dict in the results.
+    """
+    if "throughput_per_second" in results:
+        yield ".".join(path), results["throughput_per_second"], results.get("p95_ms")
+        return
+    for key, value in results.items():
+        if isinstance(value, dict) and key != "stages":
+            yield from _throughputs(value, path + (key,))
+
+
+def stale_scenarios(results: dict, baseline: dict) -> dict:
+    """
+    {scenario: (baseline version, current version)} for scenarios whose
+    workload changed since the baseline was recorded.
+    """
+    recorded = baseline.get("scenario_versions", {})
+    return {
+        name: (recorded.get(name, 1), SCENARIO_VERSIONS.get(name, 1))
+        for name in results
+        if name in baseline.get("results", {}) and recorded.get(name, 1) != SCENARIO_VERSIONS.get(name, 1)
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Return human-readable regressions: throughput lower, or p95 higher, than the
+    baseline by more than the tolerance. Stale scenarios (see stale_scenarios)
+    are not compared.
+    """
+    stale = stale_scenarios(results, baseline)
+    previous = {name: (tput, p95) for name, tput, p95 in _throughputs(baseline.get("results", {}))}
+    regressions = []
+    for name, tput, p95 in _throughputs(results):
+        if name not in previous or name.split(".", 1)[0] in stale:
+            continue
+        base_tput, base_p95 = previous[name]
+        if base_tput and tput is not None and tput < base_tput * (1 - tolerance):
+            regressions.append(f"{name}: throughput {tput}/s vs baseline {base_tput}/s")
+        if base_p95 and p95 is not None and p95 > base_p95 * (1 + tolerance):
+            regressions.append(f"{name}: p95 {p95}ms vs baseline {base_p95}ms")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the claims pipeline.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset to run")
+    parser.add_argument("--claims", type=int, default=200, help="Synthetic claims for the pipeline scenario")
+    parser.add_argument("--policies", type=int, default=100, help="Synthetic policies (10 to 100k)")
+    parser.add_argument("--queries", type=int, default=1000, help="Retriever/validator iterations")
+    parser.add_argument("--web-requests", type=int, default=100, help="Requests per web endpoint")
+    parser.add_argument("--workers", type=int, default=8, help="Batch worker threads")
+    parser.add_argument("--model-latency", type=float, default=0.02, help="Fake Bedrock base latency (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="Fake Bedrock output rate")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of calls throttled at random")
+    parser.add_argument("--max-model-concurrency", type=int, default=None, help="Throttle beyond this many in-flight calls")
+    parser.add_argument("--model-rate", type=float, default=0.5,
+                        help="Share of claims needing the extraction model (routing scenario)")
+    parser.add_argument("--weak-error-rate", type=float, default=0.2,
+                        help="Share of first-tier extraction answers garbled (routing scenario)")
+    parser.add_argument("--document-formats", default=",".join(CLAIM_FORMATS),
+                        help="Claim file formats cycled through by the documents scenario")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=5000.0,
+                        help="Fake Bedrock input processing rate (prompt_cache scenario)")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="Fake Bedrock minimum cacheable prefix (prompt_cache scenario; Bedrock's minimum "
+                             "for most Claude models)")
+    parser.add_argument("--prompt-cache-models", default=",".join(PROMPT_CACHE_MODEL_PATTERNS),
+                        help="Comma-separated model ID patterns sent checkpoints in the prompt_cache scenario "
+                             "(default PROMPT_CACHE_MODEL_PATTERNS, which the default models don't match)")
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="Fake S3 per-call latency (s)")
+    parser.add_argument("--response-cache", action="store_true", help="Enable the in-memory response cache")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters for the startup scenario")
+    parser.add_argument("--job-timeout", type=float, default=120.0, help="Max seconds to wait for web jobs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="Skip tracemalloc peak-memory measurement (it slows allocation-heavy code)")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline log lines on stderr")
+    parser.add_argument("--baseline", help=f"Compare against this baseline file (e.g. {DEFAULT_BASELINE})")
+    parser.add_argument("--save-baseline", help="Write the results as a new baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression fraction")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario: {name}")
+        print(f"[BENCH] Running {name}...", file=sys.stderr)
+        results[name] = run_scenario(name, args)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline", "output")},
+        "scenario_versions": {name: SCENARIO_VERSIONS.get(name, 1) for name in results},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Baseline written to {args.save_baseline}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name, (recorded, current) in stale_scenarios(results, baseline).items():
+            print(f"[BENCH] Skipping {name}: baseline recorded for workload v{recorded}, now v{current}; "
+                  f"re-record it with --save-baseline", file=sys.stderr)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"[BENCH] REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("[BENCH] No regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,7 +1,10 @@
 # src/app.py
 
+import functools
 import json
-import boto3
+import os
+import time
+from collections import namedtuple
 
 from .config import (
     CLAIM_BUCKET,
@@ -9,17 +12,47 @@ from .config import (
     OUTPUTS_PREFIX,
     DOC_EXTRACT_MODEL_ID,
     SUMMARY_MODEL_ID,
+    EXTRACT_TEMPERATURE,
+    EXTRACT_MAX_TOKENS,
+    EXTRACT_STRUCTURED_OUTPUT,
+    SUMMARY_TEMPERATURE,
+    SUMMARY_MAX_TOKENS,
+    FAST_PATH_ENABLED,
+    FAST_PATH_MIN_CONFIDENCE,
+    PIPELINE_BACKGROUND_WRITES,
+    POLICY_CONTEXT_MAX_CHUNKS,
+    POLICY_CONTEXT_TOKEN_BUDGET,
+    RESULTS_INDEX_ENABLED,
 )
-from .prompts import PromptTemplateManager
-from .models import BedrockModelInvoker
-from .rag import load_policy_snippets, simple_keyword_retriever
-from .validator import validate_extracted_info
+from .prompts import Prompt, PromptTemplateManager
+from .models import BedrockModelInvoker, track_usage
+from .cache import response_cache
+from .outputs import output_listing_cache
+from .metrics import metrics
+from .rag import get_policy_index
+from .chunking import normalize_policy_id, policy_id_from_key
+from .validator import EXTRACTION_TOOL, validate_extracted_info
+from .fastpath import fast_extract
+from .stages import run_stage_graph, stage_executor, write_executor
+from .clients import LazyClient
+from .documents import read_document
+from .fingerprints import build_fingerprint
+from .result_files import encode_result, policy_snippets_field
+from .results_index import results_index
+from .routing import EXTRACT_MODEL_CASCADE, choose_summary_model, extraction_problems, route_stats
 
-s3 = boto3.client("s3")
+s3 = LazyClient("s3")
+
+ClaimDocument = namedtuple("ClaimDocument", ["key", "text", "etag", "sha256"])
+Extraction = namedtuple("Extraction", ["fields", "model_id"])  # model_id is None on the fast path
+Summary = namedtuple("Summary", ["text", "model_id"])
 
 prompt_manager = PromptTemplateManager()
-extract_invoker = BedrockModelInvoker(DOC_EXTRACT_MODEL_ID)
-summary_invoker = BedrockModelInvoker(SUMMARY_MODEL_ID)
+extract_invoker = BedrockModelInvoker(DOC_EXTRACT_MODEL_ID, cache=response_cache)
+summary_invoker = BedrockModelInvoker(SUMMARY_MODEL_ID, cache=response_cache)
+
+# Tool the extraction model must call, or None to parse JSON out of free text
+extract_tool = EXTRACTION_TOOL if EXTRACT_STRUCTURED_OUTPUT else None
 
 
 def upload_document(local_path: str, key: str) -> None:
@@ -31,90 +64,404 @@ def upload_document(local_path: str, key: str) -> None:
     print(f"[UPLOAD] {local_path} -> s3://{CLAIM_BUCKET}/{key}")
 
 
+def fetch_claim_document(key: str) -> ClaimDocument:
+    """
+    Fetch the claim document at the given key as text (PDF, DOCX and HTML are
+    parsed, see src.documents), with its ETag and the hash of its bytes.
+    """
+    print(f"[GET] s3://{CLAIM_BUCKET}/{key}")
+    with metrics.timer("s3_fetch"):
+        response = s3.get_object(Bucket=CLAIM_BUCKET, Key=key)
+        document = read_document(key, response["Body"], response.get("ContentType"))
+    return ClaimDocument(key, document.text, response.get("ETag", ""), document.sha256)
+
+
 def get_document_text(key: str) -> str:
     """
     Fetch and decode the claim document at the given key.
     """
-    print(f"[GET] s3://{CLAIM_BUCKET}/{key}")
-    response = s3.get_object(Bucket=CLAIM_BUCKET, Key=key)
-    return response["Body"].read().decode("utf-8")
+    return fetch_claim_document(key).text
 
 
-def process_claim_document(key: str) -> dict:
+def output_key_for(key: str) -> str:
     """
-    Main processing function:
+    Map a claim key to the key its result JSON is written to.
+    """
+    base_name = key.replace(CLAIMS_PREFIX, "").rsplit(".", 1)[0]
+    return f"{OUTPUTS_PREFIX}{base_name}_result.json"
 
-    1) Load claim text from S3
-    2) Extract structured info with Bedrock
-    3) Retrieve relevant policy snippets (simple RAG)
-    4) Generate a concise summary with Bedrock
-    5) Save result JSON to outputs/ and return it
+
+def fast_path_fields(document_text: str):
     """
-    print(f"[PROCESS] Claim document: s3://{CLAIM_BUCKET}/{key}")
-    document_text = get_document_text(key)
+    The claim fields if the rule-based fast path parsed the document
+    confidently, else None (the extraction model is needed).
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    with metrics.timer("fast_path"):
+        fast = fast_extract(document_text)
+    if fast.confidence >= FAST_PATH_MIN_CONFIDENCE and not fast.missing and not fast.ambiguous:
+        metrics.inc("fast_path_total", outcome="hit")
+        print(f"[FAST] Parsed intake form (confidence {fast.confidence:.2f})")
+        return fast.fields
+    metrics.inc("fast_path_total", outcome="fallback")
+    print(f"[FAST] Falling back to model (missing={fast.missing}, ambiguous={fast.ambiguous})")
+    return None
+
 
-    # 1) Extraction prompt
-    extract_prompt = prompt_manager.get_prompt(
+def build_extract_prompt(document_text: str) -> Prompt:
+    return prompt_manager.get_prompt(
         "extract_info",
         document_text=document_text,
     )
 
-    print("[LLM] Calling extraction model...")
-    raw_extracted = extract_invoker.invoke(
-        prompt=extract_prompt,
-        model_id=DOC_EXTRACT_MODEL_ID,
-        temperature=0.0,
-        max_tokens=800,
-    )
 
-    extracted_info = validate_extracted_info(raw_extracted)
+def parse_extraction(raw_extracted: str) -> dict:
+    """
+    Validate the extraction model's raw output into the claim fields.
+    """
+    with metrics.timer("validation"):
+        extracted_info = validate_extracted_info(raw_extracted)
     print("[INFO] Extracted info:", json.dumps(extracted_info, indent=2))
+    return extracted_info
+
+
+def run_extraction_cascade(prompt, first_answer: str = None) -> Extraction:
+    """
+    Run the extraction models cheapest first, escalating to the next one while
+    the output has problems (see routing.extraction_problems); the last
+    model's output is kept either way.
+
+    prompt may be a zero-argument callable, called only once a model actually
+    has to be invoked. first_answer is the first model's raw output when it
+    was obtained elsewhere (e.g. from a batch-inference job).
+    """
+    for tier, model_id in enumerate(EXTRACT_MODEL_CASCADE):
+        seconds = usage = None
+        if tier == 0 and first_answer is not None:
+            raw_extracted = first_answer
+        else:
+            if callable(prompt):
+                prompt = prompt()
+            print(f"[LLM] Calling extraction model {model_id}...")
+            started = time.perf_counter()
+            with track_usage() as usage, metrics.timer("extract_invoke"):
+                raw_extracted = extract_invoker.invoke(
+                    prompt=prompt,
+                    model_id=model_id,
+                    temperature=EXTRACT_TEMPERATURE,
+                    max_tokens=EXTRACT_MAX_TOKENS,
+                    use_cache=True,
+                    tool=extract_tool,
+                )
+            seconds = time.perf_counter() - started
 
-    # 2) Simple RAG over policies
-    print("[RAG] Loading policy snippets...")
-    policy_snippets_all = load_policy_snippets()
-    query_text = f"{extracted_info.get('policy_number', '')} {extracted_info.get('incident_description', '')}"
-    relevant_policies = simple_keyword_retriever(policy_snippets_all, query_text, top_k=3)
-    policy_text = "\n\n---\n\n".join(relevant_policies) if relevant_policies else "No matching policy snippets found."
+        extracted_info = parse_extraction(raw_extracted)
+        problems = extraction_problems(extracted_info)
+        if not problems:
+            outcome = "accepted"
+        elif tier == len(EXTRACT_MODEL_CASCADE) - 1:
+            outcome = "exhausted"
+        else:
+            outcome = "escalated"
+        route_stats.record("extract", model_id, outcome, seconds, usage)
+        if outcome != "escalated":
+            return Extraction(extracted_info, model_id)
+        print(f"[ROUTE] Escalating extraction past {model_id}: {', '.join(problems)}")
 
-    # 3) Summary prompt
-    summary_prompt = prompt_manager.get_prompt(
+
+def extract_claim(document_text: str) -> Extraction:
+    """
+    Extract the structured claim fields. Well-formed intake forms are parsed
+    by the rule-based fast path; everything else goes through the extraction
+    model cascade.
+    """
+    fields = fast_path_fields(document_text)
+    if fields is not None:
+        return Extraction(fields, None)
+    return run_extraction_cascade(build_extract_prompt(document_text))
+
+
+def extract_claim_info(document_text: str) -> dict:
+    """
+    The extracted claim fields only (see extract_claim).
+    """
+    return extract_claim(document_text).fields
+
+
+def load_policy_index():
+    """
+    Make sure the policy corpus is loaded and indexed (cheap while the cache is fresh).
+    """
+    with metrics.timer("policy_load"):
+        return get_policy_index()
+
+
+def retrieve_policy_chunks(extracted_info: dict, index=None,
+                           token_budget: int = POLICY_CONTEXT_TOKEN_BUDGET,
+                           max_chunks: int = POLICY_CONTEXT_MAX_CHUNKS) -> list:
+    """
+    Return the PolicyChunks most relevant to the extracted claim: the sections
+    of the claim's own policy first, then related sections, within token_budget.
+    """
+    if index is None:
+        index = load_policy_index()
+
+    print("[RAG] Searching policy index...")
+    policy_number = extracted_info.get("policy_number")
+    query_text = f"{policy_number or ''} {extracted_info.get('incident_description') or ''}"
+    with metrics.timer("retrieval"):
+        chunks = index.retrieve(policy_number, query_text, token_budget=token_budget, max_chunks=max_chunks)
+    metrics.inc("policy_exact_match_total", outcome="hit" if index.sections_for(policy_number) else "miss")
+    return chunks
+
+
+def retrieve_relevant_policies(extracted_info: dict, index=None, **kwargs) -> list:
+    """
+    Return the text of the policy sections most relevant to the extracted claim.
+    """
+    return [chunk.text for chunk in retrieve_policy_chunks(extracted_info, index, **kwargs)]
+
+
+def shared_policy_count(extracted_info: dict, chunks: list) -> int:
+    """
+    How many of the leading chunks are sections of the claim's own policy:
+    the part of the policy context every claim under that policy shares.
+    """
+    policy_id = normalize_policy_id(extracted_info.get("policy_number"))
+    count = 0
+    for chunk in chunks:
+        if policy_id is None or policy_id not in (chunk.policy_id, policy_id_from_key(chunk.key or "")):
+            break
+        count += 1
+    return count
+
+
+def build_summary_prompt(extracted_info: dict, relevant_policies: list, shared_policies: int = 0) -> Prompt:
+    """
+    The summary prompt. The first shared_policies snippets (the claim's own
+    policy, see shared_policy_count) form the cacheable policy block; the
+    rest go in the uncached block after it. Without an exact policy match
+    there is no policy block, since a prefix unique to the claim would pay
+    the cache-write premium and never be read back.
+    """
+    if not relevant_policies:
+        shared, related = ["No matching policy snippets found."], []
+    else:
+        shared, related = relevant_policies[:shared_policies], relevant_policies[shared_policies:]
+    return prompt_manager.get_prompt(
         "generate_summary",
         extracted_info=json.dumps(extracted_info, indent=2),
-        policy_text=policy_text,
+        policy_text="\n\n---\n\n".join(shared),
+        related_policy_text="\n\n---\n\n".join(related),
     )
 
-    print("[LLM] Calling summary model...")
-    summary = summary_invoker.invoke(
-        prompt=summary_prompt,
-        model_id=SUMMARY_MODEL_ID,
-        temperature=0.3,
-        max_tokens=600,
-    )
 
+def build_result(key: str, extracted_info: dict, summary: str, chunks: list,
+                 fingerprint: dict = None, extract_model_id: str = None, summary_model_id: str = None) -> dict:
+    """
+    The result JSON. The policy sections in chunks are stored as references
+    (policy_snippet_refs) in compact mode and as text (policy_snippets) otherwise.
+    """
     result = {
         "claim_key": key,
         "extracted_info": extracted_info,
         "summary": summary,
-        "policy_snippets": relevant_policies,
-        "extract_model_id": DOC_EXTRACT_MODEL_ID,
-        "summary_model_id": SUMMARY_MODEL_ID,
+        **policy_snippets_field(chunks),
+        "extract_model_id": extract_model_id or DOC_EXTRACT_MODEL_ID,
+        "summary_model_id": summary_model_id or SUMMARY_MODEL_ID,
     }
+    if fingerprint is not None:
+        result["fingerprint"] = fingerprint
+    return result
 
-    # 4) Write result to outputs/
-    base_name = key.replace(CLAIMS_PREFIX, "").rsplit(".", 1)[0]
-    out_key = f"{OUTPUTS_PREFIX}{base_name}_result.json"
+
+def write_result(key: str, result: dict) -> str:
+    """
+    Save the result JSON to outputs/ (compact or pretty, see encode_result)
+    and return its key.
+    """
+    out_key = output_key_for(key)
 
     print(f"[WRITE] s3://{CLAIM_BUCKET}/{out_key}")
-    s3.put_object(
-        Bucket=CLAIM_BUCKET,
-        Key=out_key,
-        Body=json.dumps(result, indent=2).encode("utf-8"),
-        ContentType="application/json",
-    )
+    with metrics.timer("output_write"):
+        body, encoding_args = encode_result(result)
+        response = s3.put_object(
+            Bucket=CLAIM_BUCKET,
+            Key=out_key,
+            Body=body,
+            ContentType="application/json",
+            **encoding_args,
+        )
+    output_listing_cache.invalidate()
+    if RESULTS_INDEX_ENABLED:
+        # The S3 file is the source of truth; a failed index write is fixed by the next backfill
+        try:
+            results_index.record(out_key, result, (response or {}).get("ETag"))
+        except Exception as e:
+            print(f"[WARN] Failed to index {out_key}: {e!r}")
+    return out_key
+
+
+def process_claim_document(key: str, background_write: bool = PIPELINE_BACKGROUND_WRITES) -> dict:
+    """
+    Main processing function:
+
+    1) Load claim text from S3
+    2) Extract structured info with Bedrock
+    3) Retrieve relevant policy snippets (simple RAG)
+    4) Generate a concise summary with Bedrock
+    5) Save result JSON to outputs/ and return it
+
+    Loading the policy corpus overlaps with fetching and extracting the claim.
+    With background_write=True the S3 write is not awaited; use
+    run_claim_pipeline() to get the write's completion future.
+    """
+    return run_claim_pipeline(key, background_write=background_write)[0]
+
+
+def run_claim_pipeline(key: str, background_write: bool = False):
+    """
+    Run the pipeline and return (result, write_future). write_future resolves
+    to the output key; it is already done unless background_write is set, in
+    which case the claim is counted (and a failed write logged) when it finishes.
+    """
+    print(f"[PROCESS] Claim document: s3://{CLAIM_BUCKET}/{key}")
+    try:
+        with metrics.timer("total"):
+            result = _run_pipeline(key)
+
+            # 5) Write result to outputs/; a background write is counted when it finishes
+            write_future = write_executor.submit(write_result, key, result)
+            if background_write:
+                write_future.add_done_callback(functools.partial(_count_background_write, key))
+            else:
+                write_future.result()
+    except Exception:
+        metrics.inc("claims_processed_total", status="failed")
+        raise
+
+    if not background_write:
+        metrics.inc("claims_processed_total", status="succeeded")
 
     print("[DONE] Processing complete.")
-    return result
+    return result, write_future
+
+
+def _count_background_write(key: str, write_future) -> None:
+    # The claim only succeeded once its result is in S3; nobody else sees a failed background write
+    error = write_future.exception()
+    if error is not None:
+        print(f"[ERROR] Failed to write the result for {key}: {error!r}")
+        metrics.inc("claims_processed_total", status="failed")
+    else:
+        metrics.inc("claims_processed_total", status="succeeded")
+
+
+def summarize_claim(extracted_info: dict, relevant_policies: list, route=None, shared_policies: int = 0) -> Summary:
+    """
+    Generate the summary with the model chosen for the claim (see
+    routing.choose_summary_model), unless route is given.
+    """
+    route = route or choose_summary_model(extracted_info)
+    summary_prompt = build_summary_prompt(extracted_info, relevant_policies, shared_policies)
+
+    print(f"[LLM] Calling summary model {route.model_id} ({route.reason})...")
+    started = time.perf_counter()
+    with track_usage() as usage, metrics.timer("summary_invoke"):
+        text = summary_invoker.invoke(
+            prompt=summary_prompt,
+            model_id=route.model_id,
+            temperature=SUMMARY_TEMPERATURE,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            use_cache=False,
+        )
+    route_stats.record("summary", route.model_id, route.reason, time.perf_counter() - started, usage)
+    return Summary(text, route.model_id)
+
+
+def _run_pipeline(key: str) -> dict:
+    # fetch -> extract --+
+    #                    +--> retrieve -> summarize
+    # policy_index ------+
+    stages = run_stage_graph({
+        "fetch": ((), lambda: fetch_claim_document(key)),
+        "policy_index": ((), load_policy_index),
+        "extract": (("fetch",), lambda document: extract_claim(document.text)),
+        "retrieve": (("extract", "policy_index"),
+                     lambda extraction, index: retrieve_policy_chunks(extraction.fields, index)),
+        "summarize": (("extract", "retrieve"),
+                      lambda extraction, chunks: summarize_claim(
+                          extraction.fields, [chunk.text for chunk in chunks],
+                          shared_policies=shared_policy_count(extraction.fields, chunks))),
+    })
+    extraction = stages["extract"]
+    summary = stages["summarize"]
+    chunks = stages["retrieve"]
+    fingerprint = build_fingerprint(stages["fetch"], extraction.fields, chunks,
+                                    models={"extract": extraction.model_id, "summary": summary.model_id})
+    return build_result(key, extraction.fields, summary.text, chunks, fingerprint,
+                        extract_model_id=extraction.model_id, summary_model_id=summary.model_id)
+
+
+def stream_claim_document(key: str):
+    """
+    Same pipeline as process_claim_document, but as a generator of
+    (event, data) tuples so callers can show each stage as soon as it is ready:
+
+    ("status", {...})          stage started
+    ("extracted", dict)        validated extraction result
+    ("policies", list)         retrieved policy snippets
+    ("summary_delta", str)     summary text as the model streams it
+    ("result", dict)           final result, after it was written to S3
+    """
+    print(f"[PROCESS] Streaming claim document: s3://{CLAIM_BUCKET}/{key}")
+    # Warm the policy index while the claim is fetched and extracted
+    policy_index_future = stage_executor.submit(load_policy_index)
+
+    yield "status", {"stage": "fetch", "claim_key": key}
+    document = fetch_claim_document(key)
+
+    yield "status", {"stage": "extract"}
+    extraction = extract_claim(document.text)
+    extracted_info = extraction.fields
+    yield "extracted", extracted_info
+
+    yield "status", {"stage": "retrieve"}
+    chunks = retrieve_policy_chunks(extracted_info, policy_index_future.result())
+    relevant_policies = [chunk.text for chunk in chunks]
+    yield "policies", relevant_policies
+
+    yield "status", {"stage": "summarize"}
+    summary_prompt = build_summary_prompt(extracted_info, relevant_policies,
+                                          shared_policy_count(extracted_info, chunks))
+    route = choose_summary_model(extracted_info)
+    print(f"[LLM] Streaming summary model {route.model_id} ({route.reason})...")
+    summary_parts = []
+    summary_started = time.perf_counter()
+    with track_usage() as usage:
+        for delta in summary_invoker.invoke_stream(
+            prompt=summary_prompt,
+            model_id=route.model_id,
+            temperature=SUMMARY_TEMPERATURE,
+            max_tokens=SUMMARY_MAX_TOKENS,
+        ):
+            summary_parts.append(delta)
+            yield "summary_delta", delta
+    # Measured across the stream, so it includes time the consumer spent between tokens
+    summary_seconds = time.perf_counter() - summary_started
+    metrics.observe("claim_stage_seconds", summary_seconds, stage="summary_invoke")
+    route_stats.record("summary", route.model_id, route.reason, summary_seconds, usage)
+
+    models = {"extract": extraction.model_id, "summary": route.model_id}
+    result = build_result(key, extracted_info, "".join(summary_parts), chunks,
+                          build_fingerprint(document, extracted_info, chunks, models=models),
+                          extract_model_id=extraction.model_id, summary_model_id=route.model_id)
+
+    yield "status", {"stage": "write"}
+    out_key = write_result(key, result)
+    print("[DONE] Processing complete.")
+    yield "result", dict(result, output_key=out_key)
 
 
 if __name__ == "__main__":
@@ -123,10 +470,22 @@ if __name__ == "__main__":
         # Run web interface
         print("[START] Starting web interface on http://localhost:8000")
         os.system("cd web && python app.py")
+    elif len(sys.argv) > 1 and sys.argv[1] == "ingest":
+        # Process new claims continuously: python -m src.app ingest [--source poll|events] [--once]
+        from .ingest import main as ingest_main
+        sys.exit(ingest_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "batch":
+        # Process many claims concurrently: python -m src.app batch [keys...] [--prefix ...] [--workers N]
+        from .batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "batch-inference":
+        # Bulk backlogs through Bedrock batch jobs: python -m src.app batch-inference run|export|import ...
+        from .batch_inference import main as batch_inference_main
+        sys.exit(batch_inference_main(sys.argv[2:]))
     else:
         # Run command line interface
         try:
-            claim_key = f"{CLAIMS_PREFIX}sample_claim1.txt"
+            claim_key = sys.argv[1] if len(sys.argv) > 1 else f"{CLAIMS_PREFIX}sample_claim1.txt"
             print(f"[START] Running claim processor for {claim_key}")
             result = process_claim_document(claim_key)
             print("[RESULT]")
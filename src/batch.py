@@ -0,0 +1,185 @@
+# Concurrent batch processing of many claim documents
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .config import (
+    CLAIM_BUCKET,
+    CLAIMS_PREFIX,
+    BATCH_MAX_WORKERS,
+    BATCH_THROTTLE_RETRY_PASSES,
+    BATCH_THROTTLE_COOLDOWN_SECONDS,
+)
+from .app import s3, process_claim_document, output_key_for
+from .rag import get_policy_index
+from .cache import response_cache
+from .metrics import metrics
+from .models import BedrockThrottlingError
+from .limiter import limiter_stats
+from .incremental import reprocess_reason
+from .routing import route_stats
+
+
+def list_claim_etags(prefix: str = CLAIMS_PREFIX) -> dict:
+    """
+    {key: ETag} for every claim document under the prefix (all pages, folders skipped).
+    """
+    etags = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=CLAIM_BUCKET, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].endswith("/"):
+                etags[obj["Key"]] = obj.get("ETag")
+    return etags
+
+
+def list_claim_keys(prefix: str = CLAIMS_PREFIX) -> list:
+    """
+    List every claim document under the prefix (all pages, folders skipped).
+    """
+    return list(list_claim_etags(prefix))
+
+
+def _process_one(key: str, process, check=None) -> dict:
+    started = time.perf_counter()
+    reason = None
+    if check is not None:
+        try:
+            reason = check(key)
+        except Exception as e:
+            reason = f"check failed: {e!r}"
+        if reason is None:
+            metrics.inc("incremental_total", outcome="skipped")
+            return {
+                "claim_key": key,
+                "status": "skipped",
+                "output_key": output_key_for(key),
+                "elapsed_seconds": round(time.perf_counter() - started, 3),
+            }
+        metrics.inc("incremental_total", outcome="processed")
+    try:
+        process(key)
+    except BedrockThrottlingError as e:
+        # Not a bad document: Bedrock quota ran out; the batch retries these later
+        return {
+            "claim_key": key,
+            "status": "throttled",
+            "error": repr(e),
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+        }
+    except Exception as e:
+        return {
+            "claim_key": key,
+            "status": "failed",
+            "error": repr(e),
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+        }
+    outcome = {
+        "claim_key": key,
+        "status": "succeeded",
+        "output_key": output_key_for(key),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+    if reason is not None:
+        outcome["reason"] = reason
+    return outcome
+
+
+def process_claims_batch(keys=None, prefix: str = CLAIMS_PREFIX, max_workers: int = BATCH_MAX_WORKERS,
+                         process=process_claim_document, throttle_retry_passes: int = BATCH_THROTTLE_RETRY_PASSES,
+                         throttle_cooldown: float = BATCH_THROTTLE_COOLDOWN_SECONDS,
+                         incremental: bool = False) -> dict:
+    """
+    Process many claims concurrently with a bounded thread pool.
+
+    Either pass explicit keys or a prefix to list. Workers share the module-level
+    S3/Bedrock clients and the policy corpus cache. A failing claim is recorded
+    in the report and never aborts the rest of the run. Claims that ran out of
+    Bedrock quota are retried in up to throttle_retry_passes later passes,
+    after a cool-down.
+
+    With incremental=True, claims whose stored result fingerprint still
+    matches (see incremental.reprocess_reason) are skipped; the ETags from the
+    listing spare a fetch of every unchanged claim.
+    """
+    etags = {}
+    if keys is None:
+        etags = list_claim_etags(prefix)
+        keys = list(etags)
+    keys = list(keys)
+    print(f"[BATCH] {len(keys)} claims, {max_workers} workers{' (incremental)' if incremental else ''}")
+
+    def check(key):
+        return reprocess_reason(key, listed_etag=etags.get(key))
+
+    # Load the policy corpus once up front instead of having every worker wait on it
+    get_policy_index()
+
+    started = time.perf_counter()
+    outcomes = {}
+    pending = keys
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for batch_pass in range(throttle_retry_passes + 1):
+            if batch_pass:
+                print(f"[BATCH] {len(pending)} claims throttled; retrying in {throttle_cooldown}s "
+                      f"(pass {batch_pass}/{throttle_retry_passes})")
+                time.sleep(throttle_cooldown)
+            futures = [pool.submit(_process_one, key, process, check if incremental else None)
+                       for key in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                outcome = future.result()
+                outcomes[outcome["claim_key"]] = outcome
+                print(f"[BATCH] {outcome['status'].upper()} {outcome['claim_key']} ({done}/{len(pending)})")
+            pending = [key for key in pending if outcomes[key]["status"] == "throttled"]
+            if not pending:
+                break
+    elapsed = time.perf_counter() - started
+
+    claims = sorted(outcomes.values(), key=lambda c: c["claim_key"])
+    statuses = [c["status"] for c in claims]
+    return {
+        "total": len(keys),
+        "succeeded": statuses.count("succeeded"),
+        "skipped": statuses.count("skipped"),
+        "failed": statuses.count("failed"),
+        # Still out of Bedrock quota after the retry passes: not processed, but nothing wrong with them
+        "throttled": statuses.count("throttled"),
+        "elapsed_seconds": round(elapsed, 3),
+        "claims_per_second": round(len(keys) / elapsed, 3) if elapsed > 0 else None,
+        "response_cache": response_cache.stats(),
+        "bedrock_limiters": limiter_stats(),
+        "model_routes": route_stats.summary(),
+        "metrics": metrics.summary(),
+        "claims": claims,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Process many claim documents concurrently.")
+    parser.add_argument("keys", nargs="*", help="Claim keys to process (default: everything under --prefix)")
+    parser.add_argument("--prefix", default=CLAIMS_PREFIX, help="S3 prefix to list when no keys are given")
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS, help="Concurrent claims")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip claims whose stored result is still up to date")
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = process_claims_batch(keys=args.keys or None, prefix=args.prefix, max_workers=args.workers,
+                                  incremental=args.incremental)
+
+    print(f"[BATCH] Done: {report['succeeded']} succeeded, {report['skipped']} skipped, {report['failed']} failed, "
+          f"{report['throttled']} throttled in {report['elapsed_seconds']}s ({report['claims_per_second']} claims/s)")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[BATCH] Report written to {args.report}")
+    # 1: some claims failed; 2: none failed but some are still throttled and can simply be rerun
+    if report["failed"]:
+        return 1
+    return 2 if report["throttled"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,516 @@
+# Offline Bedrock batch inference: export prompts as JSONL, import model outputs, write results
+
+import argparse
+import json
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from .app import (
+    ClaimDocument,
+    build_extract_prompt,
+    build_result,
+    build_summary_prompt,
+    extract_tool,
+    fast_path_fields,
+    fetch_claim_document,
+    load_policy_index,
+    retrieve_policy_chunks,
+    run_extraction_cascade,
+    s3,
+    shared_policy_count,
+    summarize_claim,
+    write_result,
+)
+from .batch import list_claim_keys
+from .chunking import PolicyChunk
+from .clients import LazyClient, clients
+from .config import (
+    BATCH_INFERENCE_LOCAL_WORKERS,
+    BATCH_INFERENCE_MIN_RECORDS,
+    BATCH_INFERENCE_POLL_SECONDS,
+    BATCH_INFERENCE_ROLE_ARN,
+    BATCH_INFERENCE_S3_PREFIX,
+    BATCH_INFERENCE_WORK_DIR,
+    BATCH_MAX_WORKERS,
+    CLAIM_BUCKET,
+    CLAIMS_PREFIX,
+    DOC_EXTRACT_MODEL_ID,
+    EXTRACT_MAX_TOKENS,
+    EXTRACT_TEMPERATURE,
+    SUMMARY_MAX_TOKENS,
+    SUMMARY_MODEL_ID,
+    SUMMARY_TEMPERATURE,
+)
+from .fingerprints import build_fingerprint
+from .metrics import metrics
+from .models import BedrockModelInvoker
+from .routing import SummaryRoute, choose_summary_model, route_stats
+
+bedrock = LazyClient("bedrock")
+
+# Terminal states of a model invocation job
+JOB_DONE_STATES = {"Completed", "PartiallyCompleted"}
+JOB_FAILED_STATES = {"Failed", "Stopped", "Expired"}
+
+
+def record_id(index: int) -> str:
+    # Bedrock expects 11-character alphanumeric record IDs
+    return f"R{index:010d}"
+
+
+def write_records(path: str, records) -> int:
+    """
+    Write {"recordId", "modelInput"} lines; returns the number written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    count = 0
+    with open(path, "w") as f:
+        for rid, body in records:
+            f.write(json.dumps({"recordId": rid, "modelInput": json.loads(body)}) + "\n")
+            count += 1
+    return count
+
+
+def read_outputs(path: str, model_id: str) -> dict:
+    """
+    {recordId: model text or None} from a batch output file. Records the job
+    reported as errors map to None; unreadable lines are skipped.
+    """
+    outputs = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("error") or "modelOutput" not in record:
+                outputs[record.get("recordId")] = None
+            else:
+                outputs[record.get("recordId")] = BedrockModelInvoker.parse_body(record["modelOutput"], model_id)
+    return outputs
+
+
+class LocalBatchRunner:
+    """
+    Turns a batch input JSONL file into an output JSONL file by invoking each
+    record's modelInput through the bedrock-runtime client, in the same format
+    a batch job produces. Used for small phases (below Bedrock's minimum job
+    size) and, with a stand-in client, to run the whole flow offline.
+    """
+
+    def __init__(self, client=None, workers: int = BATCH_INFERENCE_LOCAL_WORKERS):
+        self._client = client
+        self.workers = workers
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else clients.get("bedrock-runtime")
+
+    def _invoke(self, model_id: str, record: dict) -> dict:
+        try:
+            response = self.client.invoke_model(modelId=model_id, body=json.dumps(record["modelInput"]))
+            record["modelOutput"] = json.loads(response["body"].read())
+        except Exception as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code", type(e).__name__)
+            record["error"] = {"errorCode": code, "errorMessage": str(e)}
+        return record
+
+    def run(self, input_path: str, output_path: str, model_id: str) -> str:
+        with open(input_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(lambda record: self._invoke(model_id, record), records))
+        with open(output_path, "w") as f:
+            for record in results:
+                f.write(json.dumps(record) + "\n")
+        return output_path
+
+
+class BedrockBatchJobRunner:
+    """
+    Runs an input JSONL file as a Bedrock model invocation job: upload it to
+    S3, create the job, poll until it finishes and download the output file.
+    Files with fewer than min_records records go to the fallback runner,
+    since Bedrock rejects jobs that small.
+    """
+
+    def __init__(self, role_arn: str = BATCH_INFERENCE_ROLE_ARN, bucket: str = CLAIM_BUCKET,
+                 prefix: str = BATCH_INFERENCE_S3_PREFIX, poll_seconds: float = BATCH_INFERENCE_POLL_SECONDS,
+                 min_records: int = BATCH_INFERENCE_MIN_RECORDS, fallback=None):
+        if not role_arn:
+            raise ValueError("A service role ARN is required (set BATCH_INFERENCE_ROLE_ARN)")
+        self.role_arn = role_arn
+        self.bucket = bucket
+        self.prefix = prefix
+        self.poll_seconds = poll_seconds
+        self.min_records = min_records
+        self.fallback = fallback or LocalBatchRunner()
+
+    def run(self, input_path: str, output_path: str, model_id: str) -> str:
+        with open(input_path) as f:
+            count = sum(1 for line in f if line.strip())
+        if count < self.min_records:
+            print(f"[BATCH-INF] {count} records is below the job minimum of {self.min_records}; invoking on demand")
+            return self.fallback.run(input_path, output_path, model_id)
+
+        name = os.path.basename(input_path)
+        run_prefix = f"{self.prefix}{os.path.basename(os.path.dirname(input_path))}/"
+        input_key = f"{run_prefix}input/{name}"
+        output_prefix = f"{run_prefix}output/"
+        s3.upload_file(input_path, self.bucket, input_key)
+
+        job_name = f"claims-{os.path.splitext(name)[0]}-{uuid.uuid4().hex[:8]}".replace("_", "-")
+        job_arn = bedrock.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=model_id,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": f"s3://{self.bucket}/{input_key}",
+                                                   "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"s3://{self.bucket}/{output_prefix}"}},
+        )["jobArn"]
+        print(f"[BATCH-INF] Started job {job_arn} ({count} records)")
+
+        while True:
+            job = bedrock.get_model_invocation_job(jobIdentifier=job_arn)
+            status = job["status"]
+            if status in JOB_DONE_STATES:
+                break
+            if status in JOB_FAILED_STATES:
+                raise RuntimeError(f"Batch job {job_arn} ended as {status}: {job.get('message', '')}")
+            time.sleep(self.poll_seconds)
+
+        # Outputs land under <output prefix>/<job id>/<input file name>.out
+        job_id = job_arn.rsplit("/", 1)[-1]
+        s3.download_file(self.bucket, f"{output_prefix}{job_id}/{name}.out", output_path)
+        print(f"[BATCH-INF] Job {job_arn} {status}")
+        return output_path
+
+
+class BatchInferenceRun:
+    """
+    One offline run over many claims, kept in a work directory so each phase
+    can be run (and re-run) separately:
+
+    export          fetch the claims, parse intake forms on the fast path and
+                    write extract_input.jsonl for everything else
+    import extract  validate the extraction outputs, retrieve policy sections
+                    and write summary_input.jsonl
+    import summary  build and write every claim's result, exactly as the
+                    on-demand pipeline would
+
+    Records that are missing from an output file or came back as errors are
+    invoked on demand, so a partially completed job still yields every result.
+    Batch jobs cover the first routing tier (DOC_EXTRACT_MODEL_ID and
+    SUMMARY_MODEL_ID); escalations are invoked on demand.
+    """
+
+    def __init__(self, run_dir: str):
+        self.run_dir = run_dir
+        self.manifest_path = os.path.join(run_dir, "manifest.json")
+        self.manifest = None
+
+    @classmethod
+    def create(cls, work_dir: str = BATCH_INFERENCE_WORK_DIR, run_id: str = None) -> "BatchInferenceRun":
+        run_id = run_id or time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        run = cls(os.path.join(work_dir, run_id))
+        run.manifest = {"run_id": run_id, "phase": "new", "claims": {}}
+        return run
+
+    def load(self) -> "BatchInferenceRun":
+        with open(self.manifest_path) as f:
+            self.manifest = json.load(f)
+        return self
+
+    def save(self) -> None:
+        os.makedirs(self.run_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def phase(self) -> str:
+        return self.manifest["phase"]
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.run_dir, name)
+
+    def claims(self) -> list:
+        """
+        (key, manifest entry) for every claim still in the run, in key order;
+        claims that failed during export are left out.
+        """
+        return sorted((key, entry) for key, entry in self.manifest["claims"].items() if "error" not in entry)
+
+    @staticmethod
+    def _export_claim(index: int, key: str) -> tuple:
+        """
+        (key, manifest entry, extraction request body or None) for one claim.
+        A claim that can't be fetched or parsed gets an "error" entry instead.
+        """
+        entry = {"record_id": record_id(index)}
+        try:
+            document = fetch_claim_document(key)
+        except Exception as e:
+            print(f"[BATCH-INF] Skipping {key}: {e!r}")
+            metrics.inc("claims_processed_total", status="failed")
+            entry["error"] = repr(e)
+            return key, entry, None
+        entry.update(etag=document.etag, sha256=document.sha256)
+        fields = fast_path_fields(document.text)
+        if fields is not None:
+            entry["extracted"] = fields
+            return key, entry, None
+        body = BedrockModelInvoker.build_body(build_extract_prompt(document.text), DOC_EXTRACT_MODEL_ID,
+                                              EXTRACT_TEMPERATURE, EXTRACT_MAX_TOKENS, tool=extract_tool)
+        return key, entry, body
+
+    def export(self, keys) -> str:
+        """
+        Write the extraction prompts for every claim the fast path can't parse.
+        Returns the input file's path.
+
+        Records are written as claims are fetched, with a bounded number in
+        flight, so the documents are never all in memory. Claims that fail to
+        fetch or parse are recorded in the manifest with their error and left
+        out of the later phases.
+        """
+        keys = sorted(set(keys))
+        claims = self.manifest["claims"]
+        window = 2 * BATCH_MAX_WORKERS
+
+        def collect(futures):
+            for future in futures:
+                key, entry, body = future.result()
+                claims[key] = entry
+                if body is not None:
+                    yield entry["record_id"], body
+
+        def records():
+            with ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS) as pool:
+                pending = set()
+                for index, key in enumerate(keys):
+                    if len(pending) >= window:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        yield from collect(done)
+                    pending.add(pool.submit(self._export_claim, index, key))
+                yield from collect(as_completed(pending))
+
+        input_path = self.path("extract_input.jsonl")
+        count = write_records(input_path, records())
+        failed = sum(1 for entry in claims.values() if "error" in entry)
+        self.manifest["phase"] = "extract"
+        self.save()
+        print(f"[BATCH-INF] {count} extraction records, {len(keys) - count - failed} claims on the fast path, "
+              f"{failed} failed -> {input_path}")
+        return input_path
+
+    @staticmethod
+    def _per_claim(phase: str, step):
+        """
+        Wrap a per-claim import step so a claim it fails for gets an "error"
+        entry (and is counted as failed) instead of aborting the whole phase.
+        """
+        def run(item):
+            key, entry = item
+            try:
+                return step(item)
+            except Exception as e:
+                print(f"[BATCH-INF] {key} failed during the {phase} import: {e!r}")
+                metrics.inc("claims_processed_total", status="failed")
+                entry["error"] = repr(e)
+                return None
+
+        return run
+
+    def _batch_answer(self, outputs: dict, entry: dict, phase: str):
+        """
+        The record's model text from the output file, or None (after logging
+        why) when it has to be invoked on demand instead.
+        """
+        text = outputs.get(entry["record_id"])
+        if text is not None:
+            metrics.inc("batch_inference_records_total", phase=phase, outcome="ok")
+            return text
+        outcome = "missing" if entry["record_id"] not in outputs else "error"
+        metrics.inc("batch_inference_records_total", phase=phase, outcome=outcome)
+        print(f"[BATCH-INF] Record {entry['record_id']} {outcome}; invoking on demand")
+        return None
+
+    def import_extract(self, output_path: str) -> str:
+        """
+        Ingest the extraction outputs, retrieve policy context and write the
+        summary prompts. Returns the summary input file's path.
+
+        Outputs the routing rejects are escalated on demand through the rest
+        of the extraction cascade. Only claims routed to SUMMARY_MODEL_ID are
+        exported for the summary job; escalated summaries run on demand. A
+        claim that fails here gets an "error" entry and is left out of the summary phase.
+        """
+        outputs = read_outputs(output_path, DOC_EXTRACT_MODEL_ID) if output_path else {}
+        index = load_policy_index()
+
+        def prepare(item):
+            key, entry = item
+            if "extracted" not in entry:
+                # Only rebuilt (refetching the claim) if a model has to be invoked on demand
+                def prompt():
+                    return build_extract_prompt(fetch_claim_document(key).text)
+
+                extraction = run_extraction_cascade(prompt, first_answer=self._batch_answer(outputs, entry, "extract"))
+                entry["extracted"] = extraction.fields
+                entry["extract_model"] = extraction.model_id
+
+            chunks = retrieve_policy_chunks(entry["extracted"], index)
+            entry["chunks"] = [list(chunk) for chunk in chunks]
+            route = choose_summary_model(entry["extracted"])
+            entry["summary_route"] = list(route)
+            if route.model_id != SUMMARY_MODEL_ID:
+                return None
+            prompt = build_summary_prompt(entry["extracted"], [chunk.text for chunk in chunks],
+                                          shared_policy_count(entry["extracted"], chunks))
+            return entry["record_id"], BedrockModelInvoker.build_body(prompt, SUMMARY_MODEL_ID, SUMMARY_TEMPERATURE,
+                                                                      SUMMARY_MAX_TOKENS)
+
+        # On-demand escalations and fallbacks run in parallel
+        with ThreadPoolExecutor(max_workers=BATCH_INFERENCE_LOCAL_WORKERS) as pool:
+            records = [record for record in pool.map(self._per_claim("extract", prepare), self.claims()) if record]
+
+        input_path = self.path("summary_input.jsonl")
+        write_records(input_path, records)
+        self.manifest["phase"] = "summary"
+        self.save()
+        print(f"[BATCH-INF] {len(records)} summary records -> {input_path}")
+        return input_path
+
+    def import_summary(self, output_path: str) -> list:
+        """
+        Ingest the summary outputs and write every claim's result. Returns the
+        output keys; a claim whose summary or write fails gets an "error" entry instead.
+        """
+        outputs = read_outputs(output_path, SUMMARY_MODEL_ID) if output_path else {}
+
+        def finish(item):
+            key, entry = item
+            extracted_info = entry["extracted"]
+            chunks = [PolicyChunk(*chunk) for chunk in entry["chunks"]]
+            relevant_policies = [chunk.text for chunk in chunks]
+            route = SummaryRoute(*entry["summary_route"])
+
+            text = None
+            if route.model_id == SUMMARY_MODEL_ID:
+                text = self._batch_answer(outputs, entry, "summary")
+            if text is None:
+                text = summarize_claim(extracted_info, relevant_policies, route,
+                                       shared_policies=shared_policy_count(extracted_info, chunks)).text
+            else:
+                route_stats.record("summary", route.model_id, route.reason)
+
+            document = ClaimDocument(key, None, entry["etag"], entry["sha256"])
+            models = {"extract": entry.get("extract_model"), "summary": route.model_id}
+            fingerprint = build_fingerprint(document, extracted_info, chunks, models=models)
+            out_key = write_result(key, build_result(key, extracted_info, text, chunks, fingerprint,
+                                                     extract_model_id=entry.get("extract_model"),
+                                                     summary_model_id=route.model_id))
+            metrics.inc("claims_processed_total", status="succeeded")
+            return out_key
+
+        with ThreadPoolExecutor(max_workers=BATCH_INFERENCE_LOCAL_WORKERS) as pool:
+            claims = self.claims()
+            out_keys = [out_key for out_key in pool.map(self._per_claim("summary", finish), claims) if out_key]
+
+        self.manifest["phase"] = "done"
+        self.save()
+        print(f"[BATCH-INF] Wrote {len(out_keys)} results, {len(claims) - len(out_keys)} failed")
+        return out_keys
+
+    def import_outputs(self, output_path: str):
+        """
+        Import an output file for whichever phase the run is waiting on.
+        """
+        if self.phase == "extract":
+            return self.import_extract(output_path)
+        if self.phase == "summary":
+            return self.import_summary(output_path)
+        raise ValueError(f"Run {self.manifest['run_id']} has nothing to import (phase {self.phase})")
+
+
+def _run_phase(runner, input_path: str, output_path: str, model_id: str):
+    with open(input_path) as f:
+        if not any(line.strip() for line in f):
+            return None
+    return runner.run(input_path, output_path, model_id)
+
+
+def run_batch_inference(keys=None, prefix: str = CLAIMS_PREFIX, runner=None,
+                        work_dir: str = BATCH_INFERENCE_WORK_DIR) -> dict:
+    """
+    Process claims end to end through two batch phases (extraction, then
+    summaries). runner defaults to a LocalBatchRunner.
+    """
+    if keys is None:
+        keys = list_claim_keys(prefix)
+    runner = runner or LocalBatchRunner()
+    started = time.perf_counter()
+    run = BatchInferenceRun.create(work_dir)
+
+    extract_input = run.export(keys)
+    run.import_extract(_run_phase(runner, extract_input, run.path("extract_output.jsonl"), DOC_EXTRACT_MODEL_ID))
+    summary_input = run.path("summary_input.jsonl")
+    out_keys = run.import_summary(_run_phase(runner, summary_input, run.path("summary_output.jsonl"),
+                                             SUMMARY_MODEL_ID))
+    return {
+        "run_id": run.manifest["run_id"],
+        "run_dir": run.run_dir,
+        "total": len(out_keys),
+        "failed": {key: entry["error"] for key, entry in sorted(run.manifest["claims"].items()) if "error" in entry},
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "output_keys": out_keys,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Process claims through Bedrock batch inference.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Export, run both batch phases and write the results")
+    export_parser = commands.add_parser("export", help="Write the extraction JSONL for a new run")
+    for sub in (run_parser, export_parser):
+        sub.add_argument("keys", nargs="*", help="Claim keys (default: everything under --prefix)")
+        sub.add_argument("--prefix", default=CLAIMS_PREFIX)
+        sub.add_argument("--work-dir", default=BATCH_INFERENCE_WORK_DIR)
+    run_parser.add_argument("--runner", choices=["local", "bedrock"], default="bedrock",
+                            help="bedrock: model invocation jobs; local: invoke each record on demand")
+
+    import_parser = commands.add_parser("import", help="Import a batch output JSONL into a run")
+    import_parser.add_argument("run_dir")
+    import_parser.add_argument("output", nargs="?",
+                               help="Output JSONL for the phase the run is waiting on (omit if it had no records)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        runner = BedrockBatchJobRunner() if args.runner == "bedrock" else LocalBatchRunner()
+        report = run_batch_inference(keys=args.keys or None, prefix=args.prefix, runner=runner,
+                                     work_dir=args.work_dir)
+        print(f"[BATCH-INF] Done: {report['total']} results, {len(report['failed'])} failed "
+              f"in {report['elapsed_seconds']}s ({report['run_dir']})")
+        if report["failed"]:
+            return 1
+    elif args.command == "export":
+        run = BatchInferenceRun.create(args.work_dir)
+        print(run.export(args.keys or list_claim_keys(args.prefix)))
+    else:
+        run = BatchInferenceRun(args.run_dir).load()
+        result = run.import_outputs(args.output)
+        if isinstance(result, str):
+            print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
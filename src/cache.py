@@ -0,0 +1,178 @@
+# Content-addressed cache for Bedrock model responses
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import metrics
+from .config import (
+    RESPONSE_CACHE_MEMORY_ENTRIES,
+    RESPONSE_CACHE_DB_PATH,
+    RESPONSE_CACHE_MAX_DISK_BYTES,
+    RESPONSE_CACHE_MAX_AGE_SECONDS,
+)
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-memory LRU in front of an SQLite table.
+
+    Keys are SHA-256 hashes of (model_id, prompt, temperature, max_tokens[, tool]), so
+    identical requests share an entry no matter which invoker made them.
+    The disk tier is evicted by age and, least recently used first, by total size.
+    """
+
+    # Run the (comparatively expensive) disk eviction once every N writes
+    EVICT_EVERY = 64
+
+    def __init__(self, memory_entries: int = RESPONSE_CACHE_MEMORY_ENTRIES,
+                 db_path: str = RESPONSE_CACHE_DB_PATH,
+                 max_disk_bytes: int = RESPONSE_CACHE_MAX_DISK_BYTES,
+                 max_age_seconds: float = RESPONSE_CACHE_MAX_AGE_SECONDS):
+        self.memory_entries = memory_entries
+        self.db_path = db_path
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self._memory = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes_since_evict = 0
+
+    @staticmethod
+    def make_key(model_id: str, prompt: str, temperature: float, max_tokens: int, tool: dict = None) -> str:
+        key = [model_id, prompt, float(temperature), int(max_tokens)]
+        if tool is not None:
+            key.append(tool)
+        payload = json.dumps(key, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _connection(self):
+        # Opened lazily so importing the package never touches the filesystem
+        if self._db is None and self.db_path:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key: str, created_at: float, value: str) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """
+        Return the cached response text, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.max_age_seconds:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ? AND created_at > ?",
+                    (key, now - self.max_age_seconds),
+                ).fetchone()
+                if row is not None:
+                    db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    db.commit()
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            db = self._connection()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.EVICT_EVERY:
+                self._evict(db, now)
+            db.commit()
+
+    def _evict(self, db, now: float) -> None:
+        self._writes_since_evict = 0
+        db.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.max_age_seconds,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        excess = total - self.max_disk_bytes
+        freed = 0
+        doomed = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def evict(self) -> None:
+        """
+        Apply age- and size-based eviction to the disk tier now.
+        """
+        with self._lock:
+            db = self._connection()
+            if db is not None:
+                self._evict(db, time.time())
+                db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM responses")
+                db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "memory_entries": len(self._memory),
+            }
+
+
+response_cache = ResponseCache()
+metrics.register_gauge("response_cache_hits", lambda: response_cache.hits, "Bedrock response cache hits")
+metrics.register_gauge("response_cache_misses", lambda: response_cache.misses, "Bedrock response cache misses")
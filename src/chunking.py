@@ -0,0 +1,138 @@
+# Policy ID parsing and section-level chunking of policy documents
+
+import os
+import re
+from collections import namedtuple
+
+# The whole policy number, all segments: WD-100, HO-2024-001, POL-12345-A
+POLICY_ID_PATTERN = re.compile(r"\b([A-Z]{2,4}-\d[A-Z0-9]*(?:-[A-Z0-9]+)*)\b")
+
+# Section kinds, in the order they are offered to the summary model
+SECTION_ORDER = ("coverage", "limits", "deductible", "exclusions", "conditions")
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+_HEADING = re.compile(r"^\s*(exclusions?|limitations?|limits?|deductibles?|conditions?|coverage)\s*:\s*", re.IGNORECASE)
+_HEADING_KINDS = {
+    "exclusion": "exclusions",
+    "limitation": "limits",
+    "limit": "limits",
+    "deductible": "deductible",
+    "condition": "conditions",
+    "coverage": "coverage",
+}
+# Checked in order; the first match classifies a sentence outside a headed paragraph
+_SENTENCE_KINDS = (
+    ("deductible", re.compile(r"\bdeductible\b", re.IGNORECASE)),
+    ("exclusions", re.compile(r"\b(not covered|excluded|exclusions?)\b", re.IGNORECASE)),
+    ("limits", re.compile(r"\b(up to|limited to|maximum|no more than)\b", re.IGNORECASE)),
+    ("conditions", re.compile(r"\b(must|within \d+ days|documentation|required to)\b", re.IGNORECASE)),
+)
+
+PolicyChunk = namedtuple("PolicyChunk", ["policy_id", "section", "key", "text"])
+
+
+def estimate_tokens(text: str) -> int:
+    # Same four-characters-per-token rule the Bedrock limiter uses
+    return max(1, len(text) // 4)
+
+
+def normalize_policy_id(value) -> str:
+    """
+    Return the policy ID found in value ("wd-100", "Policy HO-2024-001") in canonical form, or None.
+    """
+    if not value:
+        return None
+    match = POLICY_ID_PATTERN.search(str(value).upper())
+    return match.group(1) if match else None
+
+
+def policy_id_from_key(key: str) -> str:
+    """
+    policies/policy_WD-100_water_damage.txt -> WD-100
+    """
+    parts = os.path.basename(key).split("_")
+    if len(parts) > 1:
+        return normalize_policy_id(parts[1])
+    return None
+
+
+def policy_id_from_text(text: str) -> str:
+    """
+    Policy ID from the document title ("Policy WD-100: Water Damage Coverage").
+    Only the first line is considered so cross-references in the body don't count.
+    """
+    first_line = text.strip().split("\n", 1)[0] if text else ""
+    return normalize_policy_id(first_line)
+
+
+def _heading_kind(text: str) -> str:
+    heading = _HEADING.match(text)
+    return _HEADING_KINDS[heading.group(1).lower().rstrip("s")] if heading else None
+
+
+def _classify(sentence: str) -> str:
+    for kind, pattern in _SENTENCE_KINDS:
+        if pattern.search(sentence):
+            return kind
+    return "coverage"
+
+
+def split_sections(text: str, policy_id: str = None, key: str = None) -> list:
+    """
+    Split a policy document into one PolicyChunk per section kind
+    (coverage, limits, deductible, exclusions, conditions).
+
+    Paragraphs that open with a heading ("Exclusions: ...") go to that section
+    whole; other sentences are classified by keyword, and an inline heading
+    ("Deductible: $500.") is dropped in favour of the section label. Each chunk repeats the
+    policy title so it reads on its own inside a prompt.
+    """
+    lines = text.strip().split("\n", 1)
+    title = lines[0].strip()
+    body = lines[1] if len(lines) > 1 else ""
+    if policy_id is None:
+        policy_id = policy_id_from_text(text) or policy_id_from_key(key or "")
+    if not body.strip():
+        # Single-line snippet: nothing to split
+        return [PolicyChunk(policy_id, "coverage", key, title)]
+
+    sentences = {}
+    for paragraph in re.split(r"\n\s*\n", body):
+        paragraph = " ".join(paragraph.split())
+        # A headed paragraph ("Exclusions: a; b. c.") belongs to that section as a whole
+        paragraph_kind = _heading_kind(paragraph)
+        for sentence in _SENTENCE_SPLIT.split(paragraph):
+            if not sentence:
+                continue
+            heading = _HEADING.match(sentence)
+            if heading:
+                kind = _heading_kind(sentence)
+                sentence = sentence[heading.end():]
+            else:
+                kind = paragraph_kind or _classify(sentence)
+            if sentence:
+                sentences.setdefault(kind, []).append(sentence)
+
+    return [
+        PolicyChunk(policy_id, kind, key, f"{title}\n{kind.capitalize()}: {' '.join(sentences[kind])}")
+        for kind in SECTION_ORDER
+        if kind in sentences
+    ]
+
+
+def fit_to_budget(chunks, token_budget: int, max_chunks: int = None) -> list:
+    """
+    Keep chunks in the given priority order while they fit in token_budget;
+    chunks that don't fit are skipped so smaller ones further down can still be used.
+    """
+    selected = []
+    used = 0
+    for chunk in chunks:
+        if max_chunks is not None and len(selected) >= max_chunks:
+            break
+        cost = estimate_tokens(chunk.text)
+        if used + cost > token_budget:
+            continue
+        selected.append(chunk)
+        used += cost
+    return selected
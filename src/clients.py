@@ -0,0 +1,112 @@
+# Shared, lazily created AWS clients
+
+import threading
+
+from .config import (
+    AWS_CLIENT_MAX_ATTEMPTS,
+    AWS_CONNECT_TIMEOUT,
+    AWS_MAX_POOL_CONNECTIONS,
+    AWS_READ_TIMEOUT,
+    AWS_REGION,
+    AWS_TCP_KEEPALIVE,
+)
+
+
+class ClientFactory:
+    """
+    One boto3 client per service for the whole process.
+
+    Clients are built on first use (boto3 itself is only imported then), from
+    a private session so concurrent first calls are safe, with a connection
+    pool sized for the pipeline's thread pools and TCP keep-alive enabled.
+    Clients are thread-safe, so every module and worker shares them.
+    set() swaps in a stand-in, e.g. the fakes in bench/.
+    """
+
+    def __init__(self, region_name: str = AWS_REGION, max_pool_connections: int = AWS_MAX_POOL_CONNECTIONS):
+        self.region_name = region_name
+        self.max_pool_connections = max_pool_connections
+        self._clients = {}
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _config(self, service: str):
+        from botocore.config import Config
+
+        return Config(
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=AWS_TCP_KEEPALIVE,
+            connect_timeout=AWS_CONNECT_TIMEOUT,
+            read_timeout=AWS_READ_TIMEOUT,
+            retries={"mode": "standard", "total_max_attempts": AWS_CLIENT_MAX_ATTEMPTS.get(service, 3)},
+        )
+
+    def get(self, service: str):
+        client = self._clients.get(service)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(service)
+            if client is None:
+                if self._session is None:
+                    import boto3
+
+                    self._session = boto3.session.Session(region_name=self.region_name)
+                client = self._session.client(service, config=self._config(service))
+                self._clients[service] = client
+            return client
+
+    def set(self, service: str, client) -> None:
+        """
+        Use client for service from now on (a local stand-in in tests and benchmarks).
+        """
+        with self._lock:
+            self._clients[service] = client
+
+    def close_connections(self) -> None:
+        """
+        Close every client's pooled connections; the clients stay usable and
+        reconnect on next use. Called before forking server workers so that
+        no child inherits (and shares) a live socket.
+        """
+        with self._lock:
+            current = list(self._clients.values())
+        for client in current:
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
+
+    def reset(self, service: str = None) -> None:
+        """
+        Drop one (or every) cached client; the next get() builds a fresh one.
+        """
+        with self._lock:
+            if service is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(service, None)
+
+
+class LazyClient:
+    """
+    Module-level stand-in for a boto3 client: every attribute lookup goes to
+    the factory's current client for the service, so nothing is created at
+    import time and an injected client reaches every module at once.
+    """
+
+    def __init__(self, service: str, factory: ClientFactory = None):
+        self._service = service
+        self._factory = factory
+
+    def __getattr__(self, name):
+        return getattr((self._factory or clients).get(self._service), name)
+
+    def __repr__(self):
+        return f"<LazyClient {self._service}>"
+
+
+clients = ClientFactory()
+
+
+def get_client(service: str):
+    return clients.get(service)
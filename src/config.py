@@ -1,5 +1,9 @@
 # Configuration settings for the Bedrock Insurance Claims POC
 
+import os
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 # S3 settings
 CLAIM_BUCKET = "claim-documents-poc-lm"  # Replace with your bucket name
 CLAIMS_PREFIX = "claims/"
@@ -9,3 +13,163 @@ POLICIES_PREFIX = "policies/"
 # Bedrock model IDs
 DOC_EXTRACT_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"  # Model for document extraction
 SUMMARY_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"      # Model for summary generation
+
+# Generation settings (shared by the on-demand and batch-inference paths)
+EXTRACT_TEMPERATURE = 0.0
+EXTRACT_MAX_TOKENS = 800
+EXTRACT_STRUCTURED_OUTPUT = True  # Force a schema-shaped tool call for extraction (Claude 3+ models)
+SUMMARY_TEMPERATURE = 0.3
+SUMMARY_MAX_TOKENS = 600
+
+# Model routing. Extraction tries DOC_EXTRACT_MODEL_ID first and escalates through
+# EXTRACT_ESCALATION_MODEL_IDS while the output has missing or malformed fields.
+EXTRACT_ESCALATION_MODEL_IDS = ["anthropic.claude-3-5-sonnet-20240620-v1:0"]
+# Summaries use SUMMARY_MODEL_ID unless the claim is large or complex
+SUMMARY_ESCALATION_MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+SUMMARY_ESCALATION_MIN_AMOUNT = 20000.0          # Claims at or above this amount
+SUMMARY_ESCALATION_MIN_DESCRIPTION_TOKENS = 150  # Or with an incident description this long
+# USD per 1,000 (input, output) tokens, for the per-route cost report
+MODEL_PRICES_PER_1K_TOKENS = {
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.00025, 0.00125),
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": (0.003, 0.015),
+}
+
+# Bedrock prompt caching: the static instructions and the policy context are sent as cache checkpoints
+PROMPT_CACHE_ENABLED = True
+# Model IDs containing one of these accept checkpoints; the default Claude 3 Haiku models don't, so
+# with the defaults no checkpoints are sent
+PROMPT_CACHE_MODEL_PATTERNS = [
+    "claude-3-5-haiku", "claude-3-7-sonnet", "claude-sonnet-4", "claude-opus-4", "claude-haiku-4",
+]
+PROMPT_CACHE_READ_PRICE_FACTOR = 0.1    # Cached input tokens are billed at this share of the input price
+PROMPT_CACHE_WRITE_PRICE_FACTOR = 1.25  # Tokens written to the cache at this multiple of it
+
+# Policy corpus cache
+POLICY_CACHE_TTL_SECONDS = 300   # How long a policy listing is trusted before re-checking S3
+POLICY_FETCH_WORKERS = 8         # Parallel get_object calls when (re)loading changed policies
+
+# Batch processing
+BATCH_MAX_WORKERS = 8  # Claims processed concurrently by src.batch
+BATCH_THROTTLE_RETRY_PASSES = 2        # Extra passes over claims that failed with BedrockThrottlingError
+BATCH_THROTTLE_COOLDOWN_SECONDS = 30   # Pause before each extra pass
+
+# Bedrock response cache
+RESPONSE_CACHE_MEMORY_ENTRIES = 1024                   # In-memory LRU tier size
+RESPONSE_CACHE_DB_PATH = os.path.join(PROJECT_ROOT, ".cache", "bedrock_responses.sqlite3")  # None disables the disk tier
+RESPONSE_CACHE_MAX_DISK_BYTES = 256 * 1024 * 1024      # Least recently used rows are evicted beyond this
+RESPONSE_CACHE_MAX_AGE_SECONDS = 7 * 24 * 3600         # Entries older than this are never served
+
+# Claim documents: PDF, DOCX, HTML and text are turned into text before extraction
+DOCUMENT_PARSE_WORKERS = min(4, os.cpu_count() or 1)  # Process pool for PDF/DOCX/HTML parsing; 0 parses in-thread
+DOCUMENT_POOL_MIN_BYTES = 32 * 1024                     # Smaller documents parse in-thread (cheaper than the IPC)
+DOCUMENT_READ_CHUNK_BYTES = 1024 * 1024                # S3 bodies are read (and hashed) in pieces this size
+DOCUMENT_SPOOL_BYTES = 16 * 1024 * 1024                # Larger documents are spooled to a temp file and parsed from disk
+DOCUMENT_MAX_BYTES = 256 * 1024 * 1024                 # Larger claim documents are rejected
+DOCUMENT_TEXT_CACHE_MEMORY_ENTRIES = 256               # Parsed text by content hash, in-memory LRU tier
+DOCUMENT_TEXT_CACHE_DB_PATH = os.path.join(PROJECT_ROOT, ".cache", "document_text.sqlite3")  # None disables the disk tier
+DOCUMENT_TEXT_CACHE_MAX_DISK_BYTES = 512 * 1024 * 1024
+
+# Asynchronous job queue (web /process)
+JOB_QUEUE_BACKEND = os.environ.get("JOB_QUEUE_BACKEND", "memory")  # "memory" or "sqlite" (survives restarts, shared by processes)
+JOB_QUEUE_DB_PATH = os.path.join(PROJECT_ROOT, ".cache", "jobs.sqlite3")
+JOB_QUEUE_MAX_DEPTH = 100     # Queued jobs beyond this are rejected with 429
+JOB_WORKERS = 4               # Background threads running process_claim_document
+JOB_SKIP_UNCHANGED = True     # Jobs return the stored result when the claim's fingerprint still matches
+JOB_RESULT_RETENTION = 1000   # Finished jobs kept by either queue backend
+JOB_LEASE_SECONDS = 60        # SQLite queue: a running job whose process stops renewing this is requeued
+JOB_MAX_THROTTLED_ATTEMPTS = 5           # Tries before a job throttled by Bedrock is failed
+JOB_THROTTLE_RETRY_BASE_SECONDS = 2.0    # Requeue delay for throttled jobs; full-jitter exponential backoff
+JOB_THROTTLE_RETRY_MAX_SECONDS = 60.0
+
+# Result files and the outputs listing (web /outputs)
+OUTPUTS_PAGE_SIZE = 100                 # Default page size
+OUTPUTS_MAX_PAGE_SIZE = 1000            # S3 returns at most 1,000 keys per call
+OUTPUTS_LISTING_CACHE_TTL_SECONDS = 30  # Listing pages are reused for this long unless a result is written
+OUTPUTS_COMPACT = True                  # Minified gzip JSON, policy snippets as key/ETag references; False = pretty JSON
+OUTPUTS_GZIP_LEVEL = 6                  # zlib level for compact result files
+OUTPUTS_STREAM_CHUNK_BYTES = 64 * 1024  # Read size when view_output streams a result file
+
+# Bedrock rate limiting and retries (shared by every invoker in the process)
+BEDROCK_REQUESTS_PER_MINUTE = 1000     # Per model ID; None disables the request bucket
+BEDROCK_TOKENS_PER_MINUTE = 400000     # Per model ID, input + max output tokens; None disables it
+BEDROCK_MODEL_RATE_LIMITS = {}         # model_id -> {"requests_per_minute": ..., "tokens_per_minute": ...}
+BEDROCK_MAX_CONCURRENCY = 16           # Upper bound for the adaptive concurrency cap
+BEDROCK_MIN_CONCURRENCY = 1
+BEDROCK_MAX_RETRIES = 5                # Retries on throttling / transient errors
+BEDROCK_RETRY_BASE_DELAY = 0.5         # Seconds; full-jitter exponential backoff
+BEDROCK_RETRY_MAX_DELAY = 20.0
+
+# Rule-based extraction fast path
+FAST_PATH_ENABLED = True         # Parse well-formed intake forms without calling the extraction model
+FAST_PATH_MIN_CONFIDENCE = 0.9   # Below this the claim falls back to the LLM
+
+# Pipeline concurrency
+PIPELINE_STAGE_WORKERS = 32      # Shared pool running independent pipeline stages (fetch, policy load, ...)
+PIPELINE_WRITE_WORKERS = 8       # Pool for fire-and-forget result writes
+PIPELINE_BACKGROUND_WRITES = False  # Default for process_claim_document(background_write=...)
+
+# Policy retrieval
+POLICY_CONTEXT_TOKEN_BUDGET = 250  # Max estimated tokens of policy text put in the summary prompt
+POLICY_CONTEXT_MAX_CHUNKS = 6      # Max policy sections per prompt
+
+# AWS clients (created lazily and shared, see src/clients.py)
+AWS_REGION = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")  # None uses the SDK default chain
+AWS_MAX_POOL_CONNECTIONS = 64   # Per client; keep above the busiest thread pool that shares it
+AWS_TCP_KEEPALIVE = True
+AWS_CONNECT_TIMEOUT = 5         # Seconds
+AWS_READ_TIMEOUT = 120          # Seconds; long summaries stream for a while
+# SDK-level attempts per call, including the first. Bedrock is 1 because
+# BedrockModelInvoker already retries through the rate limiter.
+AWS_CLIENT_MAX_ATTEMPTS = {"s3": 3, "bedrock-runtime": 1}
+
+# Uploads
+UPLOAD_MAX_BYTES = 1024 * 1024 * 1024    # Largest request body the web app accepts (single file or archive)
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024  # Streams larger than this go up as multipart uploads
+S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+S3_UPLOAD_CONCURRENCY = 4                 # Parts in flight per multipart upload
+UPLOAD_PIPE_MAX_CHUNKS = 64               # Parsed multipart chunks buffered ahead of the S3 upload reading them
+UPLOAD_PIPE_TIMEOUT_SECONDS = 60          # An upload whose request body stalls this long is aborted
+PRESIGNED_POST_EXPIRES_SECONDS = 900
+PRESIGNED_POST_MAX_BYTES = 100 * 1024 * 1024
+ARCHIVE_UPLOAD_WORKERS = 8                # Archive members uploaded in parallel
+ARCHIVE_MAX_MEMBERS = 10000
+ARCHIVE_MAX_MEMBER_BYTES = 64 * 1024 * 1024
+ARCHIVE_MAX_TOTAL_BYTES = 4 * 1024 * 1024 * 1024  # Uncompressed; guards against zip bombs
+ARCHIVE_MEMBER_EXTENSIONS = (".txt", ".pdf", ".docx", ".html", ".htm")  # Members with other extensions are skipped
+
+# Continuous ingestion (python -m src.ingest)
+INGEST_SOURCE = "poll"              # "poll" (list with a start-after checkpoint) or "events" (S3 event spool)
+INGEST_POLL_INTERVAL_SECONDS = 2.0  # Idle wait between listings / spool scans
+INGEST_CHECKPOINT_PATH = os.path.join(PROJECT_ROOT, ".cache", "ingest_checkpoint.json")
+INGEST_EVENT_SPOOL_DIR = os.path.join(PROJECT_ROOT, ".cache", "s3_events")  # One S3 event message per *.json file
+INGEST_DEAD_LETTER_PATH = os.path.join(PROJECT_ROOT, ".cache", "ingest_dead_letters.jsonl")
+INGEST_MAX_IN_FLIGHT = 32           # Claims accepted but not yet finished (queued + running)
+INGEST_WORKERS = 8                  # Claims processed concurrently
+INGEST_MAX_ATTEMPTS = 3             # Failures before a claim is dead-lettered (throttling doesn't count)
+INGEST_MAX_THROTTLED_ATTEMPTS = 20  # Throttled tries before a claim is dead-lettered
+INGEST_RESCAN_INTERVAL_SECONDS = 0  # Periodic full listing to catch keys sorting before the checkpoint; 0 disables
+
+# Bedrock batch inference (python -m src.batch_inference)
+BATCH_INFERENCE_WORK_DIR = os.path.join(PROJECT_ROOT, ".cache", "batch_inference")  # One subdirectory per run
+BATCH_INFERENCE_S3_PREFIX = "batch-inference/"  # Job input/output files in CLAIM_BUCKET
+BATCH_INFERENCE_ROLE_ARN = os.environ.get("BATCH_INFERENCE_ROLE_ARN")  # Service role Bedrock assumes to read/write S3
+BATCH_INFERENCE_MIN_RECORDS = 100   # Bedrock's minimum per job; smaller phases are invoked on demand
+BATCH_INFERENCE_POLL_SECONDS = 60   # Job status polling interval
+BATCH_INFERENCE_LOCAL_WORKERS = 8   # Concurrent calls for the local runner
+
+# Local results index (SQLite + full-text search over summaries/descriptions)
+RESULTS_INDEX_ENABLED = True  # write_result also indexes every result it writes
+RESULTS_INDEX_DB_PATH = os.path.join(PROJECT_ROOT, ".cache", "results_index.sqlite3")
+RESULTS_INDEX_BACKFILL_WORKERS = 16  # Parallel get_object calls for python -m src.results_index backfill
+RESULTS_INDEX_MAX_LIMIT = 500        # Most rows one query/search returns
+
+# Production serving (python web/serve.py): pre-forked worker processes, each with a request thread pool
+SERVE_HOST = os.environ.get("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.environ.get("SERVE_PORT", "8000"))
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS") or os.cpu_count() or 1)  # Worker processes
+SERVE_THREADS = int(os.environ.get("SERVE_THREADS", "8"))  # Request threads per worker
+SERVE_BACKLOG = 1024                    # Listen queue shared by the workers
+SERVE_IDLE_TIMEOUT_SECONDS = 30         # Socket read/write timeout; slow or idle clients are disconnected
+SERVE_REQUEST_TIMEOUT_SECONDS = 300     # A worker with a request running longer than this is restarted; 0 disables
+SERVE_GRACEFUL_TIMEOUT_SECONDS = 30     # On SIGTERM, in-flight requests and jobs get this long to finish
+SERVE_ACCESS_LOG = False                # Log every request line (noisy under load)
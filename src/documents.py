@@ -0,0 +1,352 @@
+# Claim documents to text: format detection, pluggable parsers, process pool and text cache
+
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+
+from .cache import ResponseCache
+from .config import (
+    DOCUMENT_MAX_BYTES,
+    DOCUMENT_PARSE_WORKERS,
+    DOCUMENT_POOL_MIN_BYTES,
+    DOCUMENT_READ_CHUNK_BYTES,
+    DOCUMENT_SPOOL_BYTES,
+    DOCUMENT_TEXT_CACHE_DB_PATH,
+    DOCUMENT_TEXT_CACHE_MAX_DISK_BYTES,
+    DOCUMENT_TEXT_CACHE_MEMORY_ENTRIES,
+    RESPONSE_CACHE_MAX_AGE_SECONDS,
+)
+from .metrics import metrics
+
+# Bump when a parser changes its output, so cached text from the old parser is not reused
+DOCUMENT_TEXT_VERSION = 1
+
+DocumentFormat = namedtuple("DocumentFormat", ["name", "parse", "extensions", "content_types", "magic", "in_pool"])
+
+# Parsed document: the text plus what the pipeline fingerprints (hash of the raw bytes)
+ParsedDocument = namedtuple("ParsedDocument", ["text", "format", "sha256", "size"])
+
+
+class DocumentFormatError(ValueError):
+    """
+    The claim document is in an unsupported format or has no extractable text.
+    """
+
+
+FORMATS = {}  # name -> DocumentFormat, in registration order
+
+
+def register_format(name: str, extensions=(), content_types=(), magic=(), in_pool: bool = True):
+    """
+    Decorator registering parse(source) -> str for a document format. source
+    is the document's bytes, or a file path for documents spooled to disk.
+    Formats are detected by magic bytes, then key extension, then
+    Content-Type. in_pool=False parses in the calling thread (cheap formats).
+    parse must be a module-level function so the process pool can pickle it.
+    """
+    def decorator(parse):
+        FORMATS[name] = DocumentFormat(name, parse, tuple(extensions), tuple(content_types), tuple(magic), in_pool)
+        return parse
+    return decorator
+
+
+def _read_bytes(source) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _open(source):
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, "rb")
+
+
+def _require_text(text: str, kind: str) -> str:
+    if not text.strip():
+        raise DocumentFormatError(f"{kind} has no extractable text (scanned images need OCR, which is not supported)")
+    return text
+
+
+@register_format("text", extensions=(".txt", ".text", ".md", ".csv"), content_types=("text/plain", "text/markdown"),
+                 in_pool=False)
+def parse_text(source) -> str:
+    """
+    UTF-8 (with or without BOM), UTF-16 with a BOM, else Windows-1252.
+    """
+    data = _read_bytes(source)
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16")
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")
+
+
+class _HTMLText(HTMLParser):
+    # Text content with one line break per block boundary (whitespace collapsed
+    # as a browser would, except in <pre>); script/style dropped
+    BLOCK_TAGS = {"p", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "section", "article",
+                  "table", "ul", "ol", "dt", "dd", "pre", "blockquote", "hr", "title"}
+    SKIP_TAGS = {"script", "style", "head", "noscript", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+        self.preformatted = 0
+        self.at_line_start = True
+
+    def _newline(self):
+        if not self.at_line_start:
+            self.parts.append("\n")
+            self.at_line_start = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skipping += 1
+        elif tag == "br":
+            self.parts.append("\n")
+            self.at_line_start = True
+        elif tag in self.BLOCK_TAGS:
+            self._newline()
+            if tag == "pre":
+                self.preformatted += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.BLOCK_TAGS:
+            if tag == "pre":
+                self.preformatted = max(0, self.preformatted - 1)
+            self._newline()
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        if not self.preformatted:
+            data = _WHITESPACE.sub(" ", data)
+            if data == " " and self.at_line_start:
+                return
+        self.parts.append(data)
+        self.at_line_start = data.endswith("\n")
+
+
+_BLANK_RUNS = re.compile(r"\n{3,}")
+_WHITESPACE = re.compile(r"\s+")
+_SPACE_RUNS = re.compile(r"[ \t\r\f\v]+")
+
+
+def _tidy(text: str) -> str:
+    lines = (_SPACE_RUNS.sub(" ", line).strip() for line in text.split("\n"))
+    return _BLANK_RUNS.sub("\n\n", "\n".join(lines)).strip()
+
+
+@register_format("html", extensions=(".html", ".htm"), content_types=("text/html", "application/xhtml+xml"))
+def parse_html(source) -> str:
+    parser = _HTMLText()
+    parser.feed(parse_text(source))
+    parser.close()
+    return _require_text(_tidy("".join(parser.parts)), "HTML document")
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+@register_format("docx", extensions=(".docx",),
+                 content_types=("application/vnd.openxmlformats-officedocument.wordprocessingml.document",))
+def parse_docx(source) -> str:
+    """
+    Paragraph text from word/document.xml, streamed with iterparse so the
+    XML tree of a large document is never held whole.
+    """
+    try:
+        archive = zipfile.ZipFile(_open(source))
+    except zipfile.BadZipFile as e:
+        raise DocumentFormatError(f"not a DOCX file: {e}")
+    with archive:
+        try:
+            xml = archive.open("word/document.xml")
+        except KeyError:
+            raise DocumentFormatError("not a DOCX file: word/document.xml missing")
+        paragraphs = []
+        current = []
+        with xml:
+            for event, element in ElementTree.iterparse(xml, events=("end",)):
+                tag = element.tag
+                if tag == f"{_W}t":
+                    current.append(element.text or "")
+                elif tag == f"{_W}tab":
+                    current.append("\t")
+                elif tag in (f"{_W}br", f"{_W}cr"):
+                    current.append("\n")
+                elif tag == f"{_W}p":
+                    paragraphs.append("".join(current))
+                    current = []
+                    element.clear()
+    return _require_text("\n".join(paragraphs).strip(), "DOCX document")
+
+
+@register_format("pdf", extensions=(".pdf",), content_types=("application/pdf",), magic=(b"%PDF-",))
+def parse_pdf(source) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise DocumentFormatError("PDF claims need the pypdf package (pip install pypdf)")
+    with _open(source) as f:
+        try:
+            reader = PdfReader(f)
+            pages = [page.extract_text() or "" for page in reader.pages]
+        except Exception as e:
+            raise DocumentFormatError(f"unreadable PDF: {e}")
+    return _require_text("\n\n".join(page.strip() for page in pages), "PDF document")
+
+
+# Legacy binary Office files (.doc/.xls) share this header; they would otherwise be decoded as text
+_OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+def detect_format(key: str, head: bytes, content_type: str = None) -> DocumentFormat:
+    """
+    The registered format for a document, from its first bytes, key and
+    Content-Type; HTML without a telling extension is sniffed from the
+    markup, and anything else is read as text.
+    """
+    if head.startswith(_OLE_MAGIC):
+        raise DocumentFormatError(f"{key}: legacy binary Office documents are not supported; save as DOCX or PDF")
+    for fmt in FORMATS.values():
+        if fmt.magic and head.startswith(fmt.magic):
+            return fmt
+    lower_key = key.lower()
+    for fmt in FORMATS.values():
+        if fmt.extensions and lower_key.endswith(fmt.extensions):
+            return fmt
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    for fmt in FORMATS.values():
+        if media_type in fmt.content_types:
+            return fmt
+    if head.startswith(b"PK\x03\x04") and "docx" in FORMATS:
+        return FORMATS["docx"]
+    if head.lstrip()[:15].lower().startswith((b"<!doctype html", b"<html")) and "html" in FORMATS:
+        return FORMATS["html"]
+    return FORMATS["text"]
+
+
+text_cache = ResponseCache(
+    memory_entries=DOCUMENT_TEXT_CACHE_MEMORY_ENTRIES,
+    db_path=DOCUMENT_TEXT_CACHE_DB_PATH,
+    max_disk_bytes=DOCUMENT_TEXT_CACHE_MAX_DISK_BYTES,
+    max_age_seconds=RESPONSE_CACHE_MAX_AGE_SECONDS,
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _parse_pool():
+    """
+    Process pool shared by every thread, started on first use. Workers are
+    spawned rather than forked, since the web app and batch runner fork
+    from processes that already run threads.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=DOCUMENT_PARSE_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_parse_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def parse_source(fmt: DocumentFormat, source, size: int = None) -> str:
+    """
+    Run the format's parser, in the process pool unless the format is cheap,
+    the document is under DOCUMENT_POOL_MIN_BYTES (shipping it to a worker
+    would cost more than parsing it) or DOCUMENT_PARSE_WORKERS is 0.
+    """
+    if size is None:
+        size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+    if fmt.in_pool and DOCUMENT_PARSE_WORKERS > 0 and size >= DOCUMENT_POOL_MIN_BYTES:
+        return _parse_pool().submit(fmt.parse, source).result()
+    return fmt.parse(source)
+
+
+def spool_body(body, chunk_size: int = DOCUMENT_READ_CHUNK_BYTES, spool_bytes: int = DOCUMENT_SPOOL_BYTES):
+    """
+    Read a streaming body in chunks, hashing as it goes. Returns (bytes or
+    temp file path, sha256, size); bodies over spool_bytes are written to a
+    temp file (the caller removes it) instead of being held in memory.
+    """
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    spooled = None
+    size = 0
+    try:
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > DOCUMENT_MAX_BYTES:
+                raise DocumentFormatError(f"document larger than DOCUMENT_MAX_BYTES ({DOCUMENT_MAX_BYTES})")
+            digest.update(chunk)
+            if spooled is None and size > spool_bytes:
+                spooled = tempfile.NamedTemporaryFile(prefix="claim-", delete=False)
+                spooled.write(buffer.getvalue())
+                buffer = None
+            (spooled or buffer).write(chunk)
+    except BaseException:
+        if spooled is not None:
+            spooled.close()
+            os.unlink(spooled.name)
+        raise
+    if spooled is not None:
+        spooled.close()
+        return spooled.name, digest.hexdigest(), size
+    return buffer.getvalue(), digest.hexdigest(), size
+
+
+def _head(source, size: int = 64) -> bytes:
+    if isinstance(source, bytes):
+        return source[:size]
+    with open(source, "rb") as f:
+        return f.read(size)
+
+
+def read_document(key: str, body, content_type: str = None) -> ParsedDocument:
+    """
+    Text of a claim document from its streaming body. Parsed formats are
+    cached by content hash, so the same file is only parsed once.
+    """
+    source, sha256, size = spool_body(body)
+    try:
+        fmt = detect_format(key, _head(source), content_type)
+        if not fmt.in_pool:
+            return ParsedDocument(parse_source(fmt, source, size), fmt.name, sha256, size)
+
+        cache_key = f"{fmt.name}:{DOCUMENT_TEXT_VERSION}:{sha256}"
+        text = text_cache.get(cache_key)
+        metrics.inc("document_text_cache_total", outcome="hit" if text is not None else "miss", format=fmt.name)
+        if text is None:
+            with metrics.timer("document_parse"):
+                text = parse_source(fmt, source, size)
+            text_cache.put(cache_key, text)
+        return ParsedDocument(text, fmt.name, sha256, size)
+    finally:
+        if isinstance(source, str):
+            os.unlink(source)
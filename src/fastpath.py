@@ -0,0 +1,115 @@
+# Deterministic extractor for claims that follow the standard intake layout
+
+import re
+from collections import namedtuple
+
+from .normalize import normalize_amount, normalize_date
+from .validator import _EMPTY_VALUES, REQUIRED_FIELDS
+
+FastPathResult = namedtuple("FastPathResult", ["fields", "confidence", "missing", "ambiguous"])
+
+# Header label variants seen on intake forms, matched case-insensitively at line start
+_HEADER_PATTERNS = {
+    "claimant_name": r"(?:claimant(?:\s+name)?|insured\s+name|name\s+of\s+claimant)",
+    "policy_number": r"(?:policy\s*(?:number|no\.?|#|id))",
+    "incident_date": r"(?:incident\s+date|date\s+of\s+(?:incident|loss)|loss\s+date)",
+    "claim_amount": r"(?:claim\s+amount|amount\s+claimed|claimed\s+amount)",
+}
+_HEADER_REGEXES = {
+    field: re.compile(rf"^[ \t]*{label}[ \t]*:[ \t]*(.*?)[ \t]*$", re.IGNORECASE | re.MULTILINE)
+    for field, label in _HEADER_PATTERNS.items()
+}
+# Sections the intake form can carry after the description
+_TRAILING_SECTIONS = (
+    r"adjuster(?:'s)?(?:\s+notes)?",
+    r"signature",
+    r"signed",
+    r"date\s+signed",
+    r"attachments?",
+    r"declaration",
+    r"contact\s+(?:details|information)",
+    r"witness(?:es)?",
+)
+# Only the form's own headers end the description; other "Label:" lines are part of it
+_SECTION_HEADER = r"[ \t]*(?:{})[ \t]*:".format(
+    "|".join((*_HEADER_PATTERNS.values(), r"incident\s+description", *_TRAILING_SECTIONS)))
+# The description runs up to the next section header (blank lines before it included) or the end
+_DESCRIPTION_REGEX = re.compile(rf"^[ \t]*incident\s+description[ \t]*:[ \t]*(.*?)(?=\n{_SECTION_HEADER}|\Z)",
+                                re.IGNORECASE | re.MULTILINE | re.DOTALL)
+# A line opening with a short label and a colon ("Cause: frozen line"); "At 3:15 pm" doesn't,
+# the colon must be followed by a space or the line end. Inside the description it may be an
+# unknown section, so the model decides where the description ends.
+_LABEL_LINE = re.compile(r"^[ \t]*[A-Za-z][A-Za-z0-9 /&'()\-]{0,40}:(?:[ \t]|$)", re.MULTILINE)
+
+_POLICY_NUMBER = re.compile(r"^[A-Z0-9][A-Z0-9\-/]{2,29}$", re.IGNORECASE)
+_NAME = re.compile(r"^[^\W\d_][\w .,'\-]{1,99}$")
+
+
+def _header_value(field: str, text: str):
+    """
+    Return (value, ambiguous): ambiguous when the header repeats with different values.
+    Placeholders the validator treats as empty ("Unknown", "N/A") count as no value.
+    """
+    values = {m.group(1).strip() for m in _HEADER_REGEXES[field].finditer(text)}
+    values = {value for value in values if value.lower() not in _EMPTY_VALUES}
+    if not values:
+        return None, False
+    if len(values) > 1:
+        return None, True
+    return values.pop(), False
+
+
+def fast_extract(document_text: str) -> FastPathResult:
+    """
+    Parse the intake-form headers into the same dict shape validate_extracted_info
+    returns (claim_amount as a float, incident_date as YYYY-MM-DD).
+
+    confidence is the fraction of required fields that parsed cleanly; callers
+    should fall back to the model whenever anything is missing or ambiguous.
+    """
+    fields = {field: None for field in REQUIRED_FIELDS}
+    missing = []
+    ambiguous = []
+
+    name, repeated = _header_value("claimant_name", document_text)
+    if repeated:
+        ambiguous.append("claimant_name")
+    elif name and _NAME.match(name):
+        fields["claimant_name"] = name
+
+    policy, repeated = _header_value("policy_number", document_text)
+    if repeated:
+        ambiguous.append("policy_number")
+    elif policy and _POLICY_NUMBER.match(policy):
+        fields["policy_number"] = policy.upper()
+
+    raw_date, repeated = _header_value("incident_date", document_text)
+    if repeated:
+        ambiguous.append("incident_date")
+    elif raw_date:
+        iso_date, unclear = normalize_date(raw_date)
+        if unclear:
+            ambiguous.append("incident_date")
+        else:
+            fields["incident_date"] = iso_date
+
+    raw_amount, repeated = _header_value("claim_amount", document_text)
+    if repeated:
+        ambiguous.append("claim_amount")
+    elif raw_amount:
+        fields["claim_amount"] = normalize_amount(raw_amount)
+
+    match = _DESCRIPTION_REGEX.search(document_text)
+    if match:
+        description = " ".join(match.group(1).split())
+        if description.lower() not in _EMPTY_VALUES:
+            fields["incident_description"] = description
+            if _LABEL_LINE.search(match.group(1).partition("\n")[2]):
+                ambiguous.append("incident_description")
+
+    for field in REQUIRED_FIELDS:
+        if fields[field] is None and field not in ambiguous:
+            missing.append(field)
+
+    clean = len(REQUIRED_FIELDS) - len(missing) - len(ambiguous)
+    return FastPathResult(fields, clean / len(REQUIRED_FIELDS), missing, ambiguous)
@@ -0,0 +1,92 @@
+# Fingerprints stored with each result so unchanged claims can be skipped on reruns
+
+import functools
+import hashlib
+import json
+
+from . import rag
+from .chunking import normalize_policy_id
+from .config import (
+    DOC_EXTRACT_MODEL_ID,
+    EXTRACT_MAX_TOKENS,
+    EXTRACT_STRUCTURED_OUTPUT,
+    EXTRACT_TEMPERATURE,
+    FAST_PATH_ENABLED,
+    FAST_PATH_MIN_CONFIDENCE,
+    POLICY_CONTEXT_MAX_CHUNKS,
+    POLICY_CONTEXT_TOKEN_BUDGET,
+    SUMMARY_ESCALATION_MIN_AMOUNT,
+    SUMMARY_ESCALATION_MIN_DESCRIPTION_TOKENS,
+    SUMMARY_ESCALATION_MODEL_ID,
+    SUMMARY_MAX_TOKENS,
+    SUMMARY_MODEL_ID,
+    SUMMARY_TEMPERATURE,
+)
+from .prompts import PromptTemplateManager
+from .routing import EXTRACT_MODEL_CASCADE
+from .validator import EXTRACTION_TOOL
+
+# Bump when a code change alters results in a way the settings below don't capture
+PIPELINE_VERSION = 1
+
+
+def digest(value) -> str:
+    """
+    Stable SHA-256 of any JSON-serialisable value.
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# Both are built from templates and settings fixed at import, but are asked
+# for at least twice per claim: hash them once per process
+
+@functools.lru_cache(maxsize=None)
+def prompts_fingerprint() -> str:
+    return digest(PromptTemplateManager().templates)
+
+
+@functools.lru_cache(maxsize=None)
+def pipeline_fingerprint() -> str:
+    """
+    Everything besides the claim and the policies that shapes a result:
+    prompt templates, model IDs and routing, generation, retrieval and fast-path settings.
+    """
+    return digest({
+        "version": PIPELINE_VERSION,
+        "prompts": prompts_fingerprint(),
+        "models": [DOC_EXTRACT_MODEL_ID, SUMMARY_MODEL_ID],
+        "routing": [EXTRACT_MODEL_CASCADE, SUMMARY_ESCALATION_MODEL_ID, SUMMARY_ESCALATION_MIN_AMOUNT,
+                    SUMMARY_ESCALATION_MIN_DESCRIPTION_TOKENS],
+        "generation": [EXTRACT_TEMPERATURE, EXTRACT_MAX_TOKENS, SUMMARY_TEMPERATURE, SUMMARY_MAX_TOKENS],
+        "structured_output": EXTRACTION_TOOL if EXTRACT_STRUCTURED_OUTPUT else None,
+        "policy_context": [POLICY_CONTEXT_TOKEN_BUDGET, POLICY_CONTEXT_MAX_CHUNKS],
+        "fast_path": [FAST_PATH_ENABLED, FAST_PATH_MIN_CONFIDENCE],
+    })
+
+
+def corpus_fingerprint(etags: dict) -> str:
+    return digest(sorted(etags.items()))
+
+
+def build_fingerprint(document, extracted_info: dict, chunks, models: dict = None) -> dict:
+    """
+    Fingerprint for a result: the claim's ETag and content hash, the pipeline
+    fingerprint, the models that produced it (models={"extract", "summary"};
+    None entries mean the defaults) and the ETag of every policy whose
+    sections reached the prompt.
+    """
+    models = models or {}
+    etags = rag.policy_corpus.get_etags()
+    policy_id = normalize_policy_id(extracted_info.get("policy_number"))
+    return {
+        "claim_etag": document.etag,
+        "claim_sha256": document.sha256,
+        "pipeline": pipeline_fingerprint(),
+        "prompts": prompts_fingerprint(),
+        "models": {"extract": models.get("extract") or DOC_EXTRACT_MODEL_ID,
+                   "summary": models.get("summary") or SUMMARY_MODEL_ID},
+        "policy_id": policy_id,
+        "policy_matched": any(chunk.policy_id == policy_id for chunk in chunks) if policy_id else False,
+        "policy_refs": {chunk.key: etags[chunk.key] for chunk in chunks if chunk.key in etags},
+        "policy_corpus": corpus_fingerprint(etags),
+    }
@@ -0,0 +1,75 @@
+# Incremental reprocessing: skip claims whose stored result is still up to date
+
+from . import rag
+from .app import fetch_claim_document, output_key_for, process_claim_document, s3
+from .config import CLAIM_BUCKET
+from .fingerprints import pipeline_fingerprint
+from .metrics import metrics
+from .result_files import read_result
+
+
+def load_stored_result(key: str):
+    """
+    Return the result JSON previously written for the claim (compact or
+    pretty), or None.
+    """
+    try:
+        response = s3.get_object(Bucket=CLAIM_BUCKET, Key=output_key_for(key))
+    except Exception as e:
+        if getattr(e, "response", {}).get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    try:
+        return read_result(response)
+    except (ValueError, OSError):
+        return None
+
+
+def reprocess_reason(key: str, listed_etag: str = None, stored: dict = None):
+    """
+    Why the claim has to be (re)processed, or None when its stored result
+    still matches: same pipeline fingerprint, every policy it drew on
+    unchanged, no newly indexed policy for its policy number, and the same
+    claim content (by ETag from the listing, else by SHA-256 of the bytes).
+    """
+    if stored is None:
+        stored = load_stored_result(key)
+    if stored is None:
+        return "no result"
+    fingerprint = stored.get("fingerprint")
+    if not fingerprint:
+        return "no fingerprint"
+    if fingerprint.get("pipeline") != pipeline_fingerprint():
+        return "pipeline changed"
+
+    index = rag.get_policy_index()
+    etags = rag.policy_corpus.get_etags()
+    changed = sorted(k for k, etag in fingerprint.get("policy_refs", {}).items() if etags.get(k) != etag)
+    if changed:
+        return "policy changed: " + ", ".join(changed)
+    policy_id = fingerprint.get("policy_id")
+    if policy_id and not fingerprint.get("policy_matched") and index.sections_for(policy_id):
+        return f"policy added: {policy_id}"
+
+    if listed_etag is not None and listed_etag == fingerprint.get("claim_etag"):
+        return None
+    # ETag unknown or different (e.g. re-uploaded in parts): compare the content itself
+    if fetch_claim_document(key).sha256 != fingerprint.get("claim_sha256"):
+        return "claim changed"
+    return None
+
+
+def process_claim_if_changed(key: str, listed_etag: str = None, process=process_claim_document) -> dict:
+    """
+    process(key) unless the stored result is still up to date, in which case
+    the stored result is returned without calling Bedrock.
+    """
+    stored = load_stored_result(key)
+    reason = reprocess_reason(key, listed_etag=listed_etag, stored=stored)
+    if reason is None:
+        metrics.inc("incremental_total", outcome="skipped")
+        print(f"[SKIP] {key} unchanged since its last result")
+        return stored
+    metrics.inc("incremental_total", outcome="processed")
+    print(f"[REPROCESS] {key}: {reason}")
+    return process(key)
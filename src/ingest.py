@@ -0,0 +1,403 @@
+# Continuous ingestion: detect new claims under CLAIMS_PREFIX and process them without a human in the loop
+
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+
+from .config import (
+    CLAIM_BUCKET,
+    CLAIMS_PREFIX,
+    INGEST_CHECKPOINT_PATH,
+    INGEST_DEAD_LETTER_PATH,
+    INGEST_EVENT_SPOOL_DIR,
+    INGEST_MAX_ATTEMPTS,
+    INGEST_MAX_IN_FLIGHT,
+    INGEST_MAX_THROTTLED_ATTEMPTS,
+    INGEST_POLL_INTERVAL_SECONDS,
+    INGEST_RESCAN_INTERVAL_SECONDS,
+    INGEST_SOURCE,
+    INGEST_WORKERS,
+)
+from .app import s3
+from .incremental import process_claim_if_changed
+from .limiter import backoff_delay
+from .metrics import metrics
+from .models import BedrockThrottlingError
+
+# token is source bookkeeping: the spool file for events, True for rescanned keys
+IngestItem = namedtuple("IngestItem", ["key", "etag", "detected_at", "token"])
+
+
+def _write_json_atomic(path: str, value) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """
+    Crash-safe start-after key, written with write-to-temp + fsync + rename so
+    a crash leaves either the old or the new checkpoint, never a torn one.
+    """
+
+    def __init__(self, path: str = INGEST_CHECKPOINT_PATH):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f).get("start_after")
+        except (OSError, ValueError):
+            return None
+
+    def save(self, start_after: str) -> None:
+        _write_json_atomic(self.path, {"start_after": start_after, "updated_at": time.time()})
+
+
+class S3PollingSource:
+    """
+    Lists CLAIMS_PREFIX after the last key seen and hands out new keys in key order.
+
+    The persisted checkpoint only advances past a key once it and every key
+    before it were acknowledged, so after a crash everything not yet finished
+    is listed again (at-least-once). Keys are assumed to arrive in ascending
+    order (e.g. date-stamped names); an optional periodic rescan picks up any
+    that sort before the checkpoint.
+    """
+
+    def __init__(self, prefix: str = CLAIMS_PREFIX, bucket: str = CLAIM_BUCKET,
+                 checkpoint: Checkpoint = None, rescan_interval: float = INGEST_RESCAN_INTERVAL_SECONDS):
+        self.prefix = prefix
+        self.bucket = bucket
+        self.checkpoint = checkpoint or Checkpoint()
+        self.rescan_interval = rescan_interval
+        self.watermark = self.checkpoint.load()
+        self._cursor = self.watermark  # Last key handed out; ahead of the watermark while claims run
+        self._outstanding = deque()    # Handed-out keys in order, for advancing the watermark
+        self._acked = set()
+        self._rescan = deque()
+        self._last_rescan = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _list(self, start_after, limit):
+        params = {"Bucket": self.bucket, "Prefix": self.prefix, "MaxKeys": max(1, min(limit, 1000))}
+        if start_after:
+            params["StartAfter"] = start_after
+        response = s3.list_objects_v2(**params)
+        return [obj for obj in response.get("Contents", []) if not obj["Key"].endswith("/")]
+
+    def _queue_rescan(self) -> None:
+        # Everything at or before the cursor; already-processed claims are skipped by their fingerprint
+        with self._lock:
+            outstanding = set(self._outstanding)
+            cursor = self._cursor
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                if cursor is None or key > cursor:
+                    return
+                if not key.endswith("/") and key not in outstanding:
+                    self._rescan.append(IngestItem(key, obj.get("ETag"), time.time(), True))
+
+    def poll(self, limit: int) -> list:
+        if self.rescan_interval and time.monotonic() - self._last_rescan >= self.rescan_interval:
+            self._last_rescan = time.monotonic()
+            self._queue_rescan()
+        items = []
+        while self._rescan and len(items) < limit:
+            items.append(self._rescan.popleft())
+        if len(items) >= limit:
+            return items
+
+        objects = self._list(self._cursor, limit - len(items))
+        now = time.time()
+        with self._lock:
+            for obj in objects:
+                self._outstanding.append(obj["Key"])
+                self._cursor = obj["Key"]
+                items.append(IngestItem(obj["Key"], obj.get("ETag"), now, None))
+        return items
+
+    def ack(self, item: IngestItem) -> None:
+        if item.token is True:
+            return
+        with self._lock:
+            self._acked.add(item.key)
+            advanced = None
+            while self._outstanding and self._outstanding[0] in self._acked:
+                advanced = self._outstanding.popleft()
+                self._acked.discard(advanced)
+            if advanced is not None:
+                self.watermark = advanced
+                self.checkpoint.save(advanced)
+
+    def close(self) -> None:
+        pass
+
+
+class EventSpoolSource:
+    """
+    S3 event notifications (the JSON S3 sends to SQS/SNS/EventBridge), one
+    message per *.json file in a local spool directory. A forwarder should
+    write each message to a temporary name and rename it into place.
+
+    A message file is deleted only after every claim it names was
+    acknowledged, so a crash redelivers it (at-least-once). Unreadable
+    messages are moved to a "rejected" subdirectory.
+    """
+
+    def __init__(self, directory: str = INGEST_EVENT_SPOOL_DIR, prefix: str = CLAIMS_PREFIX,
+                 bucket: str = CLAIM_BUCKET):
+        self.directory = directory
+        self.prefix = prefix
+        self.bucket = bucket
+        self._remaining = {}  # message path -> claims not yet acknowledged
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _records(self, message: dict):
+        # Accept both the raw S3 notification and an SNS/SQS envelope around it
+        if "Message" in message and isinstance(message["Message"], str):
+            message = json.loads(message["Message"])
+        for record in message.get("Records", []):
+            if not record.get("eventName", "").startswith("ObjectCreated"):
+                continue
+            s3_info = record.get("s3", {})
+            if s3_info.get("bucket", {}).get("name", self.bucket) != self.bucket:
+                continue
+            key = unquote_plus(s3_info.get("object", {}).get("key", ""))
+            if key.startswith(self.prefix) and not key.endswith("/"):
+                yield key, s3_info["object"].get("eTag")
+
+    def poll(self, limit: int) -> list:
+        items = []
+        for name in sorted(os.listdir(self.directory)):
+            if len(items) >= limit:
+                break
+            path = os.path.join(self.directory, name)
+            with self._lock:
+                if not name.endswith(".json") or path in self._remaining:
+                    continue
+            try:
+                with open(path) as f:
+                    records = list(self._records(json.load(f)))
+            except FileNotFoundError:
+                # Fully acknowledged (and deleted) since the listing
+                continue
+            except (OSError, ValueError) as e:
+                print(f"[INGEST] Rejecting unreadable event message {name}: {e}")
+                os.makedirs(os.path.join(self.directory, "rejected"), exist_ok=True)
+                os.replace(path, os.path.join(self.directory, "rejected", name))
+                continue
+            if not records:
+                os.remove(path)
+                continue
+            with self._lock:
+                self._remaining[path] = len(records)
+            now = time.time()
+            items.extend(IngestItem(key, etag, now, path) for key, etag in records)
+        return items
+
+    def ack(self, item: IngestItem) -> None:
+        with self._lock:
+            self._remaining[item.token] -= 1
+            if self._remaining[item.token]:
+                return
+            # Deleted before the path leaves _remaining, so poll() can't deliver it again
+            try:
+                os.remove(item.token)
+            except FileNotFoundError:
+                pass
+            del self._remaining[item.token]
+
+    def close(self) -> None:
+        pass
+
+
+class IngestionService:
+    """
+    Feeds claims from a source to a worker pool running process (by default
+    process_claim_if_changed, so redelivered claims cost one fingerprint check).
+
+    At most max_in_flight claims are accepted but unfinished at any time;
+    polling pauses while the limit is reached. Failed claims are retried with
+    jittered backoff and dead-lettered after max_attempts failures, or after
+    max_throttled_attempts throttled tries (counted separately, with their own
+    growing backoff); either way they are acknowledged so the source can move on.
+    """
+
+    def __init__(self, source, process=process_claim_if_changed, workers: int = INGEST_WORKERS,
+                 max_in_flight: int = INGEST_MAX_IN_FLIGHT, max_attempts: int = INGEST_MAX_ATTEMPTS,
+                 max_throttled_attempts: int = INGEST_MAX_THROTTLED_ATTEMPTS,
+                 poll_interval: float = INGEST_POLL_INTERVAL_SECONDS,
+                 dead_letter_path: str = INGEST_DEAD_LETTER_PATH):
+        self.source = source
+        self.process = process
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.max_throttled_attempts = max_throttled_attempts
+        self.poll_interval = poll_interval
+        self.dead_letter_path = dead_letter_path
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._idle = threading.Condition(self._lock)
+        metrics.register_gauge("ingest_in_flight", self.in_flight, "Claims accepted by the ingestion service but not finished")
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._in_flight
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _dead_letter(self, item: IngestItem, error: str, attempts: int) -> None:
+        print(f"[INGEST] Dead-lettering {item.key} after {attempts} attempts: {error}")
+        metrics.inc("ingest_claims_total", outcome="dead_lettered")
+        directory = os.path.dirname(self.dead_letter_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.dead_letter_path, "a") as f:
+            f.write(json.dumps({"claim_key": item.key, "error": error, "attempts": attempts,
+                                "failed_at": time.time()}) + "\n")
+
+    def _handle(self, item: IngestItem) -> None:
+        try:
+            attempt = 0
+            throttled = 0
+            while True:
+                try:
+                    self.process(item.key)
+                    metrics.inc("ingest_claims_total", outcome="processed")
+                    metrics.observe("ingest_latency_seconds", time.time() - item.detected_at)
+                    break
+                except BedrockThrottlingError as e:
+                    throttled += 1
+                    error = repr(e)
+                    if throttled >= self.max_throttled_attempts:
+                        self._dead_letter(item, error, attempt + throttled)
+                        break
+                    delay = backoff_delay(throttled)
+                    print(f"[INGEST] {item.key} throttled ({throttled}/{self.max_throttled_attempts}); "
+                          f"retrying in {delay:.1f}s")
+                except Exception as e:
+                    attempt += 1
+                    error = repr(e)
+                    if attempt >= self.max_attempts:
+                        self._dead_letter(item, error, attempt)
+                        break
+                    delay = backoff_delay(attempt)
+                    print(f"[INGEST] {item.key} failed (attempt {attempt}/{self.max_attempts}): {error}")
+                if self._stopping.wait(delay):
+                    # Shutting down: leave it unacknowledged so it is delivered again next run
+                    return
+            self.source.ack(item)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._idle.notify_all()
+            self._slots.release()
+
+    def _accept(self, item: IngestItem, pool: ThreadPoolExecutor) -> None:
+        with self._lock:
+            self._in_flight += 1
+        pool.submit(self._handle, item)
+
+    def run(self, once: bool = False) -> None:
+        """
+        Poll and dispatch until stop() (or, with once=True, until the source
+        has nothing new and every accepted claim has finished).
+        """
+        print(f"[INGEST] Watching s3://{CLAIM_BUCKET}/{CLAIMS_PREFIX} via {type(self.source).__name__} "
+              f"({self.workers} workers, max {self.max_in_flight} in flight)")
+        idle = False
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest") as pool:
+            while not self._stopping.is_set():
+                # Block for a slot first so listing never runs ahead of max_in_flight
+                if not self._slots.acquire(timeout=self.poll_interval):
+                    continue
+                free = 1
+                while free < self.max_in_flight and self._slots.acquire(blocking=False):
+                    free += 1
+                try:
+                    items = self.source.poll(free)
+                except Exception as e:
+                    print(f"[INGEST] Poll failed: {e!r}")
+                    items = []
+                for index, item in enumerate(items):
+                    if index >= free:
+                        # A multi-record event message can exceed the free slots; wait for more
+                        self._slots.acquire()
+                    self._accept(item, pool)
+                for _ in range(free - len(items)):
+                    self._slots.release()
+
+                if items:
+                    idle = False
+                elif once:
+                    # Done once a poll after every accepted claim finished still finds nothing
+                    with self._idle:
+                        self._idle.wait_for(lambda: self._in_flight == 0)
+                    if idle:
+                        break
+                    idle = True
+                else:
+                    self._stopping.wait(self.poll_interval)
+            print("[INGEST] Stopping; waiting for in-flight claims...")
+        self.source.close()
+        print("[INGEST] Stopped.")
+
+
+def create_source(kind: str = INGEST_SOURCE, **kwargs):
+    if kind == "poll":
+        return S3PollingSource(**kwargs)
+    if kind == "events":
+        return EventSpoolSource(**kwargs)
+    raise ValueError(f"Unknown ingestion source: {kind}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Continuously process new claims under CLAIMS_PREFIX.")
+    parser.add_argument("--source", choices=["poll", "events"], default=INGEST_SOURCE)
+    parser.add_argument("--spool", default=INGEST_EVENT_SPOOL_DIR, help="Event spool directory (--source events)")
+    parser.add_argument("--checkpoint", default=INGEST_CHECKPOINT_PATH, help="Checkpoint file (--source poll)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--max-in-flight", type=int, default=INGEST_MAX_IN_FLIGHT)
+    parser.add_argument("--poll-interval", type=float, default=INGEST_POLL_INTERVAL_SECONDS)
+    parser.add_argument("--once", action="store_true", help="Exit once everything pending is processed")
+    args = parser.parse_args(argv)
+
+    if args.source == "poll":
+        source = S3PollingSource(checkpoint=Checkpoint(args.checkpoint))
+    else:
+        source = EventSpoolSource(directory=args.spool)
+    service = IngestionService(source, workers=args.workers, max_in_flight=args.max_in_flight,
+                               poll_interval=args.poll_interval)
+
+    def handle_signal(signum, frame):
+        print(f"[INGEST] Received signal {signum}")
+        service.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    service.run(once=args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
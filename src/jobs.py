@@ -0,0 +1,487 @@
+# Asynchronous job queue for claim processing
+
+import heapq
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from .config import (
+    JOB_QUEUE_BACKEND,
+    JOB_LEASE_SECONDS,
+    JOB_QUEUE_DB_PATH,
+    JOB_MAX_THROTTLED_ATTEMPTS,
+    JOB_QUEUE_MAX_DEPTH,
+    JOB_RESULT_RETENTION,
+    JOB_THROTTLE_RETRY_BASE_SECONDS,
+    JOB_THROTTLE_RETRY_MAX_SECONDS,
+    JOB_WORKERS,
+)
+from .limiter import backoff_delay
+from .models import BedrockThrottlingError
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """
+    Raised by JobQueue.put when the queue is at its depth limit.
+    """
+
+
+class JobQueue:
+    """
+    Interface shared by the queue backends.
+
+    Jobs are plain dicts: job_id, claim_key, status, result, error,
+    attempts (times requeued by retry()), created_at, started_at, finished_at.
+    """
+
+    def __init__(self, max_depth: int = JOB_QUEUE_MAX_DEPTH):
+        self.max_depth = max_depth
+
+    def put(self, claim_key: str) -> str:
+        """Enqueue a claim and return its job id; raises QueueFullError."""
+        raise NotImplementedError
+
+    def get(self, timeout: float = None):
+        """Claim the oldest queued job (marking it running), or None on timeout."""
+        raise NotImplementedError
+
+    def complete(self, job_id: str, result: dict) -> None:
+        raise NotImplementedError
+
+    def fail(self, job_id: str, error: str) -> None:
+        raise NotImplementedError
+
+    def retry(self, job_id: str, error: str, delay: float) -> None:
+        """Put a running job back in the queue, to be picked up no sooner than delay seconds from now."""
+        raise NotImplementedError
+
+    def status(self, job_id: str):
+        """Return the job dict, or None if the id is unknown."""
+        raise NotImplementedError
+
+    def depth(self) -> int:
+        """Number of jobs waiting to be picked up, including retries not yet due."""
+        raise NotImplementedError
+
+    def after_fork(self) -> None:
+        """Called in a forked server worker before it uses the queue."""
+
+    def heartbeat(self) -> None:
+        """Extend the leases on the running jobs this process holds."""
+
+    def requeue_abandoned(self, pid: int) -> int:
+        """Put back the running jobs held by a process that has exited; returns how many."""
+        return 0
+
+
+def _owner(pid: int = None) -> str:
+    # The process holding a job's lease
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+def _new_job(claim_key: str) -> dict:
+    return {
+        "job_id": uuid.uuid4().hex,
+        "claim_key": claim_key,
+        "status": QUEUED,
+        "result": None,
+        "error": None,
+        "attempts": 0,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+
+class InMemoryJobQueue(JobQueue):
+    """
+    Process-local queue. Fast, but jobs are lost on restart.
+    """
+
+    def __init__(self, max_depth: int = JOB_QUEUE_MAX_DEPTH, retention: int = JOB_RESULT_RETENTION):
+        super().__init__(max_depth)
+        self.retention = retention
+        self._jobs = {}
+        self._pending = deque()
+        self._delayed = []  # heap of (monotonic due time, job_id) for retries
+        self._finished = OrderedDict()  # job_id -> None, oldest first, for retention
+        self._cond = threading.Condition()
+
+    def put(self, claim_key: str) -> str:
+        with self._cond:
+            if len(self._pending) + len(self._delayed) >= self.max_depth:
+                raise QueueFullError(f"Job queue is full ({self.max_depth} jobs waiting)")
+            job = _new_job(claim_key)
+            self._jobs[job["job_id"]] = job
+            self._pending.append(job["job_id"])
+            self._cond.notify()
+            return job["job_id"]
+
+    def _promote_due(self) -> None:
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._pending.append(heapq.heappop(self._delayed)[1])
+
+    def get(self, timeout: float = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._promote_due()
+                if self._pending:
+                    break
+                wait = self._delayed[0][0] - time.monotonic() if self._delayed else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+            job = self._jobs[self._pending.popleft()]
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            return dict(job)
+
+    def _finish(self, job_id: str, **fields) -> None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, finished_at=time.time())
+            self._finished[job_id] = None
+            while len(self._finished) > self.retention:
+                expired, _ = self._finished.popitem(last=False)
+                self._jobs.pop(expired, None)
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._finish(job_id, status=SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, status=FAILED, error=error)
+
+    def retry(self, job_id: str, error: str, delay: float) -> None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(status=QUEUED, error=error, started_at=None, attempts=job["attempts"] + 1)
+            heapq.heappush(self._delayed, (time.monotonic() + delay, job_id))
+            self._cond.notify()
+
+    def status(self, job_id: str):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pending) + len(self._delayed)
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Durable queue backed by an SQLite file, shared by processes. A running
+    job is leased to the process that claimed it for lease_seconds, renewed
+    by heartbeat(); a job whose lease ran out (its process died or hung) goes
+    back in the queue. Only the newest retention finished jobs are kept.
+    """
+
+    POLL_INTERVAL = 0.5  # Seconds between checks for jobs enqueued by other processes
+
+    def __init__(self, db_path: str = JOB_QUEUE_DB_PATH, max_depth: int = JOB_QUEUE_MAX_DEPTH,
+                 retention: int = JOB_RESULT_RETENTION, lease_seconds: float = JOB_LEASE_SECONDS):
+        super().__init__(max_depth)
+        self.db_path = db_path
+        self.retention = retention
+        self.lease_seconds = lease_seconds
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._db = self._connect()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " job_id TEXT UNIQUE NOT NULL,"
+            " claim_key TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL,"
+            " owner TEXT,"
+            " lease_expires_at REAL,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at)")
+        # Jobs interrupted by a crash or restart are recovered when their lease expires (see _claim_next)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def after_fork(self) -> None:
+        # SQLite connections must not be used across fork(); the inherited one is
+        # abandoned, not closed
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._db = self._connect()
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job_id, claim_key, status, result, error, attempts, created_at, started_at, finished_at = row
+        return {
+            "job_id": job_id,
+            "claim_key": claim_key,
+            "status": status,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    def put(self, claim_key: str) -> str:
+        job = _new_job(claim_key)
+        with self._wakeup:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                waiting = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+                if waiting >= self.max_depth:
+                    raise QueueFullError(f"Job queue is full ({self.max_depth} jobs waiting)")
+                self._db.execute(
+                    "INSERT INTO jobs (job_id, claim_key, status, created_at) VALUES (?, ?, ?, ?)",
+                    (job["job_id"], claim_key, QUEUED, job["created_at"]),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._wakeup.notify()
+        return job["job_id"]
+
+    def _claim_next(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            # Rows from before leases existed have none: they were running when the old process stopped
+            expired = self._db.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires_at = NULL"
+                " WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (QUEUED, RUNNING, now),
+            ).rowcount
+            if expired:
+                print(f"[JOBS] Requeued {expired} running jobs whose lease expired")
+            row = self._db.execute(
+                "SELECT job_id FROM jobs WHERE status = ? AND (available_at IS NULL OR available_at <= ?)"
+                " ORDER BY seq LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is None:
+                self._db.execute("COMMIT")
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, owner = ?, lease_expires_at = ? WHERE job_id = ?",
+                (RUNNING, now, _owner(), now + self.lease_seconds, row[0]),
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return self._status_locked(row[0])
+
+    def get(self, timeout: float = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._wakeup:
+            while True:
+                job = self._claim_next()
+                if job is not None:
+                    return job
+                remaining = self.POLL_INTERVAL
+                if deadline is not None:
+                    remaining = min(remaining, deadline - time.monotonic())
+                    if remaining <= 0:
+                        return None
+                self._wakeup.wait(remaining)
+
+    def _finish(self, job_id: str, status: str, result=None, error=None) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, owner = NULL,"
+                " lease_expires_at = NULL WHERE job_id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+            # Drop the oldest finished jobs beyond the retention limit, as InMemoryJobQueue does
+            self._db.execute(
+                "DELETE FROM jobs WHERE seq IN (SELECT seq FROM jobs WHERE finished_at IS NOT NULL"
+                " ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                (self.retention,),
+            )
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._finish(job_id, SUCCEEDED, result=result)
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, FAILED, error=error)
+
+    def retry(self, job_id: str, error: str, delay: float) -> None:
+        with self._wakeup:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, started_at = NULL, attempts = attempts + 1,"
+                " available_at = ?, owner = NULL, lease_expires_at = NULL WHERE job_id = ?",
+                (QUEUED, error, time.time() + delay, job_id),
+            )
+            self._wakeup.notify()
+
+    def heartbeat(self) -> None:
+        with self._lock:
+            self._db.execute("UPDATE jobs SET lease_expires_at = ? WHERE status = ? AND owner = ?",
+                             (time.time() + self.lease_seconds, RUNNING, _owner()))
+
+    def requeue_abandoned(self, pid: int) -> int:
+        with self._wakeup:
+            count = self._db.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires_at = NULL"
+                " WHERE status = ? AND owner = ?",
+                (QUEUED, RUNNING, _owner(pid)),
+            ).rowcount
+            self._wakeup.notify_all()
+        if count:
+            print(f"[JOBS] Requeued {count} jobs left running by pid {pid}")
+        return count
+
+    def _status_locked(self, job_id: str):
+        row = self._db.execute(
+            "SELECT job_id, claim_key, status, result, error, attempts, created_at, started_at, finished_at"
+            " FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def status(self, job_id: str):
+        with self._lock:
+            return self._status_locked(job_id)
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+
+def create_job_queue(backend: str = JOB_QUEUE_BACKEND) -> JobQueue:
+    if backend == "memory":
+        return InMemoryJobQueue()
+    if backend == "sqlite":
+        return SQLiteJobQueue()
+    raise ValueError(f"Unknown job queue backend: {backend}")
+
+
+class JobWorkerPool:
+    """
+    Background threads that pull jobs from a queue and run them through
+    the processing function (process_claim_document by default).
+
+    A job throttled by Bedrock goes back in the queue with jittered
+    exponential backoff and only fails after max_throttled_attempts tries;
+    any other error fails it straight away. While jobs run, a heartbeat
+    thread renews their leases (SQLiteJobQueue).
+    """
+
+    def __init__(self, queue: JobQueue, process, workers: int = JOB_WORKERS,
+                 max_throttled_attempts: int = JOB_MAX_THROTTLED_ATTEMPTS):
+        self.queue = queue
+        self.process = process
+        self.workers = workers
+        self.max_throttled_attempts = max_throttled_attempts
+        self.heartbeat_interval = JOB_LEASE_SECONDS / 3
+        self._threads = []
+        self._running = 0  # Jobs in progress, under _running_lock (stop() holds _lock while joining)
+        self._running_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the worker threads (no-op if already running)."""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            print(f"[JOBS] Started {self.workers} workers")
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop taking new jobs and wait for running ones to finish."""
+        self._stopping.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def _heartbeat(self) -> None:
+        # Renews leases until stop() and every running job has finished
+        due = time.monotonic() + self.heartbeat_interval
+        while not self._stopping.is_set() or self._running:
+            if time.monotonic() >= due:
+                try:
+                    self.queue.heartbeat()
+                except Exception as e:
+                    print(f"[JOBS] Lease heartbeat failed: {e!r}")
+                due = time.monotonic() + self.heartbeat_interval
+            if self._stopping.is_set():
+                time.sleep(0.1)
+            else:
+                self._stopping.wait(max(0.0, due - time.monotonic()))
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            job = self.queue.get(timeout=1.0)
+            if job is None:
+                continue
+            with self._running_lock:
+                self._running += 1
+            try:
+                self._run_job(job)
+            finally:
+                with self._running_lock:
+                    self._running -= 1
+
+    def _run_job(self, job: dict) -> None:
+        print(f"[JOBS] Running {job['job_id']} for {job['claim_key']}")
+        try:
+            result = self.process(job["claim_key"])
+        except BedrockThrottlingError as e:
+            attempts = job.get("attempts", 0) + 1
+            if attempts >= self.max_throttled_attempts:
+                print(f"[JOBS] Job {job['job_id']} still throttled after {attempts} attempts; failing")
+                self.queue.fail(job["job_id"], repr(e))
+                return
+            delay = backoff_delay(attempts, base=JOB_THROTTLE_RETRY_BASE_SECONDS,
+                                  cap=JOB_THROTTLE_RETRY_MAX_SECONDS)
+            print(f"[JOBS] Job {job['job_id']} throttled ({attempts}/{self.max_throttled_attempts}); "
+                  f"requeued for {delay:.1f}s")
+            self.queue.retry(job["job_id"], repr(e), delay)
+        except Exception as e:
+            print(f"[JOBS] Job {job['job_id']} failed: {e!r}")
+            self.queue.fail(job["job_id"], repr(e))
+        else:
+            self.queue.complete(job["job_id"], result)
@@ -0,0 +1,186 @@
+# Process-wide rate limiting for Bedrock calls: token buckets, AIMD concurrency, jittered backoff
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import (
+    BEDROCK_REQUESTS_PER_MINUTE,
+    BEDROCK_TOKENS_PER_MINUTE,
+    BEDROCK_MODEL_RATE_LIMITS,
+    BEDROCK_MAX_CONCURRENCY,
+    BEDROCK_MIN_CONCURRENCY,
+    BEDROCK_RETRY_BASE_DELAY,
+    BEDROCK_RETRY_MAX_DELAY,
+)
+
+
+def backoff_delay(attempt: int, base: float = BEDROCK_RETRY_BASE_DELAY, cap: float = BEDROCK_RETRY_MAX_DELAY) -> float:
+    """
+    Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)].
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at rate_per_minute, holding at
+    most one minute's worth. acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Take amount tokens, waiting as needed; returns the seconds spent waiting.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency cap: grows by about one slot per window of successful calls
+    and halves on throttling (at most once per cooldown, so a burst of
+    throttles from the same window counts as one congestion signal).
+    """
+
+    def __init__(self, maximum: int = BEDROCK_MAX_CONCURRENCY, minimum: int = BEDROCK_MIN_CONCURRENCY,
+                 decrease_factor: float = 0.5, cooldown: float = 1.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            self._cond.wait_for(lambda: self.in_flight < max(self.minimum, int(self.limit)))
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+            self._cond.notify_all()
+
+
+class CallSlot:
+    """
+    Handed out by ModelRateLimiter.slot(); the caller reports the outcome on it.
+    """
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens = None
+        self.throttled = False
+
+
+class ModelRateLimiter:
+    """
+    Request and token buckets plus an adaptive concurrency cap for one model ID.
+    """
+
+    def __init__(self, model_id: str, requests_per_minute=BEDROCK_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=BEDROCK_TOKENS_PER_MINUTE, max_concurrency: int = BEDROCK_MAX_CONCURRENCY,
+                 min_concurrency: int = BEDROCK_MIN_CONCURRENCY):
+        self.model_id = model_id
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrencyLimiter(max_concurrency, min_concurrency)
+        self.calls = 0
+        self.throttles = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, estimated_tokens: int):
+        """
+        Wait for capacity, then hold one concurrency slot for the duration of the call.
+        Unused token reservations are refunded once the caller sets actual_tokens.
+        """
+        waited = 0.0
+        if self.requests is not None:
+            waited += self.requests.acquire(1)
+        if self.tokens is not None:
+            waited += self.tokens.acquire(estimated_tokens)
+        started = time.monotonic()
+        self.concurrency.acquire()
+        waited += time.monotonic() - started
+
+        call = CallSlot(estimated_tokens)
+        try:
+            yield call
+        finally:
+            self.concurrency.release(throttled=call.throttled)
+            if self.tokens is not None and call.actual_tokens is not None:
+                unused = estimated_tokens - call.actual_tokens
+                if unused > 0:
+                    self.tokens.refund(unused)
+            with self._lock:
+                self.calls += 1
+                self.throttles += int(call.throttled)
+                self.wait_seconds += waited
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model_id": self.model_id,
+                "calls": self.calls,
+                "throttles": self.throttles,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "concurrency_limit": round(self.concurrency.limit, 2),
+                "in_flight": self.concurrency.in_flight,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model_id: str) -> ModelRateLimiter:
+    """
+    Return the process-wide limiter for a model ID, creating it on first use.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(model_id)
+        if limiter is None:
+            limiter = _limiters[model_id] = ModelRateLimiter(model_id, **BEDROCK_MODEL_RATE_LIMITS.get(model_id, {}))
+        return limiter
+
+
+def limiter_stats() -> list:
+    with _limiters_lock:
+        return [limiter.stats() for limiter in _limiters.values()]
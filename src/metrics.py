@@ -0,0 +1,197 @@
+# Lightweight in-process metrics: stage timers, counters and histograms
+
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key: tuple, extra: tuple = ()) -> str:
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Histogram:
+    """
+    Cumulative bucket counts for Prometheus export plus a bounded window of
+    recent samples for p50/p95/p99. Observing is O(log buckets).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self) -> dict:
+        ordered = sorted(self.recent)
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": _percentile(ordered, 0.50),
+            "p95": _percentile(ordered, 0.95),
+            "p99": _percentile(ordered, 0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide registry of counters and histograms, keyed by name and labels.
+    """
+
+    def __init__(self):
+        self._counters = {}    # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: Histogram}
+        self._gauges = {}      # name -> callable returning the current value
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def register_gauge(self, name: str, read, help_text: str = None) -> None:
+        """
+        Register a gauge whose value is read from read() at export time.
+        """
+        self._gauges[name] = read
+        if help_text:
+            self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage: str, name: str = "claim_stage_seconds"):
+        """
+        Time the block and record it in the stage latency histogram, whether
+        or not it raised.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, stage=stage)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def summary(self) -> dict:
+        """
+        JSON-friendly snapshot: counters as values, histograms as count/sum/percentiles.
+        """
+        with self._lock:
+            counters = {
+                name: {_format_labels(key) or "total": value for key, value in series.items()}
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: {_format_labels(key) or "all": histogram.summary() for key, histogram in series.items()}
+                for name, series in self._histograms.items()
+            }
+        gauges = {name: read() for name, read in self._gauges.items()}
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def render_prometheus(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+
+        for name, read in sorted(self._gauges.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("claim_stage_seconds", "Latency of each claim processing stage")
+metrics.describe("claims_processed_total", "Claims processed, by outcome")
+metrics.describe("fast_path_total", "Claims tried on the rule-based extractor, by outcome (hit/fallback)")
+metrics.register_gauge(
+    "fast_path_hit_rate",
+    lambda: round(metrics.counter_value("fast_path_total", outcome="hit")
+                  / max(1, metrics.counter_value("fast_path_total", outcome="hit")
+                        + metrics.counter_value("fast_path_total", outcome="fallback")), 4),
+    "Fraction of claims extracted without calling the model",
+)
+metrics.describe("policy_exact_match_total", "Claims whose policy number matched an indexed policy ID (hit/miss)")
+metrics.describe("incremental_total", "Claims checked against their stored fingerprint (processed/skipped)")
+metrics.describe("batch_inference_records_total", "Batch-inference records imported, by phase and outcome (ok/error/missing)")
+metrics.describe("ingest_claims_total", "Claims handled by the ingestion service (processed/dead_lettered)")
+metrics.describe("ingest_latency_seconds", "Seconds from a claim being detected to its result being written")
+metrics.describe("document_text_cache_total", "Parsed claim documents served from the text cache (hit) or parsed (miss), by format")
+metrics.describe("results_index_seconds", "Local results index query/search latency")
+metrics.describe("model_route_total", "Model calls per routing stage and model, by outcome or routing reason")
+metrics.describe("model_route_seconds", "Model latency per routing stage and model")
+metrics.describe("model_route_cost_usd_total", "Estimated USD cost per routing stage and model")
+metrics.describe("bedrock_invocations_total", "Bedrock model invocations")
+metrics.describe("bedrock_throttles_total", "Bedrock calls rejected with a throttling error")
+metrics.describe("bedrock_retries_total", "Bedrock calls retried after throttling or transient errors")
+metrics.describe("bedrock_input_tokens_total", "Bedrock input tokens reported by the service (not counting prompt-cache reads/writes)")
+metrics.describe("bedrock_output_tokens_total", "Bedrock output tokens reported by the service")
+metrics.describe("bedrock_cache_read_input_tokens_total", "Bedrock input tokens read from the prompt cache")
+metrics.describe("bedrock_cache_write_input_tokens_total", "Bedrock input tokens written to the prompt cache")
@@ -1,78 +1,422 @@
 # Bedrock model integration
 
 import json
-import boto3
-import botocore
+import threading
+import time
+from contextlib import contextmanager
+
+import botocore.exceptions
+
+from .clients import clients
+from .config import BEDROCK_MAX_RETRIES, PROMPT_CACHE_ENABLED, PROMPT_CACHE_MODEL_PATTERNS
+from .limiter import backoff_delay, get_limiter
+from .metrics import metrics
+from .prompts import Prompt
+
+# Error codes that mean "slow down" (retried, and shrink the concurrency cap)
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+# Error codes worth retrying without treating them as congestion
+TRANSIENT_ERROR_CODES = {"ServiceUnavailableException", "InternalServerException", "ModelNotReadyException",
+                         "ModelTimeoutException"}
+
+
+class BedrockInvocationError(Exception):
+    """
+    A Bedrock call failed. error_code is the service error code when there is one.
+    """
+
+    def __init__(self, message: str, model_id: str = None, error_code: str = None, retryable: bool = False):
+        super().__init__(message)
+        self.model_id = model_id
+        self.error_code = error_code
+        self.retryable = retryable
+
+
+class BedrockThrottlingError(BedrockInvocationError):
+    """
+    Bedrock rejected the call for quota reasons and retries were exhausted.
+    Callers can back off and reschedule the work.
+    """
+
+    def __init__(self, message: str, model_id: str = None, error_code: str = "ThrottlingException"):
+        super().__init__(message, model_id=model_id, error_code=error_code, retryable=True)
+
+
+def _is_messages_model(model_id: str) -> bool:
+    model = model_id.lower()
+    # claude-3*, and the claude-<family>-4* naming used from the Claude 4 models on
+    return "claude-3" in model or "claude-4" in model or any(
+        f"claude-{family}-4" in model for family in ("sonnet", "opus", "haiku"))
+
+
+_usage_scope = threading.local()
+
+
+@contextmanager
+def track_usage():
+    """
+    Collect the token counts of every Bedrock call this thread makes inside
+    the block: {"calls", "input_tokens", "output_tokens", "cache_read_input_tokens",
+    "cache_write_input_tokens"}. input_tokens counts only the input that was
+    neither read from nor written to the prompt cache. Response-cache hits add nothing.
+    """
+    usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0,
+             "cache_write_input_tokens": 0}
+    previous = getattr(_usage_scope, "usage", None)
+    _usage_scope.usage = usage
+    try:
+        yield usage
+    finally:
+        _usage_scope.usage = previous
+
+
+def record_token_usage(model_id: str, input_tokens, output_tokens, cache_read_tokens=None,
+                       cache_write_tokens=None) -> None:
+    metrics.inc("bedrock_invocations_total", model=model_id)
+    if input_tokens is not None:
+        metrics.inc("bedrock_input_tokens_total", int(input_tokens), model=model_id)
+    if output_tokens is not None:
+        metrics.inc("bedrock_output_tokens_total", int(output_tokens), model=model_id)
+    if cache_read_tokens:
+        metrics.inc("bedrock_cache_read_input_tokens_total", int(cache_read_tokens), model=model_id)
+    if cache_write_tokens:
+        metrics.inc("bedrock_cache_write_input_tokens_total", int(cache_write_tokens), model=model_id)
+    usage = getattr(_usage_scope, "usage", None)
+    if usage is not None:
+        usage["calls"] += 1
+        usage["input_tokens"] += int(input_tokens or 0)
+        usage["output_tokens"] += int(output_tokens or 0)
+        usage["cache_read_input_tokens"] += int(cache_read_tokens or 0)
+        usage["cache_write_input_tokens"] += int(cache_write_tokens or 0)
+
+
+def _usage_from_response(response: dict, response_body: dict):
+    """
+    (input, output, cache read, cache write) token counts for an invoke_model
+    call: Bedrock's response headers when present, otherwise the usage block
+    of the model's own response body.
+    """
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    input_tokens = headers.get("x-amzn-bedrock-input-token-count")
+    output_tokens = headers.get("x-amzn-bedrock-output-token-count")
+    cache_read = headers.get("x-amzn-bedrock-cache-read-input-token-count")
+    cache_write = headers.get("x-amzn-bedrock-cache-write-input-token-count")
+    usage = response_body.get("usage") or {}
+    if input_tokens is None and output_tokens is None:
+        input_tokens = usage.get("input_tokens", response_body.get("inputTextTokenCount"))
+        output_tokens = usage.get("output_tokens")
+    if cache_read is None and cache_write is None:
+        cache_read = usage.get("cache_read_input_tokens")
+        cache_write = usage.get("cache_creation_input_tokens")
+    return input_tokens, output_tokens, cache_read, cache_write
+
+
+def _billed_tokens(*counts) -> int:
+    return sum(int(count or 0) for count in counts)
+
 
 class BedrockModelInvoker:
     """
     Wrapper class for invoking AWS Bedrock models
     """
     
-    def __init__(self, model_id: str):
+    def __init__(self, model_id: str, cache=None, client=None, prompt_cache: bool = PROMPT_CACHE_ENABLED,
+                 prompt_cache_models=PROMPT_CACHE_MODEL_PATTERNS):
         self.model_id = model_id
-        self.client = boto3.client("bedrock-runtime")
-    
-    def invoke(self, prompt: str, model_id: str = None, temperature: float = 0.0, max_tokens: int = 800) -> str:
+        self._client = client  # None uses the shared bedrock-runtime client
+        self.cache = cache  # Optional ResponseCache shared between invokers
+        self.prompt_cache = prompt_cache  # Send Bedrock prompt-cache checkpoints
+        self.prompt_cache_models = prompt_cache_models
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else clients.get("bedrock-runtime")
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def uses_prompt_cache(self, model_id: str) -> bool:
         """
-        Invoke the Bedrock model with the given prompt
+        Whether calls to model_id carry prompt-cache checkpoints.
         """
-        if model_id is None:
-            model_id = self.model_id
-            
-        # Prepare the request body based on the model
-        if "claude-3" in model_id.lower() or "claude-4" in model_id.lower():
+        model = model_id.lower()
+        return (self.prompt_cache and _is_messages_model(model_id)
+                and any(pattern in model for pattern in self.prompt_cache_models))
+
+    @staticmethod
+    def _content_blocks(blocks, cache_checkpoints: bool) -> list:
+        content = []
+        for block in blocks:
+            item = {"type": "text", "text": block.text}
+            if cache_checkpoints and block.cache:
+                item["cache_control"] = {"type": "ephemeral"}
+            content.append(item)
+        return content
+
+    @staticmethod
+    def build_body(prompt, model_id: str, temperature: float, max_tokens: int, tool: dict = None,
+                   cache_checkpoints: bool = False) -> str:
+        """
+        Prepare the request body based on the model.
+        With a tool ({name, description, input_schema}) Messages API models are
+        forced to answer by calling it, so the output is schema-shaped JSON;
+        other models ignore it and rely on the prompt.
+
+        prompt is a string or a Prompt. Messages API models get a Prompt's
+        instructions as the system prompt and its other blocks as separate
+        content blocks; with cache_checkpoints, blocks marked cache end a
+        prompt-cache prefix (tools, system and the blocks before them).
+        Other models get the flat text.
+        """
+        if _is_messages_model(model_id):
             # Use Messages API for Claude 3+ models
-            body = json.dumps({
+            body = {
                 "anthropic_version": "bedrock-2023-05-31",
                 "max_tokens": max_tokens,
                 "temperature": temperature,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            })
+            }
+            if isinstance(prompt, Prompt):
+                body["system"] = BedrockModelInvoker._content_blocks([prompt.system], cache_checkpoints)
+                content = BedrockModelInvoker._content_blocks(prompt.blocks, cache_checkpoints)
+            else:
+                content = prompt
+            body["messages"] = [
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ]
+            if tool is not None:
+                body["tools"] = [tool]
+                body["tool_choice"] = {"type": "tool", "name": tool["name"]}
+            return json.dumps(body)
         elif "claude" in model_id.lower():
             # Use legacy completion API for older Claude models
-            body = json.dumps({
-                "prompt": f"\n\nHuman: {prompt}\n\nAssistant:",
+            return json.dumps({
+                "prompt": f"\n\nHuman: {str(prompt)}\n\nAssistant:",
                 "temperature": temperature,
                 "max_tokens_to_sample": max_tokens,
             })
         else:
             # Default format for other models
-            body = json.dumps({
-                "inputText": prompt,
+            return json.dumps({
+                "inputText": str(prompt),
                 "textGenerationConfig": {
                     "temperature": temperature,
                     "maxTokenCount": max_tokens,
                 }
             })
-        
-        try:
+
+    @staticmethod
+    def parse_body(response_body: dict, model_id: str) -> str:
+        """
+        Extract the text based on the model response format.
+        A tool call is returned as its input, serialised as JSON.
+        """
+        if _is_messages_model(model_id):
+            # Extract from Messages API response
+            content = response_body.get("content") or [{}]
+            for block in content:
+                if block.get("type") == "tool_use":
+                    return json.dumps(block.get("input", {}))
+            return "".join(block.get("text", "") for block in content)
+        elif "claude" in model_id.lower():
+            # Extract from legacy completion API response
+            return response_body.get("completion", "")
+        else:
+            # Default format for other models
+            return response_body.get("results", [{}])[0].get("outputText", "")
+
+    @staticmethod
+    def parse_stream_chunk(chunk: dict, model_id: str) -> str:
+        """
+        Extract the text delta from one response-stream chunk ("" if it carries none)
+        """
+        if _is_messages_model(model_id):
+            # Messages API streams typed events; only content deltas carry text
+            if chunk.get("type") == "content_block_delta":
+                return chunk.get("delta", {}).get("text", "")
+            return ""
+        elif "claude" in model_id.lower():
+            return chunk.get("completion", "")
+        else:
+            return chunk.get("outputText", "")
+    
+    @staticmethod
+    def _to_invocation_error(error, model_id: str) -> "BedrockInvocationError":
+        """
+        Map a botocore ClientError onto the typed exceptions callers schedule around.
+        """
+        error_code = error.response.get("Error", {}).get("Code", "Unknown")
+        error_message = error.response.get("Error", {}).get("Message", str(error))
+        message = f"Error invoking model {model_id}: {error_code} - {error_message}"
+        if error_code in THROTTLING_ERROR_CODES:
+            return BedrockThrottlingError(message, model_id=model_id, error_code=error_code)
+        return BedrockInvocationError(message, model_id=model_id, error_code=error_code,
+                                      retryable=error_code in TRANSIENT_ERROR_CODES)
+
+    def _estimate_tokens(self, prompt, max_tokens: int) -> int:
+        # Reserve the worst case up front; the limiter refunds what wasn't used
+        return len(str(prompt)) // 4 + max_tokens
+
+    def _with_retries(self, model_id: str, estimated_tokens: int, call):
+        """
+        Run call(slot) inside the model's rate limiter, retrying throttling and
+        transient errors with jittered exponential backoff.
+        """
+        limiter = get_limiter(model_id)
+        for attempt in range(BEDROCK_MAX_RETRIES + 1):
+            with limiter.slot(estimated_tokens) as slot:
+                try:
+                    return call(slot)
+                except botocore.exceptions.ClientError as e:
+                    error = self._to_invocation_error(e, model_id)
+                    slot.throttled = isinstance(error, BedrockThrottlingError)
+                    if slot.throttled:
+                        metrics.inc("bedrock_throttles_total", model=model_id)
+                    if not error.retryable or attempt == BEDROCK_MAX_RETRIES:
+                        raise error from e
+                except botocore.exceptions.BotoCoreError as e:
+                    # Connection-level failures; botocore has already retried these
+                    raise BedrockInvocationError(f"Error invoking model {model_id}: {e}", model_id=model_id) from e
+            metrics.inc("bedrock_retries_total", model=model_id)
+            delay = backoff_delay(attempt)
+            print(f"[LLM] {error.error_code} from {model_id}, retrying in {delay:.2f}s "
+                  f"(attempt {attempt + 1}/{BEDROCK_MAX_RETRIES})")
+            time.sleep(delay)
+
+    def invoke(self, prompt, model_id: str = None, temperature: float = 0.0, max_tokens: int = 800,
+               use_cache: bool = None, tool: dict = None) -> str:
+        """
+        Invoke the Bedrock model with the given prompt.
+        When a cache is configured, deterministic (temperature 0) calls are
+        served from it by default; pass use_cache to override per call.
+        tool forces structured output (see build_body); the tool input comes
+        back as a JSON string. A Prompt is sent with prompt-cache checkpoints
+        when the model supports them (see uses_prompt_cache).
+
+        Calls go through the process-wide limiter for the model. Throttling and
+        transient errors are retried; when retries run out, or on any other
+        failure, a BedrockInvocationError (BedrockThrottlingError for quota
+        errors) is raised instead of returning text.
+        """
+        if model_id is None:
+            model_id = self.model_id
+        if use_cache is None:
+            use_cache = temperature == 0.0
+        use_cache = use_cache and self.cache is not None
+
+        cache_key = None
+        if use_cache:
+            cache_key = self.cache.make_key(model_id, str(prompt), temperature, max_tokens, tool=tool)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        body = self.build_body(prompt, model_id, temperature, max_tokens, tool=tool,
+                               cache_checkpoints=self.uses_prompt_cache(model_id))
+
+        def call(slot):
             response = self.client.invoke_model(
                 modelId=model_id,
                 body=body
             )
-            
-            response_body = json.loads(response.get("body").read())
-            
-            # Extract the text based on the model response format
-            if "claude-3" in model_id.lower() or "claude-4" in model_id.lower():
-                # Extract from Messages API response
-                return response_body.get("content", [{}])[0].get("text", "")
-            elif "claude" in model_id.lower():
-                # Extract from legacy completion API response
-                return response_body.get("completion", "")
-            else:
-                # Default format for other models
-                return response_body.get("results", [{}])[0].get("outputText", "")
-                
+            try:
+                response_body = json.loads(response.get("body").read())
+            except ValueError as e:
+                raise BedrockInvocationError(f"Unreadable response from model {model_id}: {e}",
+                                             model_id=model_id) from e
+            input_tokens, output_tokens, cache_read, cache_write = _usage_from_response(response, response_body)
+            record_token_usage(model_id, input_tokens, output_tokens, cache_read, cache_write)
+            if input_tokens is not None and output_tokens is not None:
+                slot.actual_tokens = _billed_tokens(input_tokens, output_tokens, cache_read, cache_write)
+            return self.parse_body(response_body, model_id)
+
+        text = self._with_retries(model_id, self._estimate_tokens(prompt, max_tokens), call)
+
+        # Only successful responses reach this point, so errors are never cached
+        if cache_key is not None:
+            self.cache.put(cache_key, text)
+        return text
+
+    def invoke_stream(self, prompt, model_id: str = None, temperature: float = 0.0, max_tokens: int = 800):
+        """
+        Invoke the model with the response-stream API and yield text deltas as
+        they arrive. Opening the stream is rate limited and retried like invoke();
+        an error after text has been yielded is raised without retrying.
+        """
+        if model_id is None:
+            model_id = self.model_id
+
+        body = self.build_body(prompt, model_id, temperature, max_tokens,
+                               cache_checkpoints=self.uses_prompt_cache(model_id))
+        limiter = get_limiter(model_id)
+        estimated_tokens = self._estimate_tokens(prompt, max_tokens)
+
+        for attempt in range(BEDROCK_MAX_RETRIES + 1):
+            with limiter.slot(estimated_tokens) as slot:
+                try:
+                    response = self.client.invoke_model_with_response_stream(
+                        modelId=model_id,
+                        body=body
+                    )
+                except botocore.exceptions.ClientError as e:
+                    error = self._to_invocation_error(e, model_id)
+                    slot.throttled = isinstance(error, BedrockThrottlingError)
+                    if slot.throttled:
+                        metrics.inc("bedrock_throttles_total", model=model_id)
+                    if not error.retryable or attempt == BEDROCK_MAX_RETRIES:
+                        raise error from e
+                else:
+                    # The concurrency slot stays held until the stream is drained
+                    yield from self._iter_stream(response, model_id, slot)
+                    return
+            metrics.inc("bedrock_retries_total", model=model_id)
+            time.sleep(backoff_delay(attempt))
+
+    def _iter_stream(self, response, model_id: str, slot):
+        input_tokens = output_tokens = cache_read = cache_write = None
+        try:
+            for event in response.get("body"):
+                chunk = event.get("chunk")
+                if not chunk:
+                    # Bedrock delivers mid-stream failures as exception events
+                    for name, detail in event.items():
+                        if name.endswith("Exception"):
+                            error_code = name[0].upper() + name[1:]
+                            message = f"Error invoking model {model_id}: {error_code} - {detail.get('message', '')}"
+                            if error_code in THROTTLING_ERROR_CODES:
+                                slot.throttled = True
+                                raise BedrockThrottlingError(message, model_id=model_id, error_code=error_code)
+                            raise BedrockInvocationError(message, model_id=model_id, error_code=error_code)
+                    continue
+                payload = json.loads(chunk["bytes"])
+
+                # Token counts arrive in the Messages API start/delta events and,
+                # on the final chunk, in Bedrock's own invocation metrics
+                invocation_metrics = payload.get("amazon-bedrock-invocationMetrics")
+                if invocation_metrics:
+                    input_tokens = invocation_metrics.get("inputTokenCount", input_tokens)
+                    output_tokens = invocation_metrics.get("outputTokenCount", output_tokens)
+                    cache_read = invocation_metrics.get("cacheReadInputTokenCount", cache_read)
+                    cache_write = invocation_metrics.get("cacheWriteInputTokenCount", cache_write)
+                elif payload.get("type") == "message_start":
+                    usage = payload.get("message", {}).get("usage", {})
+                    input_tokens = usage.get("input_tokens", input_tokens)
+                    cache_read = usage.get("cache_read_input_tokens", cache_read)
+                    cache_write = usage.get("cache_creation_input_tokens", cache_write)
+                elif payload.get("type") == "message_delta":
+                    output_tokens = payload.get("usage", {}).get("output_tokens", output_tokens)
+
+                delta = self.parse_stream_chunk(payload, model_id)
+                if delta:
+                    yield delta
         except botocore.exceptions.ClientError as e:
-            error_code = e.response['Error']['Code']
-            error_message = e.response['Error']['Message']
-            return f"Error invoking model {model_id}: {error_code} - {error_message}"
-        except Exception as e:
-            return f"Unexpected error invoking model {model_id}: {str(e)}"
+            error = self._to_invocation_error(e, model_id)
+            slot.throttled = isinstance(error, BedrockThrottlingError)
+            raise error from e
+
+        record_token_usage(model_id, input_tokens, output_tokens, cache_read, cache_write)
+        if input_tokens is not None and output_tokens is not None:
+            slot.actual_tokens = _billed_tokens(input_tokens, output_tokens, cache_read, cache_write)
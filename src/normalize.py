@@ -0,0 +1,58 @@
+# Typed normalisation of claim field values, shared by the fast path and the validator
+
+import re
+from datetime import datetime
+
+_AMOUNT = re.compile(r"^(?:USD|US\$|\$)?\s*(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?\s*(?:USD)?$", re.IGNORECASE)
+_ISO_DATE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$")
+_SLASH_DATE = re.compile(r"^(\d{1,2})[/.](\d{1,2})[/.](\d{4})$")
+_TEXT_DATE_FORMATS = ("%Y-%m-%d", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%d %b %Y", "%Y/%m/%d")
+
+
+def normalize_amount(value):
+    """
+    "$3,450.00" -> 3450.0. Returns None if the text is not a single plain amount.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    match = _AMOUNT.match(value.strip())
+    if not match:
+        return None
+    whole = match.group(1).replace(",", "")
+    return float(f"{whole}.{match.group(2) or '0'}")
+
+
+def normalize_date(value):
+    """
+    Return (ISO date string, ambiguous) for the common date layouts, or (None, False).
+    Slash dates are read as US month/day; they are flagged ambiguous when both
+    readings are valid dates that differ.
+    """
+    if not isinstance(value, str):
+        return None, False
+    text = value.strip()
+    match = _ISO_DATE.match(text)
+    if match:
+        try:
+            return datetime(*(int(g) for g in match.groups())).date().isoformat(), False
+        except ValueError:
+            return None, False
+    match = _SLASH_DATE.match(text)
+    if match:
+        first, second, year = (int(g) for g in match.groups())
+        try:
+            parsed = datetime(year, first, second)
+        except ValueError:
+            try:
+                return datetime(year, second, first).date().isoformat(), False
+            except ValueError:
+                return None, False
+        return parsed.date().isoformat(), first != second and second <= 12
+    for fmt in _TEXT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat(), False
+        except ValueError:
+            continue
+    return None, False
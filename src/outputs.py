@@ -0,0 +1,84 @@
+# Paginated, cached listing of result files under OUTPUTS_PREFIX
+
+import threading
+import time
+
+from .config import (
+    CLAIM_BUCKET,
+    OUTPUTS_PREFIX,
+    OUTPUTS_PAGE_SIZE,
+    OUTPUTS_MAX_PAGE_SIZE,
+    OUTPUTS_LISTING_CACHE_TTL_SECONDS,
+)
+from .clients import LazyClient
+
+s3 = LazyClient("s3")
+
+
+class OutputListingCache:
+    """
+    Short-lived cache of listing pages, keyed by (continuation token, page size).
+    process_claim_document invalidates it whenever it writes a new result.
+    """
+
+    def __init__(self, ttl_seconds: float = OUTPUTS_LISTING_CACHE_TTL_SECONDS, max_pages: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_pages = max_pages
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, token, page_size):
+        with self._lock:
+            entry = self._pages.get((token, page_size))
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def put(self, token, page_size, page) -> None:
+        with self._lock:
+            if len(self._pages) >= self.max_pages:
+                self._pages.clear()
+            self._pages[(token, page_size)] = (time.monotonic() + self.ttl_seconds, page)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._pages.clear()
+
+
+output_listing_cache = OutputListingCache()
+
+
+def list_outputs_page(continuation_token: str = None, page_size: int = OUTPUTS_PAGE_SIZE) -> dict:
+    """
+    Return one page of result files using only the fields list_objects_v2 already
+    provides (no per-object calls). Pass next_token back in to get the next page.
+    """
+    page_size = max(1, min(int(page_size), OUTPUTS_MAX_PAGE_SIZE))
+    cached = output_listing_cache.get(continuation_token, page_size)
+    if cached is not None:
+        return cached
+
+    params = {"Bucket": CLAIM_BUCKET, "Prefix": OUTPUTS_PREFIX, "MaxKeys": page_size}
+    if continuation_token:
+        params["ContinuationToken"] = continuation_token
+    response = s3.list_objects_v2(**params)
+
+    outputs = []
+    for obj in response.get("Contents", []):
+        if obj["Key"].endswith("/"):
+            continue
+        outputs.append({
+            "key": obj["Key"],
+            "filename": obj["Key"].replace(OUTPUTS_PREFIX, "", 1),
+            "size": obj["Size"],
+            "last_modified": obj["LastModified"].isoformat(),
+            "etag": obj.get("ETag", ""),
+        })
+
+    page = {
+        "outputs": outputs,
+        "page_size": page_size,
+        "next_token": response.get("NextContinuationToken") if response.get("IsTruncated") else None,
+    }
+    output_listing_cache.put(continuation_token, page_size, page)
+    return page
@@ -1,53 +1,112 @@
 # Prompt templates for the Bedrock Insurance Claims POC
 
+import string
+from collections import namedtuple
+
+# One rendered piece of a prompt. cache=True asks for a prompt-cache checkpoint
+# after the block: everything up to and including it is a reusable prefix.
+PromptBlock = namedtuple("PromptBlock", ["name", "text", "cache"])
+
+
+class Prompt:
+    """
+    A rendered prompt as blocks ordered from most to least stable: the static
+    instructions (sent as the system prompt), then shared context such as
+    policy text, then the claim itself, so that calls for different claims
+    share as long a prefix as possible.
+
+    str(prompt) is the flat text, used for models without a system prompt,
+    response-cache keys and token estimates.
+    """
+
+    def __init__(self, system: PromptBlock, blocks: list):
+        self.system = system
+        self.blocks = blocks
+
+    def __str__(self) -> str:
+        return "\n\n".join([self.system.text] + [block.text for block in self.blocks])
+
+    def __repr__(self) -> str:
+        return f"Prompt({[self.system.name] + [block.name for block in self.blocks]})"
+
+
+def _compile(text: str) -> list:
+    # [(literal, field or None), ...]; placeholders are plain {field} names
+    parts = []
+    for literal, field, format_spec, conversion in string.Formatter().parse(text):
+        if format_spec or conversion:
+            raise ValueError(f"Template placeholders must be plain {{field}} names: {{{field}}}")
+        parts.append((literal, field))
+    return parts
+
+
 class PromptTemplateManager:
     """
     Manages prompt templates for different tasks in the claims processing pipeline
     """
-    
+
     def __init__(self):
         self.templates = {
-            "extract_info": """
-You are an insurance claims processor. Extract the following information from the claim document:
+            "extract_info": {
+                "system": """You are an insurance claims processor. Extract the following information from the claim document:
 - claimant_name: Full name of the person making the claim
 - policy_number: Insurance policy number
 - incident_date: Date when the incident occurred
 - claim_amount: Amount being claimed
 - incident_description: Detailed description of what happened
 
-Document text:
-{document_text}
-
-Return the information in JSON format with the exact field names specified above.
-            """,
-            
-            "generate_summary": """
-You are an insurance claims processor. Based on the extracted claim information and relevant policy snippets, generate a concise summary of the claim.
+Return the information in JSON format with the exact field names specified above.""",
+                "blocks": [
+                    {"name": "claim", "text": "Document text:\n{document_text}", "cache": False},
+                ],
+            },
 
-Extracted Information:
-{extracted_info}
-
-Policy Information:
-{policy_text}
+            "generate_summary": {
+                "system": """You are an insurance claims processor. Based on the extracted claim information and relevant policy snippets, generate a concise summary of the claim.
 
 Provide a summary that includes:
 1. Brief description of the incident
 2. Coverage assessment based on policy
 3. Next steps for processing
 
-Keep the summary professional and concise.
-            """
+Keep the summary professional and concise.""",
+                "blocks": [
+                    # Every claim under the same policy gets the same sections of it, so this prefix is shared;
+                    # left out when nothing matched the claim's policy number
+                    {"name": "policy_context", "text": "Policy Information:\n{policy_text}", "cache": True,
+                     "optional": True},
+                    {"name": "related_policies", "text": "Related Policy Information:\n{related_policy_text}",
+                     "cache": False, "optional": True},
+                    {"name": "claim", "text": "Extracted Information:\n{extracted_info}", "cache": False},
+                ],
+            },
+        }
+        # Parsed once; rendering only joins strings. The instructions are static and always a checkpoint.
+        self._compiled = {
+            name: (
+                PromptBlock("instructions", template["system"].strip(), True),
+                [(block["name"], _compile(block["text"]), block["cache"], block.get("optional", False))
+                 for block in template["blocks"]],
+            )
+            for name, template in self.templates.items()
         }
-    
-    def get_prompt(self, template_name: str, **kwargs) -> str:
+
+    def get_prompt(self, template_name: str, **kwargs) -> Prompt:
         """
-        Get a formatted prompt template with the provided parameters
+        Render a template with the provided parameters into a Prompt.
+        Optional blocks whose parameters are all empty are left out.
         """
-        if template_name not in self.templates:
+        if template_name not in self._compiled:
             raise ValueError(f"Unknown template: {template_name}")
-        
-        template = self.templates[template_name]
-        try:
-            return template.format(**kwargs)
-        except KeyError as e:
-            raise ValueError(f"Missing required parameter for template '{template_name}': {e}")
+
+        system, blocks = self._compiled[template_name]
+        rendered = []
+        for name, parts, cache, optional in blocks:
+            if optional and not any(kwargs.get(field) for _, field in parts if field is not None):
+                continue
+            try:
+                text = "".join(literal + (str(kwargs[field]) if field is not None else "") for literal, field in parts)
+            except KeyError as e:
+                raise ValueError(f"Missing required parameter for template '{template_name}': {e}")
+            rendered.append(PromptBlock(name, text, cache))
+        return Prompt(system, rendered)
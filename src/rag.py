@@ -1,56 +1,248 @@
-import boto3
-from .config import CLAIM_BUCKET, POLICIES_PREFIX
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-s3 = boto3.client("s3")
+from .config import (
+    CLAIM_BUCKET,
+    POLICIES_PREFIX,
+    POLICY_CACHE_TTL_SECONDS,
+    POLICY_CONTEXT_MAX_CHUNKS,
+    POLICY_CONTEXT_TOKEN_BUDGET,
+    POLICY_FETCH_WORKERS,
+)
+from .clients import LazyClient
+from .chunking import (
+    fit_to_budget,
+    normalize_policy_id,
+    policy_id_from_key,
+    policy_id_from_text,
+    split_sections,
+)
+from .retriever import BM25Index, SearchHit
 
-def load_policy_snippets():
-    objs = s3.list_objects_v2(Bucket=CLAIM_BUCKET, Prefix=POLICIES_PREFIX)
-    snippets = []
-    contents = objs.get("Contents", [])
-    for obj in contents:
-        key = obj["Key"]
+s3 = LazyClient("s3")
+
+FALLBACK_POLICY_SNIPPETS = [
+    "Policy #12345: Coverage for water damage includes burst pipes and accidental leaks.",
+    "Policy #67890: Deductible for water damage claims is $500.",
+    "Policy #11111: Claims must be filed within 30 days of incident discovery.",
+    "Policy #22222: Water damage from maintenance neglect is not covered.",
+    "Policy #33333: Emergency repairs are covered up to $2,000 before approval.",
+]
+
+
+class PolicyCorpusCache:
+    """
+    Process-wide cache of the policy documents stored under POLICIES_PREFIX.
+
+    Parsed text is kept per S3 key together with the object's ETag. A refresh
+    walks the full (paginated) listing, re-fetches only new or changed keys and
+    drops keys that disappeared. Within the TTL no S3 calls are made at all.
+    """
+
+    def __init__(self, bucket: str = CLAIM_BUCKET, prefix: str = POLICIES_PREFIX,
+                 ttl_seconds: float = POLICY_CACHE_TTL_SECONDS):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.version = 0  # Bumped whenever the cached corpus changes
+        self._entries = {}  # key -> (etag, text)
+        self._last_refresh = None
+        self._lock = threading.Lock()
+
+    def _list_objects(self):
+        """
+        Yield every object under the prefix, following continuation tokens.
+        """
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                yield obj
+
+    def _fetch_text(self, key: str):
         try:
-            body = s3.get_object(Bucket=CLAIM_BUCKET, Key=key)["Body"].read()
-            text = body.decode("utf-8", errors="ignore").strip()
-            if text:
-                snippets.append(text)
-        except Exception:
-            continue
+            body = s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except Exception as e:
+            print(f"[RAG] Failed to load s3://{self.bucket}/{key}: {e}")
+            return None
+        return body.decode("utf-8", errors="ignore").strip()
+
+    def is_stale(self) -> bool:
+        if self._last_refresh is None:
+            return True
+        return (time.monotonic() - self._last_refresh) >= self.ttl_seconds
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Bring the cache in line with S3 if the TTL expired (or if forced).
+        """
+        with self._lock:
+            if not force and not self.is_stale():
+                return
+
+            listed = {}
+            for obj in self._list_objects():
+                if obj["Key"].endswith("/"):
+                    continue
+                listed[obj["Key"]] = obj.get("ETag", "")
+
+            changed = [
+                key for key, etag in listed.items()
+                if key not in self._entries or self._entries[key][0] != etag
+            ]
+            removed = [key for key in self._entries if key not in listed]
+
+            if changed:
+                with ThreadPoolExecutor(max_workers=POLICY_FETCH_WORKERS) as pool:
+                    texts = list(pool.map(self._fetch_text, changed))
+                for key, text in zip(changed, texts):
+                    if text is None:
+                        # Leave the key un-cached (or at its old ETag) so the next refresh retries it
+                        continue
+                    self._entries[key] = (listed[key], text)
+
+            for key in removed:
+                del self._entries[key]
+
+            if changed or removed:
+                self.version += 1
+                print(f"[RAG] Policy cache refreshed: {len(changed)} fetched, {len(removed)} removed, "
+                      f"{len(self._entries)} cached")
+
+            self._last_refresh = time.monotonic()
+
+    def invalidate(self) -> None:
+        """
+        Force the next access to re-list the prefix (cached text is kept).
+        """
+        with self._lock:
+            self._last_refresh = None
+
+    def snapshot(self, force_refresh: bool = False):
+        """
+        Return (version, {key: text}) for the non-empty cached policies, in key order.
+        """
+        self.refresh(force=force_refresh)
+        with self._lock:
+            documents = {
+                key: text
+                for key, (etag, text) in sorted(self._entries.items())
+                if text
+            }
+            return self.version, documents
+
+    def get_documents(self, force_refresh: bool = False) -> dict:
+        return self.snapshot(force_refresh=force_refresh)[1]
+
+    def get_etags(self) -> dict:
+        with self._lock:
+            return {key: etag for key, (etag, text) in self._entries.items()}
+
+
+policy_corpus = PolicyCorpusCache()
+
+
+class PolicyIndex:
+    """
+    Policy sections indexed two ways: by policy ID (from the document title
+    and from key names like policy_WD-100_water_damage.txt) for an exact-match
+    first hop, and with BM25 over the section text for everything else.
+    """
+
+    def __init__(self, documents: dict):
+        self.chunks = []
+        self.by_policy_id = {}  # policy ID -> [PolicyChunk] in section order
+
+        for key, text in documents.items():
+            title_id = policy_id_from_text(text)
+            key_id = policy_id_from_key(key)
+            sections = split_sections(text, policy_id=title_id or key_id, key=key)
+            self.chunks.extend(sections)
+            for policy_id in {title_id, key_id} - {None}:
+                self.by_policy_id.setdefault(policy_id, []).extend(sections)
+
+        self.bm25 = BM25Index([chunk.text for chunk in self.chunks])
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def sections_for(self, policy_number) -> list:
+        return list(self.by_policy_id.get(normalize_policy_id(policy_number), []))
+
+    def search(self, query_text: str, top_k: int = 3) -> list:
+        """
+        BM25 over policy sections. Returns SearchHit(key, section text, score), best first.
+        """
+        return [
+            SearchHit(self.chunks[hit.doc_id].key, hit.text, hit.score)
+            for hit in self.bm25.search(query_text, top_k=top_k)
+        ]
+
+    def retrieve(self, policy_number, query_text: str,
+                 token_budget: int = POLICY_CONTEXT_TOKEN_BUDGET,
+                 max_chunks: int = POLICY_CONTEXT_MAX_CHUNKS) -> list:
+        """
+        Return the PolicyChunks to show the summary model: every section of the
+        policy named by policy_number first, then the best BM25 sections from
+        the rest of the corpus, cut to token_budget.
+        """
+        exact = self.sections_for(policy_number)
+        seen = set(id(chunk) for chunk in exact)
+        ranked = [
+            self.chunks[hit.doc_id]
+            for hit in self.bm25.search(query_text, top_k=max_chunks + len(exact))
+            if id(self.chunks[hit.doc_id]) not in seen
+        ]
+        return fit_to_budget(exact + ranked, token_budget, max_chunks=max_chunks)
+
+
+_policy_index_lock = threading.Lock()
+_policy_index = None
+_policy_index_version = None
+_adhoc_index = None  # (snippets, index) for simple_keyword_retriever
+
+
+def load_policy_snippets(force_refresh: bool = False):
+    snippets = list(policy_corpus.get_documents(force_refresh=force_refresh).values())
     if snippets:
         return snippets
-    return [
-        "Policy #12345: Coverage for water damage includes burst pipes and accidental leaks.",
-        "Policy #67890: Deductible for water damage claims is $500.",
-        "Policy #11111: Claims must be filed within 30 days of incident discovery.",
-        "Policy #22222: Water damage from maintenance neglect is not covered.",
-        "Policy #33333: Emergency repairs are covered up to $2,000 before approval.",
-    ]
+    return list(FALLBACK_POLICY_SNIPPETS)
+
+
+def get_policy_index(force_refresh: bool = False) -> PolicyIndex:
+    """
+    Return the policy index for the current policy corpus.
+    The index is rebuilt only when the cached corpus actually changed.
+    """
+    global _policy_index, _policy_index_version
+    version, documents = policy_corpus.snapshot(force_refresh=force_refresh)
+    with _policy_index_lock:
+        if _policy_index is None or _policy_index_version != version:
+            if not documents:
+                documents = {f"fallback/{i}": text for i, text in enumerate(FALLBACK_POLICY_SNIPPETS)}
+            _policy_index = PolicyIndex(documents)
+            _policy_index_version = version
+        return _policy_index
+
+
+def search_policies(query_text: str, top_k: int = 3) -> list:
+    """
+    Rank the cached policy sections against the query.
+    Returns SearchHit(key, section text, score) tuples, best first.
+    """
+    return get_policy_index().search(query_text, top_k=top_k)
+
 
 def simple_keyword_retriever(policy_snippets, query_text, top_k=3):
     """
-    Simple keyword-based retrieval function.
-    Returns the most relevant policy snippets based on keyword matching.
-    """
-    # Simple keyword matching - in a real implementation, this would use
-    # more sophisticated retrieval methods
-    query_lower = query_text.lower()
-    scored_snippets = []
-    
-    for snippet in policy_snippets:
-        score = 0
-        # Simple scoring based on keyword matches
-        if "water" in query_lower and "water" in snippet.lower():
-            score += 2
-        if "damage" in query_lower and "damage" in snippet.lower():
-            score += 2
-        if "leak" in query_lower and "leak" in snippet.lower():
-            score += 2
-        if "pipe" in query_lower and "pipe" in snippet.lower():
-            score += 2
-        
-        if score > 0:
-            scored_snippets.append((score, snippet))
-    
-    # Sort by score (descending) and return top_k
-    scored_snippets.sort(key=lambda x: x[0], reverse=True)
-    return [snippet for score, snippet in scored_snippets[:top_k]]
+    Return the most relevant policy snippets for the query, ranked with BM25.
+    Kept for callers that pass their own snippet list; the index for that list
+    is built once and reused while the same snippets are passed in.
+    """
+    global _adhoc_index
+    snippets = tuple(policy_snippets)
+    with _policy_index_lock:
+        if _adhoc_index is None or _adhoc_index[0] != snippets:
+            _adhoc_index = (snippets, BM25Index(snippets))
+        index = _adhoc_index[1]
+    return [hit.text for hit in index.search(query_text, top_k=top_k)]
@@ -0,0 +1,128 @@
+# Result file formats: compact (minified gzip JSON, policy references) or legacy pretty JSON
+
+import gzip
+import json
+import zlib
+
+from . import rag
+from .chunking import split_sections
+from .config import OUTPUTS_COMPACT, OUTPUTS_GZIP_LEVEL
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def policy_snippet_refs(chunks) -> list:
+    """
+    References to the policy sections a result drew on: {"key", "etag",
+    "section"} for sections of a policy file in the corpus, the text inline
+    for anything else (e.g. local fallback snippets with no S3 key).
+    """
+    etags = rag.policy_corpus.get_etags()
+    refs = []
+    for chunk in chunks:
+        if chunk.key in etags:
+            refs.append({"key": chunk.key, "etag": etags[chunk.key], "section": chunk.section})
+        else:
+            refs.append({"section": chunk.section, "text": chunk.text})
+    return refs
+
+
+def policy_snippets_field(chunks, compact: bool = None) -> dict:
+    """
+    The result's policy field: {"policy_snippet_refs": [...]} in compact
+    mode, {"policy_snippets": [text, ...]} otherwise (compact=None means
+    OUTPUTS_COMPACT).
+    """
+    if compact is None:
+        compact = OUTPUTS_COMPACT
+    if compact:
+        return {"policy_snippet_refs": policy_snippet_refs(chunks)}
+    return {"policy_snippets": [chunk.text for chunk in chunks]}
+
+
+def resolve_policy_snippets(result: dict) -> list:
+    """
+    Snippet texts for a result in either format. A reference whose policy
+    file has changed since (different ETag) or is gone resolves to None
+    rather than to text the summary never saw.
+    """
+    if "policy_snippet_refs" not in result:
+        return list(result.get("policy_snippets") or [])
+    documents = rag.policy_corpus.get_documents()
+    etags = rag.policy_corpus.get_etags()
+    sections = {}
+    snippets = []
+    for ref in result["policy_snippet_refs"]:
+        key = ref.get("key")
+        if key is None:
+            snippets.append(ref.get("text"))
+            continue
+        if etags.get(key) != ref.get("etag") or key not in documents:
+            snippets.append(None)
+            continue
+        if key not in sections:
+            sections[key] = {chunk.section: chunk.text for chunk in split_sections(documents[key], key=key)}
+        snippets.append(sections[key].get(ref.get("section")))
+    return snippets
+
+
+def encode_result(result: dict, compact: bool = None) -> tuple:
+    """
+    (body, extra put_object arguments) for a result file. Compact bodies are
+    minified and gzipped with a fixed mtime, so the same result always
+    produces the same bytes (and ETag).
+    """
+    if compact is None:
+        compact = OUTPUTS_COMPACT
+    if not compact:
+        return json.dumps(result, indent=2).encode("utf-8"), {}
+    body = json.dumps(result, separators=(",", ":")).encode("utf-8")
+    return gzip.compress(body, compresslevel=OUTPUTS_GZIP_LEVEL, mtime=0), {"ContentEncoding": "gzip"}
+
+
+def is_compressed(body: bytes, content_encoding: str = None) -> bool:
+    # Trust the header when present; files copied without metadata are recognised by the gzip magic
+    if content_encoding:
+        return content_encoding.lower() == "gzip"
+    return body[:2] == GZIP_MAGIC
+
+
+def decode_result(body: bytes, content_encoding: str = None) -> dict:
+    """
+    Parse a result file written in either format.
+    """
+    if is_compressed(body, content_encoding):
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def read_result(response) -> dict:
+    """
+    Parse the result from a get_object response.
+    """
+    return decode_result(response["Body"].read(), response.get("ContentEncoding"))
+
+
+def iter_body(body, chunk_size: int):
+    """
+    Yield a streaming S3 body in chunk_size pieces.
+    """
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_decompressed(chunks):
+    """
+    Gunzip a stream of chunks incrementally.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    tail = decompressor.flush()
+    if tail:
+        yield tail
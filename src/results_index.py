@@ -0,0 +1,370 @@
+# Local SQLite index of claim results, queryable without touching S3
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .chunking import normalize_policy_id
+from .clients import LazyClient
+from .config import (
+    CLAIM_BUCKET,
+    OUTPUTS_PREFIX,
+    RESULTS_INDEX_BACKFILL_WORKERS,
+    RESULTS_INDEX_DB_PATH,
+    RESULTS_INDEX_MAX_LIMIT,
+)
+from .metrics import metrics
+from .normalize import normalize_amount, normalize_date
+from .result_files import read_result
+
+s3 = LazyClient("s3")
+
+COLUMNS = [
+    "output_key", "claim_key", "etag", "claimant_name", "policy_number", "policy_id", "incident_date",
+    "claim_amount", "incident_description", "summary", "extract_model_id", "summary_model_id", "processed_at",
+]
+
+# Rows committed per transaction during a backfill
+BACKFILL_BATCH_SIZE = 500
+
+# PRAGMA user_version of the current layout
+SCHEMA_VERSION = 1
+
+_FTS_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def to_row(output_key: str, result: dict, etag: str = None, processed_at: float = None) -> dict:
+    """
+    Flatten a result JSON into an index row, with typed amount/date columns.
+    """
+    info = result.get("extracted_info") or {}
+    incident_date = info.get("incident_date")
+    if incident_date is not None:
+        incident_date = normalize_date(str(incident_date))[0]
+    return {
+        "output_key": output_key,
+        "claim_key": result.get("claim_key"),
+        "etag": etag,
+        "claimant_name": info.get("claimant_name"),
+        "policy_number": info.get("policy_number"),
+        "policy_id": normalize_policy_id(info.get("policy_number")),
+        "incident_date": incident_date,
+        "claim_amount": normalize_amount(info.get("claim_amount")),
+        "incident_description": info.get("incident_description"),
+        "summary": result.get("summary"),
+        "extract_model_id": result.get("extract_model_id"),
+        "summary_model_id": result.get("summary_model_id"),
+        "processed_at": processed_at if processed_at is not None else time.time(),
+    }
+
+
+def fts_query(text: str) -> str:
+    """
+    Turn free text into an FTS5 query that matches every word (as a prefix),
+    so user input can't produce FTS syntax errors.
+    """
+    return " ".join(f'"{token}"*' for token in _FTS_TOKEN.findall(text))
+
+
+class ResultsIndex:
+    """
+    SQLite table of every result's extracted fields plus an FTS5 index over
+    the summary and incident description.
+
+    write_result() keeps it current as results are written; backfill()
+    rebuilds it from the result files in S3. Queries never touch S3.
+    One connection shared under a lock, like the response cache.
+    """
+
+    def __init__(self, db_path: str = RESULTS_INDEX_DB_PATH):
+        self.db_path = db_path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # Opened lazily so importing the package never touches the filesystem
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            if self.db_path != ":memory:":
+                db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " output_key TEXT PRIMARY KEY,"
+                " claim_key TEXT,"
+                " etag TEXT,"
+                " claimant_name TEXT,"
+                " policy_number TEXT,"
+                " policy_id TEXT,"
+                " incident_date TEXT,"
+                " claim_amount REAL,"
+                " incident_description TEXT,"
+                " summary TEXT,"
+                " extract_model_id TEXT,"
+                " summary_model_id TEXT,"
+                " processed_at REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS results_policy ON results (policy_id, incident_date)")
+            db.execute("CREATE INDEX IF NOT EXISTS results_date ON results (incident_date)")
+            db.execute("CREATE INDEX IF NOT EXISTS results_amount ON results (claim_amount)")
+            db.execute("CREATE INDEX IF NOT EXISTS results_processed ON results (processed_at)")
+            # External-content FTS table over the results rows, kept in step by _upsert/delete
+            db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5("
+                       "summary, incident_description, content='results', content_rowid='rowid')")
+            db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _upsert(self, db, row: dict) -> None:
+        old = db.execute("SELECT rowid, summary, incident_description FROM results WHERE output_key = ?",
+                         (row["output_key"],)).fetchone()
+        if old is not None:
+            db.execute("INSERT INTO results_fts (results_fts, rowid, summary, incident_description) "
+                       "VALUES ('delete', ?, ?, ?)", (old["rowid"], old["summary"], old["incident_description"]))
+            db.execute(f"UPDATE results SET {', '.join(f'{c} = ?' for c in COLUMNS[1:])} WHERE rowid = ?",
+                       [row[c] for c in COLUMNS[1:]] + [old["rowid"]])
+            rowid = old["rowid"]
+        else:
+            rowid = db.execute(f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                               [row[c] for c in COLUMNS]).lastrowid
+        db.execute("INSERT INTO results_fts (rowid, summary, incident_description) VALUES (?, ?, ?)",
+                   (rowid, row["summary"], row["incident_description"]))
+
+    def upsert(self, rows) -> int:
+        """
+        Insert or replace rows (see to_row) in one transaction.
+        """
+        rows = list(rows)
+        with self._lock:
+            db = self._connection()
+            with db:
+                for row in rows:
+                    self._upsert(db, row)
+        return len(rows)
+
+    def record(self, output_key: str, result: dict, etag: str = None) -> None:
+        self.upsert([to_row(output_key, result, etag)])
+
+    def delete(self, output_keys) -> int:
+        deleted = 0
+        with self._lock:
+            db = self._connection()
+            with db:
+                for key in output_keys:
+                    old = db.execute("SELECT rowid, summary, incident_description FROM results WHERE output_key = ?",
+                                     (key,)).fetchone()
+                    if old is None:
+                        continue
+                    db.execute("INSERT INTO results_fts (results_fts, rowid, summary, incident_description) "
+                               "VALUES ('delete', ?, ?, ?)", (old["rowid"], old["summary"], old["incident_description"]))
+                    db.execute("DELETE FROM results WHERE rowid = ?", (old["rowid"],))
+                    deleted += 1
+        return deleted
+
+    def clear(self) -> None:
+        with self._lock:
+            db = self._connection()
+            with db:
+                db.execute("DELETE FROM results")
+                db.execute("INSERT INTO results_fts (results_fts) VALUES ('delete-all')")
+
+    def etags(self) -> dict:
+        with self._lock:
+            return {row[0]: row[1] for row in self._connection().execute("SELECT output_key, etag FROM results")}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @staticmethod
+    def _filters(policy=None, claimant=None, min_amount=None, max_amount=None, date_from=None, date_to=None,
+                 processed_after=None, processed_before=None, prefix: str = "") -> tuple:
+        clauses = []
+        params = []
+        if policy:
+            policy_id = normalize_policy_id(policy)
+            if policy_id:
+                clauses.append(f"{prefix}policy_id = ?")
+                params.append(policy_id)
+            else:
+                clauses.append(f"{prefix}policy_number = ?")
+                params.append(policy)
+        if claimant:
+            clauses.append(f"{prefix}claimant_name LIKE ?")
+            params.append(f"%{claimant}%")
+        if min_amount is not None:
+            clauses.append(f"{prefix}claim_amount >= ?")
+            params.append(float(min_amount))
+        if max_amount is not None:
+            clauses.append(f"{prefix}claim_amount <= ?")
+            params.append(float(max_amount))
+        if date_from:
+            clauses.append(f"{prefix}incident_date >= ?")
+            params.append(normalize_date(date_from)[0] or date_from)
+        if date_to:
+            clauses.append(f"{prefix}incident_date <= ?")
+            params.append(normalize_date(date_to)[0] or date_to)
+        if processed_after is not None:
+            clauses.append(f"{prefix}processed_at >= ?")
+            params.append(float(processed_after))
+        if processed_before is not None:
+            clauses.append(f"{prefix}processed_at < ?")
+            params.append(float(processed_before))
+        return clauses, params
+
+    @staticmethod
+    def _limit(limit) -> int:
+        return max(1, min(int(limit), RESULTS_INDEX_MAX_LIMIT))
+
+    def query(self, limit: int = 100, offset: int = 0, **filters) -> dict:
+        """
+        Results matching the field filters (policy, claimant, min_amount,
+        max_amount, date_from, date_to on the incident date, processed_after,
+        processed_before as epoch seconds), newest incident first.
+        """
+        clauses, params = self._filters(**filters)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        limit = self._limit(limit)
+        with metrics.timer("results_query", name="results_index_seconds"), self._lock:
+            db = self._connection()
+            total = db.execute(f"SELECT COUNT(*) FROM results {where}", params).fetchone()[0]
+            rows = db.execute(f"SELECT {', '.join(COLUMNS)} FROM results {where} "
+                              "ORDER BY incident_date DESC, output_key LIMIT ? OFFSET ?",
+                              params + [limit, int(offset)]).fetchall()
+        return {"total": total, "limit": limit, "offset": int(offset), "results": [dict(row) for row in rows]}
+
+    def search(self, text: str, limit: int = 20, **filters) -> dict:
+        """
+        Full-text search over summaries and incident descriptions, best match
+        first, with the same field filters as query(). Each hit carries a
+        highlighted snippet.
+        """
+        match = fts_query(text or "")
+        if not match:
+            return {"total": 0, "limit": self._limit(limit), "results": []}
+        clauses, params = self._filters(prefix="r.", **filters)
+        where = "".join(f" AND {clause}" for clause in clauses)
+        limit = self._limit(limit)
+        columns = ", ".join(f"r.{c}" for c in COLUMNS)
+        with metrics.timer("results_search", name="results_index_seconds"), self._lock:
+            rows = self._connection().execute(
+                f"SELECT {columns}, snippet(results_fts, -1, '[', ']', ' … ', 12) AS snippet, "
+                "bm25(results_fts) AS rank "
+                "FROM results_fts JOIN results r ON r.rowid = results_fts.rowid "
+                f"WHERE results_fts MATCH ?{where} ORDER BY rank LIMIT ?",
+                [match] + params + [limit],
+            ).fetchall()
+        return {"total": len(rows), "limit": limit, "results": [dict(row) for row in rows]}
+
+
+results_index = ResultsIndex()
+
+
+def _load_result(key: str, etag: str, modified: float):
+    try:
+        return to_row(key, read_result(s3.get_object(Bucket=CLAIM_BUCKET, Key=key)), etag, modified)
+    except Exception as e:
+        print(f"[INDEX] Skipping {key}: {e!r}")
+        return None
+
+
+def backfill(index: ResultsIndex = None, prefix: str = OUTPUTS_PREFIX, workers: int = RESULTS_INDEX_BACKFILL_WORKERS,
+             full: bool = False) -> dict:
+    """
+    Bring the index in line with the result files under prefix: fetch new or
+    changed files (by ETag) in parallel and drop rows whose file is gone.
+    full=True clears the index and reloads everything.
+    """
+    index = index or results_index
+    started = time.perf_counter()
+    if full:
+        index.clear()
+    known = index.etags()
+
+    listed = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=CLAIM_BUCKET, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".json"):
+                modified = obj.get("LastModified")
+                listed[obj["Key"]] = (obj.get("ETag"), modified.timestamp() if modified else None)
+    changed = [(key, etag, modified) for key, (etag, modified) in sorted(listed.items()) if known.get(key) != etag]
+
+    indexed = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch = []
+        for row in pool.map(lambda item: _load_result(*item), changed):
+            if row is None:
+                failed += 1
+                continue
+            batch.append(row)
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                indexed += index.upsert(batch)
+                batch = []
+        indexed += index.upsert(batch)
+    removed = index.delete([key for key in known if key not in listed])
+
+    report = {
+        "listed": len(listed),
+        "indexed": indexed,
+        "unchanged": len(listed) - len(changed),
+        "removed": removed,
+        "failed": failed,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+    print(f"[INDEX] {report}")
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain and query the local results index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = commands.add_parser("backfill", help="Index new/changed result files from S3")
+    backfill_parser.add_argument("--full", action="store_true", help="Clear the index and rebuild it from scratch")
+    backfill_parser.add_argument("--workers", type=int, default=RESULTS_INDEX_BACKFILL_WORKERS)
+    backfill_parser.add_argument("--prefix", default=OUTPUTS_PREFIX)
+    query_parser = commands.add_parser("query", help="Filter results by field")
+    search_parser = commands.add_parser("search", help="Full-text search of summaries and descriptions")
+    search_parser.add_argument("text")
+    for sub in (query_parser, search_parser):
+        sub.add_argument("--policy")
+        sub.add_argument("--claimant")
+        sub.add_argument("--min-amount", type=float)
+        sub.add_argument("--max-amount", type=float)
+        sub.add_argument("--date-from")
+        sub.add_argument("--date-to")
+        sub.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill":
+        report = backfill(prefix=args.prefix, workers=args.workers, full=args.full)
+        return 0 if report["failed"] == 0 else 1
+
+    filters = {"policy": args.policy, "claimant": args.claimant, "min_amount": args.min_amount,
+               "max_amount": args.max_amount, "date_from": args.date_from, "date_to": args.date_to}
+    if args.command == "query":
+        response = results_index.query(limit=args.limit, **filters)
+    else:
+        response = results_index.search(args.text, limit=args.limit, **filters)
+    print(json.dumps(response, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
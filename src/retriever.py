@@ -0,0 +1,117 @@
+# BM25 retrieval over the policy corpus
+
+import re
+from collections import Counter, namedtuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the
+this to was were which with will
+""".split())
+
+SearchHit = namedtuple("SearchHit", ["doc_id", "text", "score"])
+
+
+def tokenize(text: str) -> list:
+    """
+    Lowercase and split text into index terms.
+    Hyphenated identifiers such as "wd-100" are kept whole and also split
+    into their parts so both "WD-100" and "100" match.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if "-" in token:
+            tokens.extend(part for part in token.split("-") if part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Inverted index with precomputed Okapi BM25 term weights.
+
+    Every posting list stores the document ids and the final BM25 weight of
+    the term in that document, so a query only touches the posting lists of
+    its own terms: cost grows with the number of matching postings, not with
+    the size of the corpus.
+    """
+
+    def __init__(self, documents, doc_ids=None, k1: float = 1.5, b: float = 0.75):
+        self.documents = list(documents)
+        self.doc_ids = list(doc_ids) if doc_ids is not None else list(range(len(self.documents)))
+        if len(self.doc_ids) != len(self.documents):
+            raise ValueError("doc_ids must have the same length as documents")
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> (doc index array, weight array)
+        self._build()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _build(self):
+        term_docs = {}
+        term_freqs = {}
+        doc_lengths = np.zeros(len(self.documents), dtype=np.float32)
+
+        for index, text in enumerate(self.documents):
+            counts = Counter(tokenize(text))
+            doc_lengths[index] = sum(counts.values())
+            for term, tf in counts.items():
+                term_docs.setdefault(term, []).append(index)
+                term_freqs.setdefault(term, []).append(tf)
+
+        if not len(self.documents):
+            return
+
+        avg_length = float(doc_lengths.mean()) or 1.0
+        # Per-document length normalisation, shared by every term
+        length_norm = self.k1 * (1.0 - self.b + self.b * doc_lengths / avg_length)
+        n_docs = len(self.documents)
+
+        for term, docs in term_docs.items():
+            docs = np.asarray(docs, dtype=np.int32)
+            tf = np.asarray(term_freqs[term], dtype=np.float32)
+            df = len(docs)
+            idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+            weights = idf * tf * (self.k1 + 1.0) / (tf + length_norm[docs])
+            self.postings[term] = (docs, weights.astype(np.float32))
+
+    def search(self, query_text: str, top_k: int = 3) -> list:
+        """
+        Return up to top_k SearchHit tuples with a positive score, best first.
+        """
+        query_counts = Counter(tokenize(query_text))
+        docs_parts = []
+        weight_parts = []
+        for term, count in query_counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs_parts.append(posting[0])
+            weight_parts.append(posting[1] * count)
+
+        if not docs_parts or top_k <= 0:
+            return []
+
+        docs = np.concatenate(docs_parts)
+        weights = np.concatenate(weight_parts)
+        matched, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+
+        if len(matched) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(matched))
+        best = best[np.argsort(-scores[best], kind="stable")]
+
+        return [
+            SearchHit(self.doc_ids[matched[i]], self.documents[matched[i]], float(scores[i]))
+            for i in best
+            if scores[i] > 0
+        ]
@@ -0,0 +1,151 @@
+# Model routing: cheap extraction model first, escalation on weak output, summary model by claim
+
+import threading
+from collections import namedtuple
+
+from .chunking import estimate_tokens
+from .config import (
+    DOC_EXTRACT_MODEL_ID,
+    EXTRACT_ESCALATION_MODEL_IDS,
+    MODEL_PRICES_PER_1K_TOKENS,
+    PROMPT_CACHE_READ_PRICE_FACTOR,
+    PROMPT_CACHE_WRITE_PRICE_FACTOR,
+    SUMMARY_ESCALATION_MIN_AMOUNT,
+    SUMMARY_ESCALATION_MIN_DESCRIPTION_TOKENS,
+    SUMMARY_ESCALATION_MODEL_ID,
+    SUMMARY_MODEL_ID,
+)
+from .metrics import Histogram, metrics
+from .normalize import normalize_amount, normalize_date
+from .validator import REQUIRED_FIELDS
+
+SummaryRoute = namedtuple("SummaryRoute", ["model_id", "reason"])
+
+# Models tried for extraction, cheapest first
+EXTRACT_MODEL_CASCADE = [DOC_EXTRACT_MODEL_ID] + [
+    model_id for model_id in EXTRACT_ESCALATION_MODEL_IDS if model_id != DOC_EXTRACT_MODEL_ID
+]
+
+
+def extraction_problems(extracted_info: dict) -> list:
+    """
+    Reasons an extraction result is not good enough to keep: the validator's
+    raw_model_output fallback, missing required fields, or values that don't
+    parse as their type (claim_amount as an amount, incident_date as a date).
+    An empty list means the result can be used as is.
+    """
+    if "raw_model_output" in extracted_info:
+        return ["unparseable output"]
+    problems = [f"missing {field}" for field in REQUIRED_FIELDS if extracted_info.get(field) in (None, "")]
+    amount = extracted_info.get("claim_amount")
+    if amount not in (None, "") and normalize_amount(amount) is None:
+        problems.append("invalid claim_amount")
+    incident_date = extracted_info.get("incident_date")
+    if incident_date not in (None, "") and normalize_date(str(incident_date))[0] is None:
+        problems.append("invalid incident_date")
+    return problems
+
+
+def choose_summary_model(extracted_info: dict) -> SummaryRoute:
+    """
+    Summary model for the claim: the escalation model for large claims or
+    long incident descriptions, SUMMARY_MODEL_ID otherwise.
+    """
+    amount = normalize_amount(extracted_info.get("claim_amount"))
+    if amount is not None and amount >= SUMMARY_ESCALATION_MIN_AMOUNT:
+        return SummaryRoute(SUMMARY_ESCALATION_MODEL_ID, "amount")
+    description = extracted_info.get("incident_description") or ""
+    if estimate_tokens(str(description)) >= SUMMARY_ESCALATION_MIN_DESCRIPTION_TOKENS:
+        return SummaryRoute(SUMMARY_ESCALATION_MODEL_ID, "complexity")
+    return SummaryRoute(SUMMARY_MODEL_ID, "default")
+
+
+def estimate_cost(model_id: str, input_tokens: int, output_tokens: int, cache_read_tokens: int = 0,
+                  cache_write_tokens: int = 0):
+    """
+    USD cost of the tokens at MODEL_PRICES_PER_1K_TOKENS, or None for unpriced
+    models. Prompt-cache reads and writes are priced off the input price.
+    """
+    prices = MODEL_PRICES_PER_1K_TOKENS.get(model_id)
+    if prices is None:
+        return None
+    input_cost = (input_tokens + cache_read_tokens * PROMPT_CACHE_READ_PRICE_FACTOR
+                  + cache_write_tokens * PROMPT_CACHE_WRITE_PRICE_FACTOR) * prices[0]
+    return (input_cost + output_tokens * prices[1]) / 1000
+
+
+class RouteStats:
+    """
+    Per-route (stage, model) counters for tuning the routing thresholds:
+    calls by outcome, model latency, tokens (input split into uncached,
+    prompt-cache reads and writes) and estimated cost.
+
+    Extraction outcomes are accepted, escalated (output rejected, next model
+    tried) and exhausted (last model's output kept despite problems);
+    summary outcomes are the routing reason.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, model_id: str, outcome: str, seconds: float = None, usage: dict = None) -> None:
+        usage = usage or {}
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        cache_read = usage.get("cache_read_input_tokens", 0)
+        cache_write = usage.get("cache_write_input_tokens", 0)
+        cost = estimate_cost(model_id, input_tokens, output_tokens, cache_read, cache_write)
+        with self._lock:
+            route = self._routes.setdefault((stage, model_id), {
+                "outcomes": {}, "latency": Histogram(), "input_tokens": 0, "output_tokens": 0,
+                "cache_read_input_tokens": 0, "cache_write_input_tokens": 0, "cost_usd": 0.0,
+            })
+            route["outcomes"][outcome] = route["outcomes"].get(outcome, 0) + 1
+            if seconds is not None:
+                route["latency"].observe(seconds)
+            route["input_tokens"] += input_tokens
+            route["output_tokens"] += output_tokens
+            route["cache_read_input_tokens"] += cache_read
+            route["cache_write_input_tokens"] += cache_write
+            route["cost_usd"] += cost or 0.0
+
+        metrics.inc("model_route_total", stage=stage, model=model_id, outcome=outcome)
+        if seconds is not None:
+            metrics.observe("model_route_seconds", seconds, stage=stage, model=model_id)
+        if cost:
+            metrics.inc("model_route_cost_usd_total", cost, stage=stage, model=model_id)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+    def summary(self) -> dict:
+        """
+        {"<stage>/<model>": {calls, outcomes, escalation_rate, latency, tokens, cache share, cost}}
+        """
+        with self._lock:
+            report = {}
+            for (stage, model_id), route in sorted(self._routes.items()):
+                calls = sum(route["outcomes"].values())
+                total_input = (route["input_tokens"] + route["cache_read_input_tokens"]
+                               + route["cache_write_input_tokens"])
+                report[f"{stage}/{model_id}"] = {
+                    "calls": calls,
+                    "outcomes": dict(route["outcomes"]),
+                    "escalation_rate": (round(route["outcomes"].get("escalated", 0) / calls, 4)
+                                        if calls and stage == "extract" else None),
+                    "latency_seconds": route["latency"].summary(),
+                    "input_tokens": route["input_tokens"],
+                    "output_tokens": route["output_tokens"],
+                    "cache_read_input_tokens": route["cache_read_input_tokens"],
+                    "cache_write_input_tokens": route["cache_write_input_tokens"],
+                    "cached_input_share": (round(route["cache_read_input_tokens"] / total_input, 4)
+                                           if total_input else None),
+                    "cost_usd": round(route["cost_usd"], 6),
+                    "cost_usd_per_call": round(route["cost_usd"] / calls, 6) if calls else None,
+                }
+            return report
+
+
+route_stats = RouteStats()
@@ -0,0 +1,305 @@
+# Pre-forking multi-process WSGI server: preloaded state, request threads, graceful shutdown
+
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from .clients import clients
+from .config import (
+    SERVE_ACCESS_LOG,
+    SERVE_BACKLOG,
+    SERVE_GRACEFUL_TIMEOUT_SECONDS,
+    SERVE_HOST,
+    SERVE_IDLE_TIMEOUT_SECONDS,
+    SERVE_PORT,
+    SERVE_REQUEST_TIMEOUT_SECONDS,
+    SERVE_THREADS,
+    SERVE_WORKERS,
+)
+
+# Exit codes a worker uses to tell the master why it stopped
+WORKER_STOPPED = 0
+WORKER_TIMED_OUT = 3
+
+
+def listen(host: str = SERVE_HOST, port: int = SERVE_PORT, backlog: int = SERVE_BACKLOG) -> socket.socket:
+    """
+    The listening socket every worker accepts from. Non-blocking, so a
+    worker that loses the race for a connection goes back to waiting
+    instead of blocking in accept().
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def preload_shared_state() -> None:
+    """
+    Build, once in the master, what every worker would otherwise build on
+    its first request: the AWS clients (botocore service models) and the
+    policy index. Forked workers share the memory copy-on-write. Pooled
+    connections are closed afterwards so no socket is shared across fork.
+    """
+    from .app import load_policy_index
+
+    started = time.perf_counter()
+    for service in ("s3", "bedrock-runtime"):
+        clients.get(service)
+    try:
+        index = load_policy_index()
+        print(f"[SERVE] Preloaded policy index ({len(index)} sections)")
+    except Exception as e:
+        # Not fatal: workers load it on first use, as the dev server does
+        print(f"[WARN] Policy index preload failed: {e!r}")
+    clients.close_connections()
+    print(f"[SERVE] Preloaded shared state in {time.perf_counter() - started:.2f}s")
+
+
+def _request_handler(idle_timeout: float, access_log: bool):
+    class RequestHandler(WSGIRequestHandler):
+        # One request per connection: a kept-alive idle connection would hold a
+        # request thread; put a keep-alive proxy (nginx, ALB) in front instead
+        protocol_version = "HTTP/1.0"
+        timeout = idle_timeout
+
+        def log_request(self, *args, **kwargs):
+            if access_log:
+                super().log_request(*args, **kwargs)
+
+    return RequestHandler
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server on an inherited listening socket, handling requests on a
+    fixed pool of threads. It only accepts a connection while a thread is
+    free, so a busy worker leaves new connections to its siblings.
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, sock: socket.socket, app, threads: int = SERVE_THREADS,
+                 idle_timeout: float = SERVE_IDLE_TIMEOUT_SECONDS, access_log: bool = SERVE_ACCESS_LOG):
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler=_request_handler(idle_timeout, access_log), fd=sock.fileno())
+        self.threads = threads
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        self._slots = threading.Semaphore(threads)
+        self._active = {}  # request thread id -> monotonic start time
+        self._active_lock = threading.Lock()
+
+    def get_request(self):
+        if not self._slots.acquire(timeout=0.5):
+            raise BlockingIOError("no free request thread")
+        try:
+            return super().get_request()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def process_request(self, request, client_address):
+        try:
+            self._pool.submit(self._handle, request, client_address)
+        except RuntimeError:
+            # Pool already shut down
+            self._slots.release()
+            raise
+
+    def _handle(self, request, client_address):
+        ident = threading.get_ident()
+        with self._active_lock:
+            self._active[ident] = time.monotonic()
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._active_lock:
+                self._active.pop(ident, None)
+            self._slots.release()
+
+    def oldest_request_seconds(self) -> float:
+        with self._active_lock:
+            started = min(self._active.values(), default=None)
+        return time.monotonic() - started if started is not None else 0.0
+
+    def in_flight(self) -> int:
+        with self._active_lock:
+            return len(self._active)
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Wait up to timeout for in-flight requests; True if they all finished.
+        """
+        waiter = threading.Thread(target=self._pool.shutdown, kwargs={"wait": True}, daemon=True)
+        waiter.start()
+        waiter.join(timeout)
+        return not waiter.is_alive()
+
+
+class PreforkServer:
+    """
+    Master process that forks `workers` copies of itself after the caller
+    has preloaded shared state, and keeps that many running.
+
+    SIGTERM/SIGINT stop the master: each worker stops accepting, gets
+    graceful_timeout to finish in-flight requests (and run on_worker_exit,
+    e.g. to stop job threads), and is killed if it overruns. A worker whose
+    oldest request exceeds request_timeout is restarted the same way.
+    on_worker_reaped(pid, number, exit code) runs in the master for every
+    worker that exits, e.g. to requeue the jobs it was running.
+    """
+
+    def __init__(self, app, sock: socket.socket = None, workers: int = SERVE_WORKERS, threads: int = SERVE_THREADS,
+                 idle_timeout: float = SERVE_IDLE_TIMEOUT_SECONDS,
+                 request_timeout: float = SERVE_REQUEST_TIMEOUT_SECONDS,
+                 graceful_timeout: float = SERVE_GRACEFUL_TIMEOUT_SECONDS,
+                 access_log: bool = SERVE_ACCESS_LOG, post_fork=None, on_worker_exit=None, on_worker_reaped=None):
+        self.app = app
+        self.sock = sock or listen()
+        self.workers = workers
+        self.threads = threads
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.post_fork = post_fork
+        self.on_worker_exit = on_worker_exit
+        self.on_worker_reaped = on_worker_reaped
+        self._children = {}  # pid -> worker number
+        self._stopping = threading.Event()
+
+    @property
+    def address(self) -> str:
+        host, port = self.sock.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    # --- master -----------------------------------------------------------
+
+    def _stop(self, signum, frame) -> None:
+        self._stopping.set()
+
+    def _spawn(self, number: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = self._worker(number)
+            except BaseException as e:
+                print(f"[SERVE] Worker {number} crashed: {e!r}", file=sys.stderr)
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self._children[pid] = number
+
+    def _reap(self) -> list:
+        exited = []
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._children.clear()
+                break
+            if pid == 0:
+                break
+            number = self._children.pop(pid, None)
+            if number is not None:
+                code = os.waitstatus_to_exitcode(status)
+                exited.append((number, code))
+                if self.on_worker_reaped is not None:
+                    try:
+                        self.on_worker_reaped(pid, number, code)
+                    except Exception as e:
+                        print(f"[SERVE] Cleanup after worker {number} failed: {e!r}", file=sys.stderr)
+        return exited
+
+    def serve(self) -> int:
+        """
+        Run until SIGTERM/SIGINT; returns the process exit code.
+        """
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        # Nothing the master opened may be shared with the children
+        clients.close_connections()
+        sys.stdout.flush()
+        print(f"[SERVE] Listening on {self.address} with {self.workers} workers x {self.threads} threads")
+        for number in range(self.workers):
+            self._spawn(number)
+
+        while not self._stopping.wait(0.2):
+            for number, code in self._reap():
+                if self._stopping.is_set():
+                    break
+                reason = "timed out" if code == WORKER_TIMED_OUT else f"exited with {code}"
+                print(f"[SERVE] Worker {number} {reason}; restarting")
+                self._spawn(number)
+
+        print(f"[SERVE] Shutting down {len(self._children)} workers (grace {self.graceful_timeout}s)")
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self._children):
+            print(f"[SERVE] Killing worker pid {pid} after the grace period")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        while self._children:
+            self._reap()
+            time.sleep(0.05)
+        self.sock.close()
+        print("[SERVE] Stopped")
+        return 0
+
+    # --- worker -----------------------------------------------------------
+
+    def _worker(self, number: int) -> int:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        # Ctrl+C reaches the whole process group; the master turns it into SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        master = os.getppid()
+        if self.post_fork is not None:
+            self.post_fork(number)
+
+        server = PooledWSGIServer(self.sock, self.app, threads=self.threads, idle_timeout=self.idle_timeout,
+                                  access_log=self.access_log)
+        acceptor = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.5},
+                                    name="http-accept", daemon=True)
+        acceptor.start()
+
+        code = WORKER_STOPPED
+        while not stop.wait(1.0):
+            if os.getppid() != master:
+                print(f"[SERVE] Worker {number}: master is gone, stopping")
+                break
+            if self.request_timeout and server.oldest_request_seconds() > self.request_timeout:
+                print(f"[SERVE] Worker {number}: a request has run over {self.request_timeout}s, restarting")
+                code = WORKER_TIMED_OUT
+                break
+
+        started = time.monotonic()
+        server.shutdown()
+        in_flight = server.in_flight()
+        if not server.drain(self.graceful_timeout):
+            print(f"[SERVE] Worker {number}: {server.in_flight()} of {in_flight} requests still running at the deadline")
+        if self.on_worker_exit is not None:
+            self.on_worker_exit(max(0.0, self.graceful_timeout - (time.monotonic() - started)))
+        server.server_close()
+        return code
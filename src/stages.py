@@ -0,0 +1,36 @@
+# Minimal dependency-graph runner for the per-claim pipeline stages
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .config import PIPELINE_STAGE_WORKERS, PIPELINE_WRITE_WORKERS
+
+# Shared by every claim in the process; stages only do I/O or call into Bedrock,
+# and never submit further work here, so waiting on them cannot deadlock the pool
+stage_executor = ThreadPoolExecutor(max_workers=PIPELINE_STAGE_WORKERS, thread_name_prefix="pipeline-stage")
+write_executor = ThreadPoolExecutor(max_workers=PIPELINE_WRITE_WORKERS, thread_name_prefix="pipeline-write")
+
+
+def run_stage_graph(stages: dict, executor: ThreadPoolExecutor = stage_executor) -> dict:
+    """
+    Run {name: (dependency names, fn)} as soon as each stage's dependencies are
+    done, passing their results to fn positionally. Independent stages run
+    concurrently. Returns {name: result}; the first stage error is re-raised.
+    """
+    results = {}
+    remaining = dict(stages)
+    running = {}
+
+    while remaining or running:
+        ready = [name for name, (deps, fn) in remaining.items() if all(dep in results for dep in deps)]
+        for name in ready:
+            deps, fn = remaining.pop(name)
+            running[executor.submit(fn, *[results[dep] for dep in deps])] = name
+        if not running:
+            raise ValueError(f"Unsatisfiable stage dependencies: {sorted(remaining)}")
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            results[name] = future.result()
+
+    return results
@@ -0,0 +1,359 @@
+# Streaming uploads to S3: single files, presigned browser POSTs and bulk archives
+
+import io
+import mimetypes
+import os
+import queue
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from .clients import LazyClient
+from .config import (
+    ARCHIVE_MAX_MEMBER_BYTES,
+    ARCHIVE_MAX_MEMBERS,
+    ARCHIVE_MAX_TOTAL_BYTES,
+    ARCHIVE_MEMBER_EXTENSIONS,
+    ARCHIVE_UPLOAD_WORKERS,
+    CLAIM_BUCKET,
+    CLAIMS_PREFIX,
+    PRESIGNED_POST_EXPIRES_SECONDS,
+    PRESIGNED_POST_MAX_BYTES,
+    S3_MULTIPART_CHUNK_SIZE,
+    S3_MULTIPART_THRESHOLD,
+    S3_UPLOAD_CONCURRENCY,
+    UPLOAD_PIPE_MAX_CHUNKS,
+    UPLOAD_PIPE_TIMEOUT_SECONDS,
+)
+
+s3 = LazyClient("s3")
+
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+class ArchiveError(ValueError):
+    """
+    Raised for archives that can't be read or that exceed the configured limits.
+    """
+
+
+class UploadAborted(IOError):
+    """
+    Raised to the reader of an UploadPipe whose data stopped before the end.
+    """
+
+
+def safe_filename(name: str) -> str:
+    """
+    Reduce a client-supplied name to a safe basename ("" if nothing is left).
+    """
+    base = os.path.basename(name.replace("\\", "/"))
+    return _UNSAFE_CHARS.sub("_", base).strip("._")
+
+
+def safe_member_path(name: str) -> str:
+    """
+    Sanitise every component of an archive member path, dropping "..", "." and
+    empty parts so members can't escape the target prefix.
+    """
+    parts = [safe_filename(part) for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    return "/".join(part for part in parts if part)
+
+
+def content_type_for(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def is_archive(filename: str) -> bool:
+    lower = filename.lower()
+    return lower.endswith(".zip") or lower.endswith(TAR_EXTENSIONS)
+
+
+@lru_cache(maxsize=None)
+def _transfer_config():
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+        max_concurrency=S3_UPLOAD_CONCURRENCY,
+    )
+
+
+def stream_to_s3(fileobj, key: str, content_type: str = None, bucket: str = CLAIM_BUCKET) -> str:
+    """
+    Upload a readable stream to S3 without staging it on local disk.
+    boto3's managed transfer reads the stream part by part and switches to a
+    multipart upload above S3_MULTIPART_THRESHOLD.
+    """
+    s3.upload_fileobj(
+        fileobj,
+        bucket,
+        key,
+        ExtraArgs={"ContentType": content_type or content_type_for(key)},
+        Config=_transfer_config(),
+    )
+    print(f"[UPLOAD] stream -> s3://{bucket}/{key}")
+    return key
+
+
+class _PipeReader:
+    # The read end of an UploadPipe, handed to its consumer
+    def __init__(self, chunks: queue.Queue, timeout: float):
+        self._chunks = chunks
+        self._timeout = timeout
+        self._buffer = bytearray()
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            try:
+                chunk = self._chunks.get(timeout=self._timeout)
+            except queue.Empty:
+                raise UploadAborted(f"No upload data for {self._timeout}s")
+            if chunk is None:
+                self._eof = True
+            elif isinstance(chunk, Exception):
+                raise chunk
+            else:
+                self._buffer += chunk
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class UploadPipe:
+    """
+    Write end of a streamed upload. consume(reader) starts on its own thread
+    straight away and reads the data while it is being written, so a file in a
+    multipart request body goes on to S3 as the body is parsed instead of being
+    spooled to disk first (see the web app's request class).
+
+    Werkzeug seeks a file back to the start once it is complete, which ends
+    the data here; close() before that aborts the consumer's read. result()
+    waits for consume and returns its value or raises its exception.
+    """
+
+    def __init__(self, consume, max_chunks: int = UPLOAD_PIPE_MAX_CHUNKS,
+                 timeout: float = UPLOAD_PIPE_TIMEOUT_SECONDS):
+        self._chunks = queue.Queue(max_chunks)
+        self._finished = False
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._consume, args=(consume, _PipeReader(self._chunks, timeout)),
+                                        name="upload-pipe", daemon=True)
+        self._thread.start()
+
+    def _consume(self, consume, reader) -> None:
+        try:
+            self._result = consume(reader)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def _put(self, item) -> None:
+        # Blocks while the consumer is behind; once it has returned (failed, or
+        # stopped reading early like a tar reader at the end marker) data is dropped
+        while not self._done.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data) -> int:
+        if self._finished:
+            raise ValueError("Write to a finished upload pipe")
+        self._put(bytes(data))
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Upload pipes can only be rewound once the data is complete")
+        self.finish()
+        return 0
+
+    def finish(self) -> None:
+        """Mark the end of the data (idempotent)."""
+        if not self._finished:
+            self._finished = True
+            self._put(None)
+
+    def close(self) -> None:
+        """Abort the consumer's read unless the data is complete."""
+        if not self._finished:
+            self._finished = True
+            self._put(UploadAborted("Upload ended before the file was complete"))
+
+    def result(self, timeout: float = None):
+        self.finish()
+        self._thread.join(timeout)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def presigned_post(filename: str, content_type: str = None, prefix: str = CLAIMS_PREFIX,
+                   bucket: str = CLAIM_BUCKET, expires_in: int = PRESIGNED_POST_EXPIRES_SECONDS,
+                   max_bytes: int = PRESIGNED_POST_MAX_BYTES) -> dict:
+    """
+    Presigned POST so a browser can upload one claim straight to S3.
+    Returns {url, fields, key, bucket, expires_in}; the form must send every
+    field plus the file as the last field.
+    """
+    name = safe_filename(filename)
+    if not name:
+        raise ValueError("Invalid filename")
+    key = f"{prefix}{name}"
+    content_type = content_type or content_type_for(name)
+    post = s3.generate_presigned_post(
+        Bucket=bucket,
+        Key=key,
+        Fields={"Content-Type": content_type},
+        Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_bytes]],
+        ExpiresIn=expires_in,
+    )
+    return {"url": post["url"], "fields": post["fields"], "key": key, "bucket": bucket, "expires_in": expires_in}
+
+
+def _skip_reason(name: str, path: str):
+    # Judge hidden files on the raw name; sanitising strips the leading dot
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    if any(part.startswith(".") or part == "__MACOSX" for part in parts):
+        return "hidden file"
+    if not path:
+        return "invalid name"
+    if not path.lower().endswith(ARCHIVE_MEMBER_EXTENSIONS):
+        return "unsupported type"
+    return None
+
+
+def _read_member(fileobj, name: str) -> bytes:
+    data = fileobj.read(ARCHIVE_MAX_MEMBER_BYTES + 1)
+    if len(data) > ARCHIVE_MAX_MEMBER_BYTES:
+        raise ArchiveError(f"{name} is larger than {ARCHIVE_MAX_MEMBER_BYTES} bytes")
+    return data
+
+
+def iter_archive_members(fileobj, filename: str):
+    """
+    Yield (member path, data or None, skip reason or None) for every file in a
+    zip or tar archive, in archive order, enforcing the member count and size limits.
+
+    Tar archives are read as a stream. Zip needs random access, so a
+    non-seekable zip stream is spooled first.
+    """
+    lower = filename.lower()
+    members = 0
+    total = 0
+
+    def admit(name, path, size):
+        nonlocal members, total
+        members += 1
+        total += size
+        if members > ARCHIVE_MAX_MEMBERS:
+            raise ArchiveError(f"Archive has more than {ARCHIVE_MAX_MEMBERS} members")
+        if total > ARCHIVE_MAX_TOTAL_BYTES:
+            raise ArchiveError(f"Archive expands to more than {ARCHIVE_MAX_TOTAL_BYTES} bytes")
+        return _skip_reason(name, path)
+
+    if lower.endswith(".zip"):
+        if not (hasattr(fileobj, "seekable") and fileobj.seekable()):
+            spooled = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_MAX_MEMBER_BYTES)
+            shutil.copyfileobj(fileobj, spooled)
+            spooled.seek(0)
+            fileobj = spooled
+        try:
+            archive = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise ArchiveError(f"Not a valid zip archive: {e}")
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                path = safe_member_path(info.filename)
+                reason = admit(info.filename, path, info.file_size)
+                if reason:
+                    yield path or info.filename, None, reason
+                    continue
+                with archive.open(info) as member:
+                    yield path, _read_member(member, info.filename), None
+
+    elif lower.endswith(TAR_EXTENSIONS):
+        try:
+            archive = tarfile.open(fileobj=fileobj, mode="r|*")
+        except tarfile.TarError as e:
+            raise ArchiveError(f"Not a valid tar archive: {e}")
+        with archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                path = safe_member_path(info.name)
+                reason = admit(info.name, path, info.size)
+                if reason:
+                    yield path or info.name, None, reason
+                    continue
+                yield path, _read_member(archive.extractfile(info), info.name), None
+
+    else:
+        raise ArchiveError("Unsupported archive type; expected .zip or a tar archive")
+
+
+def upload_archive(fileobj, filename: str, prefix: str = CLAIMS_PREFIX, bucket: str = CLAIM_BUCKET,
+                   workers: int = ARCHIVE_UPLOAD_WORKERS, on_uploaded=None) -> dict:
+    """
+    Upload every supported member of a zip/tar archive to prefix + member path,
+    in parallel while the archive is still being read. on_uploaded(key) is
+    called from the upload threads as each member lands, e.g. to enqueue it.
+
+    Returns {"uploaded": [keys], "skipped": [{name, reason}], "failed": [{name, error}]}.
+    """
+    uploaded = []
+    skipped = []
+    failed = []
+    lock = threading.Lock()
+    # Bound the members held in memory while waiting for an upload slot
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def upload(path, data):
+        key = f"{prefix}{path}"
+        try:
+            s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type_for(path))
+            with lock:
+                uploaded.append(key)
+            if on_uploaded is not None:
+                on_uploaded(key)
+        except Exception as e:
+            with lock:
+                failed.append({"name": path, "error": str(e)})
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, data, reason in iter_archive_members(fileobj, filename):
+            if reason:
+                skipped.append({"name": path, "reason": reason})
+                continue
+            slots.acquire()
+            pool.submit(upload, path, data)
+
+    uploaded.sort()
+    print(f"[UPLOAD] {filename}: {len(uploaded)} uploaded, {len(skipped)} skipped, {len(failed)} failed")
+    return {"uploaded": uploaded, "skipped": skipped, "failed": failed}
@@ -1,6 +1,9 @@
 # src/validators.py
 
 import json
+import re
+
+from .normalize import normalize_amount, normalize_date
 
 REQUIRED_FIELDS = [
     "claimant_name",
@@ -10,45 +13,198 @@ REQUIRED_FIELDS = [
     "incident_description",
 ]
 
+# JSON schema for the extraction record, used as the tool input schema in structured-output mode
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "claimant_name": {"type": ["string", "null"], "description": "Full name of the person making the claim"},
+        "policy_number": {"type": ["string", "null"], "description": "Insurance policy number"},
+        "incident_date": {"type": ["string", "null"], "description": "Date of the incident, as YYYY-MM-DD"},
+        "claim_amount": {"type": ["number", "null"], "description": "Amount being claimed, as a plain number"},
+        "incident_description": {"type": ["string", "null"], "description": "What happened"},
+    },
+    "required": REQUIRED_FIELDS,
+}
+
+# Tool the extraction model is forced to call in structured-output mode
+EXTRACTION_TOOL = {
+    "name": "record_claim",
+    "description": "Record the fields extracted from an insurance claim document.",
+    "input_schema": EXTRACTION_SCHEMA,
+}
+
+# Values models use for "not present"
+_EMPTY_VALUES = {"", "null", "none", "n/a", "na", "unknown", "not provided", "not specified"}
+
+# Lenient repairs, applied only after strict parsing failed
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PYTHON_LITERALS = re.compile(r"([:\[,]\s*)(True|False|None)(?=\s*[,}\]]|\s*$)")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+# The only characters the scanners need to look at; everything else is skipped by the regex engine
+_OBJECT_SYNTAX = re.compile(r'["{}\\]')
+_NESTING_SYNTAX = re.compile(r'["{}\[\]\\]')
+
+
+def _unusable(raw_text) -> dict:
+    # Model didn't return a usable JSON object; keep the raw output for debugging
+    data = {field: None for field in REQUIRED_FIELDS}
+    data["raw_model_output"] = raw_text
+    return data
+
+
+def iter_json_objects(text: str):
+    """
+    Yield the text of every top-level {...} object in text, in order, with a
+    single pass over the structural characters that tracks string literals
+    and escapes, so braces inside strings and prose around the objects don't
+    confuse it. An object still open at the end (output cut off at
+    max_tokens) is yielded as is.
+    """
+    depth = 0
+    start = None
+    in_string = False
+    pos = 0
+    while True:
+        match = _OBJECT_SYNTAX.search(text, pos)
+        if match is None:
+            break
+        char = match.group()
+        i = match.start()
+        pos = i + 1
+        if in_string:
+            if char == "\\":
+                pos += 1  # skip the escaped character
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            if depth:
+                in_string = True
+        elif char == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+    if depth:
+        yield text[start:]
+
 
-def validate_extracted_info(raw_text: str) -> dict:
+def repair_json(candidate: str) -> str:
     """
-    Try to parse the model output as JSON and ensure the required fields exist.
-    If parsing fails, return a wrapper structure so we don't crash.
+    Best-effort fixes for near-JSON model output: smart quotes, Python
+    literals, trailing commas, and strings/objects left open by truncation.
     """
+    text = candidate.translate(_SMART_QUOTES)
+    text = _PYTHON_LITERALS.sub(lambda m: m.group(1) + {"True": "true", "False": "false", "None": "null"}[m.group(2)],
+                                text)
+    text = _TRAILING_COMMA.sub(r"\1", text)
+
+    # Close whatever truncation left open
+    closers = []
+    in_string = False
+    pos = 0
+    while True:
+        match = _NESTING_SYNTAX.search(text, pos)
+        if match is None:
+            break
+        char = match.group()
+        pos = match.end()
+        if in_string:
+            if char == "\\":
+                pos += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]" and closers:
+            closers.pop()
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(closers))
+
+
+def _loads(text: str):
     try:
-        # Extract JSON from the raw text if it contains extra text
-        import re
-        json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-            data = json.loads(json_str)
-        else:
-            data = json.loads(raw_text)
-    except json.JSONDecodeError:
-        # Model didn't return valid JSON; keep the raw output for debugging
-        return {
-            "claimant_name": None,
-            "policy_number": None,
-            "incident_date": None,
-            "claim_amount": None,
-            "incident_description": None,
-            "raw_model_output": raw_text,
-        }
-
-    # Ensure required keys exist; if not, default to None
-    if isinstance(data, dict):
-        for field in REQUIRED_FIELDS:
-            data.setdefault(field, None)
-    else:
-        # Unexpected format → wrap
-        data = {
-            "claimant_name": None,
-            "policy_number": None,
-            "incident_date": None,
-            "claim_amount": None,
-            "incident_description": None,
-            "raw_model_output": raw_text,
-        }
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
 
+
+def _loads_object(candidate: str):
+    data = _loads(candidate)
+    if data is None:
+        data = _loads(repair_json(candidate))
+    return data
+
+
+def parse_json_object(raw_text: str):
+    """
+    The extraction record in raw_text, or None. The whole text is tried as
+    JSON first; otherwise every embedded object is parsed (repairing it if
+    needed) and the one carrying the most extraction fields wins, the first
+    on ties, so an example object or a second partial object doesn't replace
+    the real answer.
+    """
+    data = _loads(raw_text.strip())
+    if data is not None:
+        return data
+    best = None
+    best_score = 0
+    for candidate in iter_json_objects(raw_text):
+        data = _loads_object(candidate)
+        if data is None:
+            continue
+        score = sum(1 for field in REQUIRED_FIELDS if data.get(field) not in (None, ""))
+        if best is None or score > best_score:
+            best, best_score = data, score
+    return best
+
+
+def _clean(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if value.lower() in _EMPTY_VALUES:
+            return None
+    return value
+
+
+def normalize_extracted_info(data: dict) -> dict:
+    """
+    Fill in missing fields and normalise the typed ones the way the fast path
+    does: claim_amount as a float, incident_date as YYYY-MM-DD (slash dates
+    read as US month/day). Values that don't parse are kept as they are so
+    the router can see them.
+    """
+    data = {key: _clean(value) for key, value in data.items()}
+    for field in REQUIRED_FIELDS:
+        data.setdefault(field, None)
+    amount = normalize_amount(data["claim_amount"])
+    if amount is not None:
+        data["claim_amount"] = amount
+    if isinstance(data["incident_date"], str):
+        iso_date = normalize_date(data["incident_date"])[0]
+        if iso_date is not None:
+            data["incident_date"] = iso_date
     return data
+
+
+def validate_extracted_info(raw_text) -> dict:
+    """
+    Parse the model output (text, or the tool input dict in structured-output
+    mode) into the extraction record, with every required field present and
+    dates and amounts normalised. If no JSON object can be recovered, return
+    a wrapper structure with the raw output so we don't crash.
+    """
+    data = raw_text if isinstance(raw_text, dict) else parse_json_object(raw_text or "")
+    if data is None:
+        return _unusable(raw_text)
+    return normalize_extracted_info(data)
@@ -0,0 +1,83 @@
+# Content-addressed Bedrock response cache
+
+import io
+import json
+
+import pytest
+
+from src.cache import ResponseCache
+from src.models import BedrockModelInvoker
+
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+
+
+class StubBedrock:
+    """Answers every invoke_model with the next reply; "error" raises instead."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def invoke_model(self, modelId, body):
+        self.calls += 1
+        reply = self.replies.pop(0)
+        if reply == "error":
+            raise RuntimeError("model failed")
+        payload = {"content": [{"type": "text", "text": reply}], "usage": {"input_tokens": 10, "output_tokens": 2}}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+
+def test_keys_cover_every_request_parameter():
+    key = ResponseCache.make_key(MODEL_ID, "prompt", 0.0, 800)
+    assert key == ResponseCache.make_key(MODEL_ID, "prompt", 0, 800)
+    assert key != ResponseCache.make_key(MODEL_ID, "prompt", 0.3, 800)
+    assert key != ResponseCache.make_key(MODEL_ID, "prompt", 0.0, 600)
+    assert key != ResponseCache.make_key("other-model", "prompt", 0.0, 800)
+    assert key != ResponseCache.make_key(MODEL_ID, "prompt", 0.0, 800, tool={"name": "record_claim"})
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    db_path = str(tmp_path / "responses.sqlite3")
+    ResponseCache(db_path=db_path).put("k", "answer")
+    reopened = ResponseCache(db_path=db_path)
+    assert reopened.get("k") == "answer"
+    assert reopened.get("k") == "answer"
+    assert (reopened.disk_hits, reopened.memory_hits, reopened.misses) == (1, 1, 0)
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "responses.sqlite3"), max_age_seconds=0)
+    cache.put("k", "answer")
+    assert cache.get("k") is None
+    assert cache.misses == 1
+
+
+def test_size_eviction_drops_least_recently_used(tmp_path):
+    cache = ResponseCache(memory_entries=1, db_path=str(tmp_path / "responses.sqlite3"), max_disk_bytes=10)
+    cache.put("old", "12345")
+    cache.put("new", "67890")
+    cache.put("newest", "abcde")
+    cache.evict()
+    cache._memory.clear()
+    assert cache.get("old") is None
+    assert cache.get("newest") == "abcde"
+
+
+def test_invoker_serves_deterministic_calls_from_the_cache():
+    client = StubBedrock("first", "second")
+    invoker = BedrockModelInvoker(MODEL_ID, cache=ResponseCache(db_path=None), client=client)
+    assert invoker.invoke("prompt") == "first"
+    assert invoker.invoke("prompt") == "first"
+    assert client.calls == 1
+    # Sampled calls bypass the cache unless asked
+    assert invoker.invoke("prompt", temperature=0.3) == "second"
+    assert client.calls == 2
+
+
+def test_failed_calls_are_not_cached():
+    client = StubBedrock("error", "answer")
+    invoker = BedrockModelInvoker(MODEL_ID, cache=ResponseCache(db_path=None), client=client)
+    with pytest.raises(RuntimeError):
+        invoker.invoke("prompt")
+    assert invoker.invoke("prompt") == "answer"
+    assert client.calls == 2
@@ -0,0 +1,49 @@
+# Policy ID parsing and the exact-match first hop of policy retrieval
+
+from src.app import shared_policy_count
+from src.chunking import normalize_policy_id, policy_id_from_key, policy_id_from_text
+from src.rag import PolicyIndex
+
+POLICIES = {
+    "policies/policy_HO-2024-001_home.txt": (
+        "Policy HO-2024-001: Homeowners Coverage\n"
+        "Covers sudden water damage from burst pipes.\n\n"
+        "Deductible: $500."
+    ),
+    "policies/policy_HO-2024-002_home.txt": (
+        "Policy HO-2024-002: Homeowners Coverage\n"
+        "Covers fire and smoke damage.\n\n"
+        "Deductible: $1,000."
+    ),
+}
+
+
+def test_normalize_policy_id_keeps_every_segment():
+    assert normalize_policy_id("wd-100") == "WD-100"
+    assert normalize_policy_id("Policy HO-2024-001") == "HO-2024-001"
+    assert normalize_policy_id("POL-12345-A") == "POL-12345-A"
+    assert normalize_policy_id("HO-2024-001") != normalize_policy_id("HO-2024-002")
+    assert normalize_policy_id("no policy here") is None
+
+
+def test_policy_id_from_key_and_title():
+    assert policy_id_from_key("policies/policy_HO-2024-002_home.txt") == "HO-2024-002"
+    assert policy_id_from_text("Policy HO-2024-001: Homeowners Coverage\nSee also HO-2024-002.") == "HO-2024-001"
+
+
+def test_sections_for_does_not_mix_policies_sharing_a_prefix():
+    index = PolicyIndex(POLICIES)
+    first = index.sections_for("HO-2024-001")
+    second = index.sections_for("ho-2024-002")
+    assert first and second
+    assert {chunk.policy_id for chunk in first} == {"HO-2024-001"}
+    assert {chunk.policy_id for chunk in second} == {"HO-2024-002"}
+    assert index.sections_for("HO-2024") == []
+
+
+def test_retrieve_puts_only_the_claims_own_policy_first():
+    index = PolicyIndex(POLICIES)
+    chunks = index.retrieve("HO-2024-002", "burst pipe water damage", token_budget=1000, max_chunks=10)
+    own = len(index.sections_for("HO-2024-002"))
+    assert [chunk.policy_id for chunk in chunks[:own]] == ["HO-2024-002"] * own
+    assert shared_policy_count({"policy_number": "HO-2024-002"}, chunks) == own
@@ -0,0 +1,58 @@
+# Rule-based extraction of standard intake forms
+
+from src.fastpath import fast_extract
+
+FORM = """Claimant: Jane Smith
+Policy Number: WD-100
+Incident Date: 2025-10-12
+Claim Amount: $3,450.00
+
+Incident Description:
+On October 12, 2025, a burst kitchen pipe caused a sudden water leak.
+At 3:15 pm the water was shut off.
+
+Photos and invoices are included.
+"""
+
+
+def test_description_runs_to_the_end_of_the_form():
+    result = fast_extract(FORM)
+    assert result.confidence == 1.0
+    assert result.fields["incident_description"] == (
+        "On October 12, 2025, a burst kitchen pipe caused a sudden water leak. "
+        "At 3:15 pm the water was shut off. Photos and invoices are included."
+    )
+
+
+def test_description_stops_at_a_trailing_section():
+    text = FORM + "\nAdjuster Notes: inspected on site, approve pending invoices.\nSignature: R. Lee\n"
+    fields = fast_extract(text).fields
+    assert fields["incident_description"].endswith("Photos and invoices are included.")
+    assert "Adjuster" not in fields["incident_description"]
+    assert "Lee" not in fields["incident_description"]
+
+
+def test_description_on_the_header_line_stops_at_the_next_header():
+    text = ("Claimant: Jane Smith\nPolicy Number: HO-2024-001\nIncident Date: 2025-10-12\nClaim Amount: $100\n"
+            "Incident Description: Hail broke two windows.\nAdjuster:\nR. Lee\n")
+    fields = fast_extract(text).fields
+    assert fields["incident_description"] == "Hail broke two windows."
+    assert fields["policy_number"] == "HO-2024-001"
+
+
+def test_labelled_line_inside_the_description_defers_to_the_model():
+    text = FORM.replace("At 3:15 pm the water was shut off.", "Cause: frozen line\nAt 3:15 pm the water was shut off.")
+    result = fast_extract(text)
+    assert "Cause: frozen line" in result.fields["incident_description"]
+    assert result.fields["incident_description"].endswith("Photos and invoices are included.")
+    assert result.ambiguous == ["incident_description"]
+    assert result.confidence < 1.0
+
+
+def test_placeholder_values_are_not_parsed_cleanly():
+    text = FORM.replace("Jane Smith", "Unknown").replace("WD-100", "N/A")
+    result = fast_extract(text)
+    assert result.fields["claimant_name"] is None
+    assert result.fields["policy_number"] is None
+    assert result.missing == ["claimant_name", "policy_number"]
+    assert fast_extract(FORM.replace("WD-100", "NONE")).missing == ["policy_number"]
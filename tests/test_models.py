@@ -0,0 +1,75 @@
+# Retry classification of Bedrock invocation errors
+
+import io
+import json
+
+import botocore.exceptions
+import pytest
+
+from src import models
+from src.config import BEDROCK_MAX_RETRIES
+from src.models import BedrockInvocationError, BedrockModelInvoker, BedrockThrottlingError
+
+
+def _client_error(code: str) -> botocore.exceptions.ClientError:
+    return botocore.exceptions.ClientError({"Error": {"Code": code, "Message": "nope"}}, "InvokeModel")
+
+
+class StubBedrock:
+    """Raises the queued error codes in order, then answers "ok"."""
+
+    def __init__(self, *codes):
+        self.codes = list(codes)
+        self.calls = 0
+
+    def invoke_model(self, modelId, body):
+        self.calls += 1
+        if self.codes:
+            raise _client_error(self.codes.pop(0))
+        payload = {"content": [{"type": "text", "text": "ok"}], "usage": {"input_tokens": 5, "output_tokens": 1}}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(models, "backoff_delay", lambda attempt: 0.0)
+
+
+@pytest.mark.parametrize("code, error_type, retryable", [
+    ("ThrottlingException", BedrockThrottlingError, True),
+    ("TooManyRequestsException", BedrockThrottlingError, True),
+    ("ServiceUnavailableException", BedrockInvocationError, True),
+    ("ModelTimeoutException", BedrockInvocationError, True),
+    ("ValidationException", BedrockInvocationError, False),
+    ("AccessDeniedException", BedrockInvocationError, False),
+])
+def test_error_codes_are_classified(code, error_type, retryable):
+    error = BedrockModelInvoker._to_invocation_error(_client_error(code), "model")
+    assert type(error) is error_type
+    assert error.error_code == code
+    assert error.retryable is retryable
+
+
+def test_transient_errors_are_retried_until_success():
+    client = StubBedrock("ThrottlingException", "ServiceUnavailableException")
+    invoker = BedrockModelInvoker("anthropic.claude-3-haiku-test-retry", client=client)
+    assert invoker.invoke("prompt") == "ok"
+    assert client.calls == 3
+
+
+def test_permanent_errors_are_not_retried():
+    client = StubBedrock("ValidationException")
+    invoker = BedrockModelInvoker("anthropic.claude-3-haiku-test-permanent", client=client)
+    with pytest.raises(BedrockInvocationError) as raised:
+        invoker.invoke("prompt")
+    assert not isinstance(raised.value, BedrockThrottlingError)
+    assert raised.value.error_code == "ValidationException"
+    assert client.calls == 1
+
+
+def test_exhausted_throttling_raises_a_throttling_error():
+    client = StubBedrock(*["ThrottlingException"] * (BEDROCK_MAX_RETRIES + 1))
+    invoker = BedrockModelInvoker("anthropic.claude-3-haiku-test-throttled", client=client)
+    with pytest.raises(BedrockThrottlingError):
+        invoker.invoke("prompt")
+    assert client.calls == BEDROCK_MAX_RETRIES + 1
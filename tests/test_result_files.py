@@ -0,0 +1,77 @@
+# Compact result files and policy snippet references
+
+import json
+
+import pytest
+
+from src import rag
+from src.chunking import PolicyChunk, split_sections
+from src.result_files import (decode_result, encode_result, iter_decompressed, policy_snippet_refs,
+                              resolve_policy_snippets)
+
+KEY = "policies/policy_WD-100_water.txt"
+POLICY = (
+    "Policy WD-100: Water Damage\n"
+    "Covers sudden water damage from burst pipes.\n\n"
+    "Deductible: $500."
+)
+
+
+class StubCorpus:
+    def __init__(self, documents: dict, etags: dict):
+        self.documents = documents
+        self.etags = etags
+
+    def get_documents(self):
+        return dict(self.documents)
+
+    def get_etags(self):
+        return dict(self.etags)
+
+
+@pytest.fixture
+def corpus(monkeypatch):
+    stub = StubCorpus({KEY: POLICY}, {KEY: '"v1"'})
+    monkeypatch.setattr(rag, "policy_corpus", stub)
+    return stub
+
+
+def _result(corpus_chunks):
+    return {"claim_key": "claims/a.txt", "summary": "ok", "policy_snippet_refs": policy_snippet_refs(corpus_chunks)}
+
+
+def test_refs_point_at_corpus_sections_and_inline_the_rest(corpus):
+    sections = split_sections(POLICY, key=KEY)
+    fallback = PolicyChunk(None, "coverage", None, "Fallback snippet")
+    refs = policy_snippet_refs([sections[0], fallback])
+    assert refs == [{"key": KEY, "etag": '"v1"', "section": sections[0].section},
+                    {"section": "coverage", "text": "Fallback snippet"}]
+
+
+def test_current_refs_resolve_to_the_section_text(corpus):
+    sections = split_sections(POLICY, key=KEY)
+    assert resolve_policy_snippets(_result(sections)) == [chunk.text for chunk in sections]
+
+
+def test_stale_or_missing_refs_resolve_to_none(corpus):
+    result = _result(split_sections(POLICY, key=KEY))
+    corpus.etags[KEY] = '"v2"'
+    assert set(resolve_policy_snippets(result)) == {None}
+    del corpus.documents[KEY]
+    del corpus.etags[KEY]
+    assert set(resolve_policy_snippets(result)) == {None}
+
+
+def test_legacy_results_keep_their_snippets():
+    assert resolve_policy_snippets({"policy_snippets": ["a", "b"]}) == ["a", "b"]
+
+
+def test_compact_encoding_round_trips_deterministically():
+    result = {"claim_key": "claims/a.txt", "summary": "ok", "extracted_info": {"claim_amount": 10.0}}
+    body, extra = encode_result(result, compact=True)
+    assert extra == {"ContentEncoding": "gzip"}
+    assert encode_result(result, compact=True)[0] == body
+    assert decode_result(body) == result
+    assert json.loads(b"".join(iter_decompressed([body[:7], body[7:]]))) == result
+    pretty, extra = encode_result(result, compact=False)
+    assert extra == {} and decode_result(pretty) == result
@@ -0,0 +1,37 @@
+# Policy filters of the local results index
+
+from src.results_index import ResultsIndex, to_row
+
+
+def _result(claim: str, policy_number: str) -> dict:
+    return {
+        "claim_key": f"claims/{claim}.txt",
+        "extracted_info": {
+            "claimant_name": "Jane Doe",
+            "policy_number": policy_number,
+            "incident_date": "2025-03-01",
+            "claim_amount": "$1,200.00",
+            "incident_description": "Burst pipe flooded the kitchen.",
+        },
+        "summary": "Water damage from a burst pipe.",
+    }
+
+
+def _index(tmp_path) -> ResultsIndex:
+    index = ResultsIndex(db_path=str(tmp_path / "results.sqlite3"))
+    index.upsert([
+        to_row("outputs/a_result.json", _result("a", "HO-2024-001")),
+        to_row("outputs/b_result.json", _result("b", "HO-2024-002")),
+        to_row("outputs/c_result.json", _result("c", "ho-2024-001")),
+    ])
+    return index
+
+
+def test_policy_filter_is_exact_for_ids_sharing_a_prefix(tmp_path):
+    index = _index(tmp_path)
+    keys = {row["output_key"] for row in index.query(policy="HO-2024-001")["results"]}
+    assert keys == {"outputs/a_result.json", "outputs/c_result.json"}
+    assert [row["policy_id"] for row in index.query(policy="HO-2024-002")["results"]] == ["HO-2024-002"]
+    assert index.query(policy="HO-2024")["total"] == 0
+    assert index.search("burst", policy="HO-2024-002")["total"] == 1
+
@@ -0,0 +1,88 @@
+# BM25 ranking and the policy-ID first hop of policy retrieval
+
+import math
+
+from src.rag import PolicyIndex
+from src.retriever import BM25Index, tokenize
+
+DOCUMENTS = [
+    "Water damage from burst pipes is covered.",
+    "Fire and smoke damage is covered up to the dwelling limit.",
+    "Flood damage in basements is excluded unless a flood rider applies.",
+    "Emergency repairs to stop further water damage are reimbursed.",
+]
+
+POLICIES = {
+    "policies/policy_WD-100_water.txt": (
+        "Policy WD-100: Water Damage\n"
+        "Covers sudden water damage from burst pipes.\n\n"
+        "Deductible: $500."
+    ),
+    "policies/policy_FL-200_flood.txt": (
+        "Policy FL-200: Flood\n"
+        "Covers flood water entering the basement from outside.\n\n"
+        "Exclusions: gradual seepage."
+    ),
+    "policies/policy_FR-300_fire.txt": (
+        "Policy FR-300: Fire\n"
+        "Covers fire and smoke damage.\n\n"
+        "Deductible: $1,000."
+    ),
+}
+
+
+def _reference_bm25(documents, query, k1=1.5, b=0.75):
+    # Okapi BM25 computed directly from the definition
+    docs = [tokenize(text) for text in documents]
+    avg_length = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in tokenize(query):
+            tf = doc.count(term)
+            df = sum(1 for other in docs if term in other)
+            if not tf:
+                continue
+            idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_length))
+        scores.append(score)
+    return scores
+
+
+def test_tokenize_keeps_hyphenated_ids_whole_and_split():
+    assert tokenize("Policy WD-100 covers the water.") == ["policy", "wd-100", "wd", "100", "covers", "water"]
+
+
+def test_bm25_scores_match_the_formula():
+    index = BM25Index(DOCUMENTS)
+    query = "water damage burst pipes"
+    expected = _reference_bm25(DOCUMENTS, query)
+    hits = index.search(query, top_k=len(DOCUMENTS))
+    assert [hit.doc_id for hit in hits] == sorted(range(len(DOCUMENTS)), key=lambda i: -expected[i])
+    for hit in hits:
+        assert math.isclose(hit.score, expected[hit.doc_id], rel_tol=1e-5)
+
+
+def test_bm25_top_k_and_no_match():
+    index = BM25Index(DOCUMENTS, doc_ids=["a", "b", "c", "d"])
+    hits = index.search("flood rider basement", top_k=1)
+    assert [hit.doc_id for hit in hits] == ["c"]
+    assert index.search("earthquake") == []
+    assert BM25Index([]).search("water") == []
+
+
+def test_retrieve_puts_the_claims_policy_first():
+    index = PolicyIndex(POLICIES)
+    chunks = index.retrieve("fl-200", "burst pipes water damage", token_budget=1000)
+    own = index.sections_for("FL-200")
+    assert own and chunks[:len(own)] == own
+    others = chunks[len(own):]
+    assert others and {chunk.policy_id for chunk in others} <= {"WD-100", "FR-300"}
+    assert others[0].policy_id == "WD-100"
+    assert len({id(chunk) for chunk in chunks}) == len(chunks)
+
+
+def test_retrieve_without_a_known_policy_falls_back_to_bm25():
+    index = PolicyIndex(POLICIES)
+    chunks = index.retrieve("ZZ-999", "fire smoke", token_budget=1000, max_chunks=1)
+    assert [chunk.policy_id for chunk in chunks] == ["FR-300"]
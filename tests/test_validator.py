@@ -0,0 +1,47 @@
+# Recovering the extraction record from free-text model output
+
+from src.validator import iter_json_objects, parse_json_object, repair_json, validate_extracted_info
+
+RECORD = ('{"claimant_name": "Jane Smith", "policy_number": "WD-100", "incident_date": "10/12/2025", '
+          '"claim_amount": "$3,450.00", "incident_description": "Burst pipe {kitchen}"}')
+
+
+def test_brace_scan_skips_braces_inside_strings_and_prose():
+    text = f'Here is the record {{as requested}}:\n{RECORD}\nDone.'
+    assert list(iter_json_objects(text)) == ["{as requested}", RECORD]
+
+
+def test_code_fenced_answer_is_parsed():
+    data = parse_json_object(f"```json\n{RECORD}\n```")
+    assert data["claimant_name"] == "Jane Smith"
+    assert data["incident_description"] == "Burst pipe {kitchen}"
+
+
+def test_the_most_complete_object_wins():
+    example = '{"claimant_name": "Example Name"}'
+    text = f"Format: {example}\nAnswer: {RECORD}\nAlso: {example}"
+    assert parse_json_object(text)["claimant_name"] == "Jane Smith"
+
+
+def test_lenient_repairs():
+    assert parse_json_object('{"claim_amount": 10, "flagged": True, "note": None,}') == {
+        "claim_amount": 10, "flagged": True, "note": None}
+    assert parse_json_object('{“claimant_name”: “Jane”}') == {"claimant_name": "Jane"}
+
+
+def test_truncated_output_is_closed():
+    truncated = '{"claimant_name": "Jane Smith", "policy_number": "WD-100", "incident_description": "Water ever'
+    assert repair_json(truncated).endswith('ever"}')
+    assert parse_json_object("Sure: " + truncated)["incident_description"] == "Water ever"
+    assert parse_json_object('{"claimant_name": "Jane", "policy_number":')["policy_number"] is None
+
+
+def test_validate_normalizes_fields_and_keeps_unusable_output():
+    data = validate_extracted_info(f"Result:\n{RECORD}")
+    assert data["incident_date"] == "2025-10-12"
+    assert data["claim_amount"] == 3450.0
+    assert validate_extracted_info({"claimant_name": "N/A"})["claimant_name"] is None
+
+    unusable = validate_extracted_info("I could not read the document.")
+    assert unusable["raw_model_output"] == "I could not read the document."
+    assert unusable["claimant_name"] is None
@@ -1,28 +1,68 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, Response, request, jsonify, send_file, stream_with_context
+import itertools
 import json
-import boto3
 import os
 from datetime import datetime
 import uuid
+from werkzeug.serving import is_running_from_reloader
 from werkzeug.utils import secure_filename
 
 # Import our existing modules
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from src.config import CLAIM_BUCKET, CLAIMS_PREFIX, OUTPUTS_PREFIX
-from src.app import process_claim_document
+from src.config import (CLAIM_BUCKET, CLAIMS_PREFIX, JOB_SKIP_UNCHANGED, OUTPUTS_PAGE_SIZE, OUTPUTS_STREAM_CHUNK_BYTES,
+                        UPLOAD_MAX_BYTES)
+from src.app import process_claim_document, stream_claim_document
+from src.incremental import process_claim_if_changed
+from src.clients import LazyClient
 from src.models import BedrockModelInvoker
+from src.outputs import list_outputs_page
+from src.result_files import is_compressed, iter_body, iter_decompressed, read_result, resolve_policy_snippets
+from src.results_index import results_index
+from src.metrics import metrics
+from src.routing import route_stats
+from src.jobs import JobWorkerPool, QueueFullError, create_job_queue
+from src.uploads import (ArchiveError, UploadPipe, content_type_for, is_archive, presigned_post, stream_to_s3,
+                         upload_archive)
+
+class StreamingRequest(Request):
+    """
+    Lets a view hand the files of a multipart body to a consumer while the body
+    is parsed: set request.file_consumer = consume(stream, filename, content_type)
+    before reading request.files, then wait for file.stream.result(). Without a
+    consumer, Werkzeug spools files over 500KB to a temporary file on disk.
+    """
+    file_consumer = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._upload_pipes = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.file_consumer is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        consume = self.file_consumer
+        pipe = UploadPipe(lambda stream: consume(stream, filename, content_type))
+        self._upload_pipes.append(pipe)
+        return pipe
+
+    def close(self):
+        # A body that broke off mid-file never completes its pipe; abort the upload
+        for pipe in self._upload_pipes:
+            pipe.close()
+        super().close()
 
 app = Flask(__name__)
-s3_client = boto3.client('s3')
+app.request_class = StreamingRequest
+s3_client = LazyClient('s3')
 
-# Configure upload folder
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Uploads are streamed to S3; nothing is kept on local disk
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Background processing: /process enqueues, workers run the pipeline
+job_queue = create_job_queue()
+job_workers = JobWorkerPool(job_queue, process_claim_if_changed if JOB_SKIP_UNCHANGED else process_claim_document)
+metrics.register_gauge('job_queue_depth', job_queue.depth, 'Jobs waiting for a worker')
 
 @app.route('/')
 def index():
@@ -30,6 +70,11 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    """
+    Multipart form upload. The file is streamed on to S3 while the request body
+    is parsed (multipart upload for large files); nothing touches local disk.
+    """
+    request.file_consumer = _stream_file_to_s3
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
@@ -37,78 +82,193 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
     
-    if file:
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Upload to S3
-        s3_filename = f"{CLAIMS_PREFIX}{filename}"
+    try:
+        file.stream.result()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return _uploaded(secure_filename(file.filename))
+
+@app.route('/upload/<filename>', methods=['PUT'])
+def upload_raw(filename):
+    """
+    Raw request body upload (e.g. curl -T claim.txt), streamed to S3 as it arrives.
+    """
+    filename = secure_filename(filename)
+    if not filename:
+        return jsonify({'error': 'Invalid filename'}), 400
+    return _upload_stream(request.stream, filename, request.mimetype)
+
+def _upload_stream(stream, filename, content_type=None):
+    try:
+        _stream_file_to_s3(stream, filename, content_type)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return _uploaded(filename)
+
+def _stream_file_to_s3(stream, filename, content_type=None):
+    filename = secure_filename(filename or '')
+    if not filename:
+        raise ValueError('Invalid filename')
+    if not content_type or content_type == 'application/octet-stream':
+        content_type = content_type_for(filename)
+    return stream_to_s3(stream, f"{CLAIMS_PREFIX}{filename}", content_type=content_type)
+
+def _uploaded(filename):
+    return jsonify({
+        'message': 'File uploaded successfully',
+        'filename': filename,
+        's3_key': f"{CLAIMS_PREFIX}{filename}",
+        'bucket': CLAIM_BUCKET
+    })
+
+@app.route('/upload/presign', methods=['POST'])
+def presign_upload():
+    """
+    Presigned POST for uploading a claim from the browser directly to S3.
+    Body: {"filename": ..., "content_type": optional}
+    """
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({'error': 'Filename required'}), 400
+    try:
+        return jsonify(presigned_post(filename, data.get('content_type')))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/upload/archive', methods=['POST', 'PUT'])
+def upload_archive_file():
+    """
+    Bulk upload: a zip or tar(.gz) of claims, as a multipart 'file' field or as
+    the raw body with ?filename=claims.tar.gz. Either way the archive is read
+    as it arrives, and members are written under CLAIMS_PREFIX in parallel;
+    with ?enqueue=1 each one is queued for processing as soon as it lands.
+    """
+    enqueue = request.args.get('enqueue', '').lower() in ('1', 'true', 'yes')
+    jobs = []
+    rejected = []
+
+    def enqueue_claim(key):
         try:
-            s3_client.upload_file(
-                filepath,
-                CLAIM_BUCKET,
-                s3_filename,
-                ExtraArgs={'ContentType': 'text/plain'}
-            )
-            
-            return jsonify({
-                'message': 'File uploaded successfully',
-                'filename': filename,
-                's3_key': s3_filename,
-                'bucket': CLAIM_BUCKET
-            })
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+            jobs.append({'job_id': job_queue.put(key), 's3_key': key})
+        except QueueFullError:
+            rejected.append(key)
+
+    def upload(stream, filename, content_type=None):
+        if not filename or not is_archive(filename):
+            raise ArchiveError('A .zip or tar archive is required')
+        return upload_archive(stream, filename, on_uploaded=enqueue_claim if enqueue else None)
+
+    if enqueue:
+        job_workers.start()
+    request.file_consumer = upload
+    try:
+        if 'file' in request.files:
+            report = request.files['file'].stream.result()
+        else:
+            report = upload(request.stream, request.args.get('filename', ''))
+    except ArchiveError as e:
+        return jsonify({'error': str(e)}), 400
+
+    report['bucket'] = CLAIM_BUCKET
+    if enqueue:
+        report['jobs'] = jobs
+        report['queue_rejected'] = rejected
+    return jsonify(report)
 
 @app.route('/process', methods=['POST'])
 def process_document():
+    """
+    Enqueue a claim for background processing and return its job id (202).
+    Poll /jobs/<job_id> for status and the result.
+    """
     data = request.get_json()
     if not data or 'filename' not in data:
         return jsonify({'error': 'Filename required'}), 400
     
     filename = data['filename']
     s3_key = f"{CLAIMS_PREFIX}{filename}"
-    
+
+    # Already running under web/run.py and serve.py; this covers embedding the app (flask run, tests)
+    job_workers.start()
     try:
-        # Process the claim document using our existing logic
-        result = process_claim_document(s3_key)
-        
-        # Add timestamp to result
-        result['processed_at'] = datetime.now().isoformat()
-        result['filename'] = filename
-        
-        return jsonify(result)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        job_id = job_queue.put(s3_key)
+    except QueueFullError as e:
+        response = jsonify({'error': str(e), 'queue_depth': job_queue.depth()})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'filename': filename,
+        'status_url': f"/jobs/{job_id}",
+    }), 202
+
+@app.route('/jobs', methods=['GET'])
+def job_queue_status():
+    return jsonify({
+        'queue_depth': job_queue.depth(),
+        'max_depth': job_queue.max_depth,
+        'workers': job_workers.workers,
+    })
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id'}), 404
+
+    job['filename'] = job['claim_key'].replace(CLAIMS_PREFIX, '', 1)
+    if job['finished_at']:
+        job['processed_at'] = datetime.fromtimestamp(job['finished_at']).isoformat()
+    return jsonify(job)
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/process/stream', methods=['GET'])
+def process_document_stream():
+    """
+    Stream pipeline progress as Server-Sent Events: stage status, extracted
+    fields, retrieved policies, then summary tokens and the final result.
+    GET so that browsers can consume it with EventSource.
+    """
+    filename = request.args.get('filename')
+    if not filename:
+        return jsonify({'error': 'Filename required'}), 400
+
+    s3_key = f"{CLAIMS_PREFIX}{filename}"
+
+    def generate():
+        # Flush a comment immediately so proxies and the browser open the stream
+        yield ": processing\n\n"
+        try:
+            for event, data in stream_claim_document(s3_key):
+                if event == 'result':
+                    data['processed_at'] = datetime.now().isoformat()
+                    data['filename'] = filename
+                yield sse_event(event, data)
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 @app.route('/outputs', methods=['GET'])
 def get_outputs():
+    """
+    One page of result files. Query params: page_size, token (the next_token
+    returned by the previous page).
+    """
     try:
-        # List all objects in the outputs folder
-        response = s3_client.list_objects_v2(
-            Bucket=CLAIM_BUCKET,
-            Prefix=OUTPUTS_PREFIX
-        )
-        
-        outputs = []
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                # Get the object to retrieve metadata
-                obj_response = s3_client.head_object(
-                    Bucket=CLAIM_BUCKET,
-                    Key=obj['Key']
-                )
-                
-                outputs.append({
-                    'key': obj['Key'],
-                    'filename': obj['Key'].replace(OUTPUTS_PREFIX, ''),
-                    'size': obj['Size'],
-                    'last_modified': obj['LastModified'].isoformat(),
-                    'etag': obj.get('ETag', '')
-                })
-        
-        return jsonify(outputs)
+        page_size = request.args.get('page_size', OUTPUTS_PAGE_SIZE, type=int)
+        page = list_outputs_page(request.args.get('token') or None, page_size)
+        return jsonify(page)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -127,18 +287,96 @@ def download_output(key):
 
 @app.route('/outputs/<path:key>')
 def view_output(key):
+    """
+    Stream a result file from S3 without buffering it. Compact (gzip) files
+    are passed through compressed to clients that accept gzip and gunzipped
+    on the fly for the rest; legacy pretty-printed files stream as they are.
+    ?expand_policies=1 returns the parsed result with policy references
+    resolved to their snippet text instead.
+    """
     try:
         # Get the object from S3
         response = s3_client.get_object(
             Bucket=CLAIM_BUCKET,
             Key=key
         )
-        
-        # Return the file content
-        return response['Body'].read().decode('utf-8')
+        if request.args.get('expand_policies', type=int):
+            result = read_result(response)
+            result['policy_snippets'] = resolve_policy_snippets(result)
+            return jsonify(result)
+
+        body = response['Body']
+        first = body.read(OUTPUTS_STREAM_CHUNK_BYTES)
+        chunks = itertools.chain([first], iter_body(body, OUTPUTS_STREAM_CHUNK_BYTES))
+        headers = {'Vary': 'Accept-Encoding'}
+        if not is_compressed(first, response.get('ContentEncoding')):
+            headers['Content-Length'] = str(response['ContentLength'])
+        elif request.accept_encodings.quality('gzip') > 0:
+            headers['Content-Encoding'] = 'gzip'
+            headers['Content-Length'] = str(response['ContentLength'])
+        else:
+            chunks = iter_decompressed(chunks)
+        return Response(chunks, mimetype='application/json', headers=headers)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _result_filters():
+    # Field filters shared by /results and /results/search; amounts must be numbers
+    filters = {name: request.args.get(name) or None
+               for name in ('policy', 'claimant', 'date_from', 'date_to')}
+    for name in ('min_amount', 'max_amount', 'processed_after', 'processed_before'):
+        value = request.args.get(name)
+        filters[name] = float(value) if value not in (None, '') else None
+    return filters
+
+@app.route('/results', methods=['GET'])
+def query_results():
+    """
+    Results from the local index, no S3 calls. Query params: policy, claimant,
+    min_amount, max_amount, date_from, date_to (incident date), processed_after,
+    processed_before (epoch seconds), limit, offset.
+    """
+    try:
+        filters = _result_filters()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {e}'}), 400
+    try:
+        return jsonify(results_index.query(
+            limit=request.args.get('limit', 100, type=int),
+            offset=request.args.get('offset', 0, type=int),
+            **filters,
+        ))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/results/search', methods=['GET'])
+def search_results():
+    """
+    Full-text search of summaries and incident descriptions in the local
+    index. Query params: q, limit, plus the /results filters.
+    """
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'error': 'Missing query parameter q'}), 400
+    try:
+        filters = _result_filters()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid filter: {e}'}), 400
+    try:
+        return jsonify(results_index.search(text, limit=request.args.get('limit', 20, type=int), **filters))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latency histograms, token counters, gauges"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/routes')
+def model_routes():
+    """Per-route (stage/model) calls, escalation rate, latency, tokens and estimated cost"""
+    return jsonify(route_stats.summary())
+
 @app.errorhandler(413)
 def too_large(e):
     return jsonify({'error': 'File too large'}), 413
@@ -148,4 +386,8 @@ def internal_error(e):
     return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
+    # Start the job workers up front so jobs persisted before a restart resume without
+    # new traffic; only in the reloader's serving child, not in its file-watching parent
+    if is_running_from_reloader():
+        job_workers.start()
     app.run(debug=True, host='0.0.0.0', port=8000)
\ No newline at end of file
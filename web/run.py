@@ -38,13 +38,17 @@ def main():
     if not check_requirements():
         install_requirements()
     
-    # Start the Flask application
-    print("✓ Starting Flask server on http://localhost:8000")
+    # Start the Flask application (--production: pre-forked workers, see serve.py;
+    # the other arguments, e.g. --workers/--port, are passed on to it)
+    production = "--production" in sys.argv[1:]
+    server_args = [arg for arg in sys.argv[1:] if arg != "--production"]
+    server = "production server" if production else "Flask server"
+    print(f"✓ Starting {server} on http://localhost:8000")
     print("✓ Press Ctrl+C to stop the server")
     print("=" * 50)
     
     try:
-        subprocess.run([sys.executable, "app.py"])
+        subprocess.run([sys.executable, "serve.py"] + server_args if production else [sys.executable, "app.py"])
     except KeyboardInterrupt:
         print("\n✓ Server stopped by user")
     except Exception as e:
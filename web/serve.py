@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Production server for the web interface: pre-forked worker processes, each
+handling requests on a thread pool, with shared state loaded once before
+the fork. Use web/run.py (Flask's dev server) for development.
+
+    python web/serve.py --workers 4 --threads 8 --port 8000
+
+SIGTERM or Ctrl+C shuts down gracefully: workers stop accepting, finish
+in-flight requests and running jobs, and are killed after the grace period.
+"""
+
+import argparse
+import os
+import sys
+
+WEB_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(WEB_DIR, '..'))
+
+
+def parse_args(argv=None):
+    from src.config import (SERVE_GRACEFUL_TIMEOUT_SECONDS, SERVE_HOST, SERVE_PORT, SERVE_REQUEST_TIMEOUT_SECONDS,
+                            SERVE_THREADS, SERVE_WORKERS)
+
+    parser = argparse.ArgumentParser(description="Serve the web interface with pre-forked workers")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="worker processes")
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS, help="request threads per worker")
+    parser.add_argument("--request-timeout", type=float, default=SERVE_REQUEST_TIMEOUT_SECONDS,
+                        help="restart a worker whose request runs longer than this (0 disables)")
+    parser.add_argument("--graceful-timeout", type=float, default=SERVE_GRACEFUL_TIMEOUT_SECONDS,
+                        help="seconds in-flight work gets to finish on shutdown")
+    parser.add_argument("--access-log", action="store_true", help="log every request")
+    return parser.parse_args(argv)
+
+
+def build_server(web, sock=None, workers=None, threads=None, request_timeout=None, graceful_timeout=None,
+                 access_log=None):
+    """
+    A PreforkServer for the imported web app module: each worker reopens the
+    job queue after fork and starts its job threads straight away, so queued
+    and requeued jobs resume without new traffic, and stops them on the way
+    out. The master requeues the jobs of a worker that exited with them still
+    running (restarted after a request timeout, crashed or killed).
+    """
+    from src.serving import PreforkServer
+
+    def post_fork(number):
+        web.job_queue.after_fork()
+        web.job_workers.start()
+
+    def on_worker_exit(remaining):
+        web.job_workers.stop(timeout=remaining)
+
+    def on_worker_reaped(pid, number, code):
+        web.job_queue.requeue_abandoned(pid)
+
+    kwargs = {"workers": workers, "threads": threads, "request_timeout": request_timeout,
+              "graceful_timeout": graceful_timeout, "access_log": access_log}
+    return PreforkServer(web.app, sock=sock, post_fork=post_fork, on_worker_exit=on_worker_exit,
+                         on_worker_reaped=on_worker_reaped, **{name: value for name, value in kwargs.items() if value is not None})
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from src import config
+
+    # Each worker has its own job threads, so a job queued by one worker must be
+    # visible to the others' /jobs/<id>: share the queue through SQLite. This
+    # has to happen before src.jobs (and so the web app) is imported.
+    if args.workers > 1 and config.JOB_QUEUE_BACKEND == "memory":
+        if "JOB_QUEUE_BACKEND" in os.environ:
+            print("[WARN] JOB_QUEUE_BACKEND=memory with several workers: job status is per worker")
+        else:
+            config.JOB_QUEUE_BACKEND = "sqlite"
+    os.chdir(WEB_DIR)
+
+    import app as web
+    from src.serving import listen, preload_shared_state
+
+    sock = listen(args.host, args.port)
+    preload_shared_state()
+    server = build_server(web, sock=sock, workers=args.workers, threads=args.threads,
+                          request_timeout=args.request_timeout, graceful_timeout=args.graceful_timeout,
+                          access_log=args.access_log)
+    return server.serve()
+
+
+if __name__ == '__main__':
+    sys.exit(main())